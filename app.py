@@ -1,41 +1,144 @@
 # Main Flask app
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+from flask import Flask, Response, g, render_template, request, jsonify, redirect, url_for
+from flask_migrate import Migrate, stamp
 from config import Config
 from models import db  # Import db from models/__init__.py
 from models.transaction import Transaction
 from models.user import User
-from utils.fraud_detection import detect_fraud
-from utils.device_info import get_device_info
-from utils.notifications import send_fraud_alert
-import requests
+from models.transaction_flag import TransactionFlag
+import utils.fraud_detection as fraud_detection
+from utils.flags import flag_name
+from utils.fraud_detection import detect_fraud, detect_fraud_batch, init_model, warm_up
+from utils.device_info import get_device_info, get_resolver as get_device_resolver
+from utils.notifications import dispatcher as notification_dispatcher, send_fraud_alert
+from utils.geoip import geoip_import_command, init_geoip, resolve_location
+from utils.user_profiles import profiles_cli, update_user_profiles
+from ml.registry import model_cli
+from utils.velocity import record_decline, record_transactions, velocity_cli
+from utils.stream import score_stream_command
+from utils.group_commit import writer as transaction_writer
+import utils.metrics as metrics
+from utils.profiling import profiler as request_profiler
+from utils.async_scoring import scorer as async_scorer
 from werkzeug.exceptions import BadRequest
 import traceback
-from datetime import datetime, timezone
-import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
 
 app = Flask(__name__)
 app.config.from_object(Config)
 
 # Initialize database
 db.init_app(app)
-
-# Create tables if they don't exist
-with app.app_context():
+migrate = Migrate(app, db, directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations'),
+                  render_as_batch=True)
+app.cli.add_command(geoip_import_command)
+app.cli.add_command(profiles_cli)
+app.cli.add_command(model_cli)
+app.cli.add_command(velocity_cli)
+app.cli.add_command(score_stream_command)
+notification_dispatcher.init_app(app)
+transaction_writer.init_app(app)
+request_profiler.init_app(app)
+async_scorer.init_app(app)
+init_model(app)
+init_geoip(app)
+
+# Optionally load the ML model before the first scoring request
+if app.config['ML_WARM_UP'] == 'eager':
+    warm_up()
+elif app.config['ML_WARM_UP'] == 'background':
+    warm_up(background=True)
+
+def rule_metrics(field):
+    """Scrape-time view of one of the rule engine's per-rule counters"""
+    def collect():
+        with app.app_context():
+            return {(rule['id'],): rule[field] for rule in fraud_detection.get_rules().stats()}
+    return collect
+
+metrics.registry.counter('fraudguard_rule_evaluations', 'Rule evaluations by rule', ('rule',),
+                         rule_metrics('evaluations'))
+metrics.registry.counter('fraudguard_rule_flags', 'Transactions flagged by each rule', ('rule',),
+                         rule_metrics('hits'))
+metrics.registry.counter('fraudguard_rule_seconds', 'Time spent evaluating each rule', ('rule',),
+                         rule_metrics('total_seconds'))
+def device_cache_metrics():
+    with app.app_context():
+        info = get_device_resolver().cache_info()
+    return {('hit',): info.hits, ('miss',): info.misses}
+
+metrics.registry.counter('fraudguard_device_parse_cache', 'User-Agent parse cache lookups by result', ('result',),
+                         device_cache_metrics)
+metrics.registry.gauge('fraudguard_model_info', 'The model version this worker serves', ('version',),
+                       lambda: {(fraud_detection.model_version or 'none',): 1})
+metrics.registry.gauge('fraudguard_model_available', 'Whether the ML model is loaded',
+                       callback=lambda: {(): int(bool(fraud_detection.ML_MODEL_AVAILABLE))})
+metrics.registry.gauge('fraudguard_notification_queue_depth', 'Alerts waiting for a notification worker',
+                       callback=lambda: {(): notification_dispatcher.queue_depth()})
+metrics.registry.gauge('fraudguard_group_commit_queue_depth', 'Transactions waiting for the group-commit writer',
+                       callback=lambda: {(): transaction_writer.stats()['queue_depth']})
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - started,
+                                        request.endpoint or 'unmatched', str(response.status_code))
+    return response
+
+def init_database():
+    """
+    Create tables for a fresh database; existing databases are upgraded
+    with migrations (flask db upgrade). Not run at import so workers and
+    CLI commands don't pay for it on every start.
+    """
     try:
-        # Only create tables if they don't exist
-        db.create_all()
-        print("Database tables verified/created successfully!")
+        if not db.inspect(db.engine).get_table_names():
+            db.create_all()
+            stamp()  # the new schema is already at the latest migration
+            print("Database tables created successfully!")
     except Exception as e:
         print(f"Error initializing database: {str(e)}")
 
-@app.template_filter('fromjson')
-def fromjson_filter(value):
-    if not value:
-        return []
+@app.cli.command("init-db")
+def init_db_command():
+    """Create the database tables if the database is empty."""
+    init_database()
+
+@app.template_filter('flag_messages')
+def flag_messages_filter(transaction):
+    """A transaction's fraud flags as messages, rendered from their codes and params"""
+    return fraud_detection.render_fraud_flags(transaction.flag_pairs(), transaction.amount, transaction.location)
+
+def get_location(ip=None):
+    """Resolve the transaction location from the client IP using the offline GeoIP table"""
+    return resolve_location(ip or request.remote_addr)
+
+def profile_update(transaction):
+    """The fields of a new transaction its user's profile is updated with"""
+    return {
+        "userid": transaction.userid,
+        "amount": transaction.amount,
+        "location": transaction.location,
+        "timestamp": transaction.timestamp,
+        "device_key": transaction.device_key
+    }
+
+def parse_amount(amount):
+    """Validate a transaction amount and return it as a float"""
     try:
-        return json.loads(value)
-    except json.JSONDecodeError:
-        return []
+        amount = float(amount)
+    except (TypeError, ValueError):
+        raise BadRequest("Invalid amount format")
+    if amount <= 0:
+        raise BadRequest("Amount must be greater than 0")
+    return amount
 
 @app.route("/register", methods=["GET", "POST"])
 def register():
@@ -124,50 +227,60 @@ def index():
                 raise BadRequest("Missing required fields: userid and amount")
 
             # Verify user exists
-            user = User.query.filter_by(userid=userid).first()
+            with metrics.stage('user_lookup'):
+                user = User.query.filter_by(userid=userid).first()
             if not user:
                 raise BadRequest("Invalid user ID")
 
-            try:
-                amount = float(amount)
-                if amount <= 0:
-                    raise BadRequest("Amount must be greater than 0")
-            except (TypeError, ValueError):
-                raise BadRequest("Invalid amount format")
+            amount = parse_amount(amount)
 
-            device_id = get_device_info(request)
-            try:
-                location_response = requests.get("https://ipinfo.io/json", timeout=5)
-                location = location_response.json().get("city", "Unknown")
-            except:
-                location = "Unknown"
+            with metrics.stage('device'):
+                device = get_device_info(request)
+            with metrics.stage('geolocation'):
+                location = get_location()
 
-            is_fraudulent, fraud_flags = detect_fraud(amount, location, userid)
+            # history, rules and ml stages are timed inside detect_fraud
+            is_fraudulent, fraud_flags = detect_fraud(amount, location, userid, device['key'])
 
             transaction = Transaction(
                 userid=userid,
                 amount=amount,
-                device_id=device_id,
+                device_id=device['label'],
+                device_key=device['key'],
                 location=location,
                 is_fraudulent=is_fraudulent,
-                fraud_flags=fraud_flags,
                 timestamp=datetime.now(timezone.utc)  # Explicitly set timestamp
             )
+            transaction.set_flags(fraud_flags)
 
             if is_fraudulent:
                 # Generate approval token and send alerts
-                transaction.generate_approval_token()
-                send_fraud_alert(user, transaction)
+                with metrics.stage('token'):
+                    transaction.generate_approval_token()
+                with metrics.stage('alert'):
+                    send_fraud_alert(user, transaction)
             else:
                 # Auto-approve safe transactions
                 transaction.is_approved = True
                 transaction.approval_timestamp = datetime.now(timezone.utc)
 
             try:
-                db.session.add(transaction)
-                db.session.commit()
+                with metrics.stage('commit'):
+                    if transaction_writer.enabled:
+                        # Committed with other requests' transactions by the writer thread;
+                        # end this request's read transaction so its connection is free meanwhile
+                        db.session.rollback()
+                        transaction_id = transaction_writer.write(transaction)
+                    else:
+                        db.session.add(transaction)
+                        update = profile_update(transaction)
+                        update_user_profiles([update])
+                        db.session.commit()
+                        record_transactions([update])
+                        transaction_id = transaction.id
             except Exception as e:
                 db.session.rollback()
+                metrics.ERRORS.inc('index', 'database')
                 print(f"Database error: {str(e)}")
                 return jsonify({
                     "success": False,
@@ -178,19 +291,22 @@ def index():
                 "success": True,
                 "fraud_detected": is_fraudulent,
                 "is_approved": transaction.is_approved,
-                "fraud_flags": json.loads(fraud_flags) if fraud_flags else None,
-                "transaction_id": transaction.id
+                "fraud_flags": fraud_detection.render_fraud_flags(fraud_flags, amount, location),
+                "transaction_id": transaction_id
             }
             
             # Include approval token for suspicious transactions
             if is_fraudulent:
                 response_data["approval_token"] = transaction.approval_token
 
+            metrics.TRANSACTIONS.inc('flagged' if is_fraudulent else 'approved')
             return jsonify(response_data)
 
         except BadRequest as e:
+            metrics.ERRORS.inc('index', 'bad_request')
             return jsonify({"success": False, "error": str(e)}), 400
         except Exception as e:
+            metrics.ERRORS.inc('index', 'unexpected')
             print(f"Unexpected error: {str(e)}")
             print(traceback.format_exc())
             return jsonify({
@@ -200,17 +316,209 @@ def index():
 
     return render_template("index.html")
 
+@app.route("/score/async", methods=["POST"])
+async def score_async():
+    """
+    Score one transaction like POST /, with the user lookup, history and
+    geolocation (then rules and model) running concurrently in executors.
+    """
+    response_data, status = await async_scorer.score(
+        request.get_json(silent=True), request.headers.get("User-Agent"), request.remote_addr, request.host_url)
+    return jsonify(response_data), status
+
+@app.route("/score/batch", methods=["POST"])
+def score_batch():
+    """
+    Score a micro-batch of transactions in one request.
+    Body: {"transactions": [{"userid": ..., "amount": ..., "location"/"ip": optional}, ...]}
+    Returns one result per item, in order; invalid items get an error entry
+    instead of failing the whole batch.
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not isinstance(data.get("transactions"), list):
+            raise BadRequest("Expected JSON body with a 'transactions' list")
+
+        items = data["transactions"]
+        if not items:
+            raise BadRequest("No transactions to score")
+        if len(items) > app.config["MAX_BATCH_SIZE"]:
+            raise BadRequest(f"Batch exceeds maximum size of {app.config['MAX_BATCH_SIZE']}")
+
+        # Verify all users with one query
+        userids = {item.get("userid") for item in items if isinstance(item, dict) and item.get("userid")}
+        users = {user.userid: user for user in User.query.filter(User.userid.in_(userids)).all()}
+
+        device = get_device_info(request)
+        request_location = None
+
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            try:
+                if not isinstance(item, dict):
+                    raise BadRequest("Transaction must be a JSON object")
+                userid = item.get("userid")
+                if not userid or item.get("amount") is None:
+                    raise BadRequest("Missing required fields: userid and amount")
+                if userid not in users:
+                    raise BadRequest("Invalid user ID")
+                amount = parse_amount(item.get("amount"))
+            except BadRequest as e:
+                results[index] = {"success": False, "error": str(e)}
+                continue
+
+            location = item.get("location")
+            if not location and item.get("ip"):
+                location = get_location(item["ip"])
+            if not location:
+                if request_location is None:
+                    request_location = get_location()
+                location = request_location
+            valid.append((index, {"userid": userid, "amount": amount, "location": location,
+                                  "device_key": device['key']}))
+
+        scores = detect_fraud_batch([scored for _, scored in valid])
+
+        transactions = []
+        for (index, scored), (is_fraudulent, fraud_flags) in zip(valid, scores):
+            transaction = Transaction(
+                userid=scored["userid"],
+                amount=scored["amount"],
+                device_id=device['label'],
+                device_key=device['key'],
+                location=scored["location"],
+                is_fraudulent=is_fraudulent,
+                timestamp=datetime.now(timezone.utc)
+            )
+            transaction.set_flags(fraud_flags)
+
+            if is_fraudulent:
+                transaction.generate_approval_token()
+                send_fraud_alert(users[scored["userid"]], transaction)
+            else:
+                transaction.is_approved = True
+                transaction.approval_timestamp = datetime.now(timezone.utc)
+            transactions.append((index, transaction))
+
+        try:
+            db.session.add_all([transaction for _, transaction in transactions])
+            updates = [profile_update(transaction) for _, transaction in transactions]
+            update_user_profiles(updates)
+
+            # Build results before commit expires the objects
+            for (index, transaction), (is_fraudulent, fraud_flags) in zip(transactions, scores):
+                result = {
+                    "success": True,
+                    "fraud_detected": is_fraudulent,
+                    "is_approved": transaction.is_approved,
+                    "fraud_flags": fraud_detection.render_fraud_flags(
+                        fraud_flags, transaction.amount, transaction.location),
+                    "transaction_id": transaction.id
+                }
+                if is_fraudulent:
+                    result["approval_token"] = transaction.approval_token
+                results[index] = result
+
+            db.session.commit()
+            record_transactions(updates)
+        except Exception as e:
+            db.session.rollback()
+            metrics.ERRORS.inc('score_batch', 'database')
+            print(f"Database error: {str(e)}")
+            return jsonify({
+                "success": False,
+                "error": "Failed to save transactions"
+            }), 500
+
+        for _, transaction in transactions:
+            metrics.TRANSACTIONS.inc('flagged' if transaction.is_fraudulent else 'approved')
+        return jsonify({"success": True, "results": results})
+
+    except BadRequest as e:
+        metrics.ERRORS.inc('score_batch', 'bad_request')
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        metrics.ERRORS.inc('score_batch', 'unexpected')
+        print(f"Unexpected error: {str(e)}")
+        print(traceback.format_exc())
+        return jsonify({
+            "success": False,
+            "error": "An unexpected error occurred"
+        }), 500
+
+ADMIN_STATUSES = ['pending', 'approved', 'declined', 'fraudulent']
+
+def parse_cursor(value):
+    """Parse a '<iso timestamp>,<id>' page cursor"""
+    if not value:
+        return None
+    try:
+        timestamp, transaction_id = value.rsplit(',', 1)
+        return datetime.fromisoformat(timestamp), int(transaction_id)
+    except ValueError:
+        raise BadRequest("Invalid page cursor")
+
+def format_cursor(transaction):
+    return f"{transaction.timestamp.isoformat()},{transaction.id}"
+
+def parse_date(value):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise BadRequest("Dates must be YYYY-MM-DD")
+
 @app.route("/admin")
 def admin():
-    transactions = Transaction.query.order_by(Transaction.timestamp.desc()).all()
-    stats = {
-        "total": Transaction.query.count(),
-        "fraudulent": Transaction.query.filter_by(is_fraudulent=True).count(),
-        "approved": Transaction.query.filter_by(is_approved=True).count(),
-        "declined": Transaction.query.filter_by(is_declined=True).count(),
-        "pending": Transaction.query.filter_by(is_approved=False, is_declined=False).count()
+    status = request.args.get("status") or None
+    userid = request.args.get("userid") or None
+    date_from = parse_date(request.args.get("date_from"))
+    date_to = parse_date(request.args.get("date_to"))
+    per_page = min(max(request.args.get("per_page", 50, type=int), 1), 200)
+    if status is not None and status not in ADMIN_STATUSES:
+        raise BadRequest(f"Status must be one of: {', '.join(ADMIN_STATUSES)}")
+
+    # Filters shared by the page and the stats cards
+    criteria = []
+    if userid:
+        criteria.append(Transaction.userid == userid)
+    if date_from:
+        criteria.append(Transaction.timestamp >= date_from)
+    if date_to:
+        criteria.append(Transaction.timestamp < date_to + timedelta(days=1))
+
+    page_criteria = list(criteria)
+    if status:
+        page_criteria.append(Transaction.status_filter(status))
+
+    transactions, has_older, has_newer = Transaction.get_page(
+        *page_criteria,
+        before=parse_cursor(request.args.get("before")),
+        after=parse_cursor(request.args.get("after")),
+        per_page=per_page
+    )
+    stats = Transaction.get_status_counts(*criteria)
+
+    filters = {
+        key: value for key, value in {
+            "status": status,
+            "userid": userid,
+            "date_from": request.args.get("date_from"),
+            "date_to": request.args.get("date_to"),
+            "per_page": per_page if per_page != 50 else None
+        }.items() if value
+    }
+    pagination = {
+        "older": url_for('admin', before=format_cursor(transactions[-1]), **filters)
+                 if has_older and transactions else None,
+        "newer": url_for('admin', after=format_cursor(transactions[0]), **filters)
+                 if has_newer and transactions else None,
+        "first": url_for('admin', **filters)
     }
-    return render_template("admin.html", transactions=transactions, stats=stats)
+    return render_template("admin.html", transactions=transactions, stats=stats,
+                           filters=filters, statuses=ADMIN_STATUSES, pagination=pagination)
 
 @app.route("/admin/approve/<int:transaction_id>", methods=["POST"])
 def admin_approve_transaction(transaction_id):
@@ -219,7 +527,7 @@ def admin_approve_transaction(transaction_id):
         transaction.is_approved = True
         transaction.approval_timestamp = datetime.now(timezone.utc)
         db.session.commit()
-    return redirect(url_for('admin'))
+    return redirect(url_for('admin', **request.args))
 
 @app.route("/admin/decline/<int:transaction_id>", methods=["POST"])
 def admin_decline_transaction(transaction_id):
@@ -227,7 +535,48 @@ def admin_decline_transaction(transaction_id):
     if not transaction.is_approved and not transaction.is_declined:
         transaction.is_declined = True
         db.session.commit()
-    return redirect(url_for('admin'))
+        record_decline(transaction.userid, transaction.timestamp)
+    return redirect(url_for('admin', **request.args))
+
+@app.route("/admin/rules")
+def admin_rules():
+    """Per-rule evaluation counts, hits and mean latency for this worker"""
+    return jsonify({"success": True, "rules": fraud_detection.get_rules().stats()})
+
+@app.route("/admin/flags")
+def admin_flags():
+    """How often each fraud flag was raised in [date_from, date_to], from the flag index"""
+    date_from = parse_date(request.args.get("date_from"))
+    date_to = parse_date(request.args.get("date_to"))
+    counts = TransactionFlag.count_by_code(
+        since=date_from, until=date_to + timedelta(days=1) if date_to else None)
+    return jsonify({"success": True, "flags": [
+        {"code": code, "name": flag_name(code), "count": count} for code, count in sorted(counts.items())
+    ]})
+
+@app.route("/admin/profiles")
+def admin_profiles():
+    """The slowest recently profiled requests, across workers, with their top frames"""
+    limit = min(max(request.args.get("limit", 20, type=int), 1), 200)
+    return jsonify({"success": True, "profiles": request_profiler.slowest(limit)})
+
+@app.route("/health")
+def health():
+    """Liveness check reporting which model version this worker serves"""
+    return jsonify({
+        "status": "ok",
+        "model": {
+            "version": fraud_detection.model_version,
+            "available": fraud_detection.ML_MODEL_AVAILABLE,
+            "registry_version": fraud_detection.get_model_registry().current_version()
+        },
+        "group_commit": transaction_writer.stats()
+    })
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """This worker's latency histograms, counters and gauges in the Prometheus text format"""
+    return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
 
 @app.errorhandler(404)
 def not_found_error(error):
@@ -240,5 +589,5 @@ def internal_error(error):
 
 if __name__ == "__main__":
     with app.app_context():
-        db.create_all()
+        init_database()
     app.run(debug=True)
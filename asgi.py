@@ -0,0 +1,124 @@
+# ASGI entry point: uvicorn asgi:application
+# POST /score/async is served on the event loop, so requests waiting on the
+# database don't each hold a thread. Every other route goes to the Flask app
+# on a pool of WSGI_THREADS threads, as a threaded WSGI server would run it.
+import asyncio
+import io
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app, async_scorer
+import utils.metrics as metrics
+
+wsgi_executor = ThreadPoolExecutor(max_workers=app.config['WSGI_THREADS'], thread_name_prefix='wsgi')
+
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+def build_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin1').upper().replace('-', '_')
+        if name not in ('CONTENT_LENGTH', 'CONTENT_TYPE'):
+            name = 'HTTP_' + name
+        value = value.decode('latin1')
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+def call_wsgi(environ):
+    """Run the Flask app on one request; returns (status, headers, body)"""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [(name.lower().encode('latin1'), value.encode('latin1'))
+                               for name, value in headers]
+
+    chunks = app(environ, start_response)
+    try:
+        body = b''.join(chunks)
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+    return response['status'], response['headers'], body
+
+
+async def send_response(send, status, headers, body):
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def flask_route(scope, receive, send):
+    environ = build_environ(scope, await read_body(receive))
+    status, headers, body = await asyncio.get_running_loop().run_in_executor(wsgi_executor, call_wsgi, environ)
+    await send_response(send, status, headers, body)
+
+
+async def score_async(scope, receive, send):
+    started = time.perf_counter()
+    headers = dict(scope['headers'])
+    try:
+        data = json.loads(await read_body(receive))
+    except ValueError:
+        data = None
+    host = headers.get(b'host', b'localhost').decode('latin1')
+    response_data, status = await async_scorer.score(
+        data,
+        headers.get(b'user-agent', b'Unknown').decode('latin1'),
+        (scope.get('client') or (None, 0))[0],
+        f"{scope.get('scheme', 'http')}://{host}/"
+    )
+    body = json.dumps(response_data).encode()
+    await send_response(send, status, [(b'content-type', b'application/json'),
+                                       (b'content-length', str(len(body)).encode())], body)
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, 'score_async', str(status))
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            async_scorer.stop()
+            wsgi_executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    elif scope['type'] != 'http':
+        raise ValueError(f"Unsupported ASGI scope type: {scope['type']}")
+    elif scope['method'] == 'POST' and scope['path'] == '/score/async':
+        await score_async(scope, receive, send)
+    else:
+        await flask_route(scope, receive, send)
@@ -0,0 +1,37 @@
+# User-Agent parsing: uncached parses vs. the LRU cache hit path, and full device resolution
+from utils.device_info import DeviceResolver, parse_user_agent
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_2 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) "
+    "Version/17.2 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (Linux; Android 14; SM-S918B) AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/120.0.6099.144 Mobile Safari/537.36",
+    "Mozilla/5.0 (X11; Linux x86_64; rv:120.0) Gecko/20100101 Firefox/120.0",
+]
+
+
+def distinct_user_agents(n):
+    """User agents no parser cache has seen (distinct patch versions)"""
+    return iter([f"{USER_AGENTS[i % len(USER_AGENTS)]} Build/{i}" for i in range(n)])
+
+
+def bench_parse_uncached(benchmark):
+    user_agents = distinct_user_agents(200_000)
+    benchmark(lambda: parse_user_agent(next(user_agents)))
+
+
+def bench_parse_cache_hit(benchmark):
+    resolver = DeviceResolver()
+    for user_agent in USER_AGENTS:
+        resolver.parse(user_agent)
+    benchmark(resolver.parse, USER_AGENTS[0])
+    assert resolver.cache_info().misses == len(USER_AGENTS)
+
+
+def bench_resolve_cache_hit(benchmark, app):
+    """Parse cache hit plus the interned id lookup, as every scored request does"""
+    resolver = DeviceResolver()
+    resolver.resolve(USER_AGENTS[0])
+    device = benchmark(resolver.resolve, USER_AGENTS[0])
+    assert device['key'] is not None
@@ -0,0 +1,67 @@
+# Write throughput of POST / with per-request commits vs. write-behind group commit
+import threading
+import time
+
+import pytest
+
+from conftest import seed
+from models import db
+
+THREADS = 8
+REQUESTS_PER_THREAD = 50
+
+MODES = {
+    'per-request': {'GROUP_COMMIT': False, 'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_SYNCHRONOUS': 'FULL'},
+    'per-request-wal': {'GROUP_COMMIT': False, 'SQLITE_JOURNAL_MODE': 'WAL', 'SQLITE_SYNCHRONOUS': 'NORMAL'},
+    'group-commit': {'GROUP_COMMIT': True, 'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_SYNCHRONOUS': 'FULL'},
+    'group-commit-wal': {'GROUP_COMMIT': True, 'SQLITE_JOURNAL_MODE': 'WAL', 'SQLITE_SYNCHRONOUS': 'NORMAL'},
+}
+
+
+@pytest.fixture(scope='module')
+def userids(app):
+    return seed([100] * THREADS)
+
+
+@pytest.fixture
+def configure(app):
+    saved = {key: app.config[key] for key in MODES['per-request']}
+    writer = app.extensions['transaction_writer']
+
+    def apply(settings):
+        app.config.update(settings)
+        # New pooled connections pick up the pragmas
+        db.session.remove()
+        db.engine.dispose()
+
+    yield apply
+    writer.stop()
+    apply(saved)
+
+
+@pytest.mark.parametrize('mode', list(MODES))
+def bench_concurrent_writes(benchmark, app, userids, configure, mode):
+    configure(MODES[mode])
+    client = app.test_client()
+    failures = []
+
+    def post(userid):
+        for i in range(REQUESTS_PER_THREAD):
+            response = client.post('/', json={'userid': userid, 'amount': 20.0 + i},
+                                   environ_base={'REMOTE_ADDR': '10.0.0.1'})
+            if response.status_code != 200:
+                failures.append(response.status_code)
+
+    def run():
+        threads = [threading.Thread(target=post, args=(userid,)) for userid in userids]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return time.perf_counter() - started
+
+    elapsed = benchmark.pedantic(run, rounds=3, iterations=1)
+    assert not failures
+    benchmark.extra_info['writes_per_second'] = round(THREADS * REQUESTS_PER_THREAD / elapsed)
+    benchmark.extra_info['group_commit'] = app.extensions['transaction_writer'].stats()
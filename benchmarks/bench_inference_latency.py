@@ -0,0 +1,75 @@
+# Single-transaction inference latency: sklearn calls vs. the compiled forest,
+# with and without per-feature contributions
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add the project root to Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from ml.random_forest_model import FraudDetectionModel
+from test_feature_engineering import make_transactions
+
+ITERATIONS = 2000
+WARMUP = 50
+
+
+def train_model():
+    model = FraudDetectionModel()
+    transactions = make_transactions(5000, n_users=100)
+    for i, t in enumerate(transactions):
+        t['is_fraudulent'] = t['amount'] > 3000 or i % 11 == 0
+    model.train(transactions)
+    return model
+
+
+def sklearn_path(model, features):
+    """What predict() used to do for one row"""
+    features_scaled = model.scaler.transform(features)
+    model.model.predict(features_scaled)
+    model.model.predict_proba(features_scaled)
+
+
+def compiled_path(model, features):
+    model.compiled.predict(features)
+
+
+def explained_path(model, features):
+    """Compiled prediction plus per-feature contributions"""
+    model.compiled.explain(features)
+
+
+def latencies(func, rows, iterations):
+    timings = []
+    for i in range(WARMUP + iterations):
+        row = rows[i % len(rows)]
+        start = time.perf_counter()
+        func(row)
+        if i >= WARMUP:
+            timings.append(time.perf_counter() - start)
+    return np.array(timings) * 1e6
+
+
+def run_benchmark(iterations=ITERATIONS):
+    model = train_model()
+    transactions = make_transactions(500, n_users=100, seed=1)
+    rows = [model.prepare_features([t]) for t in transactions]
+
+    # The sklearn path is ~100x slower; fewer iterations keep the run short
+    results = {
+        'sklearn': latencies(lambda row: sklearn_path(model, row), rows, iterations // 10),
+        'compiled': latencies(lambda row: compiled_path(model, row), rows, iterations),
+        'explained': latencies(lambda row: explained_path(model, row), rows, iterations),
+    }
+
+    print(f"{'Path':>10} {'p50 (us)':>10} {'p99 (us)':>10}")
+    print("-" * 32)
+    for name, timings in results.items():
+        print(f"{name:>10} {np.percentile(timings, 50):>10.1f} {np.percentile(timings, 99):>10.1f}")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,51 @@
+# Feature engineering and model inference
+import pytest
+
+from ml.random_forest_model import FraudDetectionModel
+from test_feature_engineering import make_transactions
+
+ROWS = [1_000, 10_000, 100_000]
+
+
+@pytest.fixture(scope='module')
+def model(app):
+    model = FraudDetectionModel()
+    transactions = make_transactions(5000, n_users=100)
+    for i, t in enumerate(transactions):
+        t['is_fraudulent'] = t['amount'] > 3000 or i % 11 == 0
+    model.train(transactions)
+    return model
+
+
+@pytest.mark.parametrize('rows', ROWS)
+def bench_prepare_features(benchmark, model, rows):
+    transactions = make_transactions(rows, n_users=max(rows // 100, 1))
+    features = benchmark(model.prepare_features, transactions)
+    assert features.shape[0] == rows
+
+
+def bench_predict(benchmark, model):
+    transaction = make_transactions(1, seed=1)[0]
+    benchmark(model.predict, transaction)
+
+
+def bench_predict_sklearn(benchmark, model):
+    """The uncompiled sklearn path, for comparison with bench_predict"""
+    features = model.prepare_features(make_transactions(1, seed=1))
+
+    def predict():
+        features_scaled = model.scaler.transform(features)
+        return model.model.predict(features_scaled), model.model.predict_proba(features_scaled)
+
+    benchmark(predict)
+
+
+@pytest.mark.parametrize('batch_size', [100, 1_000])
+def bench_predict_batch(benchmark, model, batch_size):
+    transactions = make_transactions(batch_size, seed=2)
+    benchmark(model.predict_batch, transactions)
+
+
+def bench_explain(benchmark, model):
+    transaction = make_transactions(1, seed=1)[0]
+    benchmark(model.explain, transaction)
@@ -0,0 +1,39 @@
+# Feature engineering benchmark: columnar builder vs. the original row-by-row scan
+import os
+import sys
+import time
+
+# Add the project root to Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from ml.random_forest_model import FraudDetectionModel
+from test_feature_engineering import make_transactions, reference_prepare_features
+
+SIZES = [10_000, 100_000, 1_000_000]
+# The quadratic reference implementation is only timed where it finishes
+REFERENCE_MAX_SIZE = 10_000
+
+
+def time_call(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def run_benchmark(sizes=SIZES):
+    model = FraudDetectionModel()
+    print(f"{'Rows':>10} {'Columnar (s)':>14} {'Reference (s)':>14}")
+    print("-" * 40)
+    for size in sizes:
+        transactions = make_transactions(size, n_users=max(size // 100, 1))
+        columnar = time_call(model.prepare_features, transactions)
+        if size <= REFERENCE_MAX_SIZE:
+            reference = f"{time_call(reference_prepare_features, transactions):>14.3f}"
+        else:
+            reference = f"{'skipped':>14}"
+        print(f"{size:>10,} {columnar:>14.3f} {reference}")
+
+
+if __name__ == "__main__":
+    run_benchmark()
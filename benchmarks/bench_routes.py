@@ -0,0 +1,48 @@
+# HTTP routes through the Flask test client
+import pytest
+
+from conftest import seed
+
+
+@pytest.fixture(scope='module', params=[10_000, 100_000], ids=lambda rows: f'{rows}rows')
+def dataset(request, app):
+    rows = request.param
+    userids = seed([rows // 100] * 100)
+    return rows, userids
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def bench_score_transaction(benchmark, client, dataset):
+    _, userids = dataset
+
+    def post():
+        response = client.post('/', json={'userid': userids[0], 'amount': 120.0},
+                               environ_base={'REMOTE_ADDR': '10.0.0.1'})
+        assert response.status_code == 200
+
+    benchmark(post)
+
+
+def bench_score_batch(benchmark, client, dataset):
+    _, userids = dataset
+    body = {'transactions': [{'userid': userid, 'amount': 120.0, 'location': 'Chicago'}
+                             for userid in userids[:50]]}
+
+    def post():
+        response = client.post('/score/batch', json=body)
+        assert response.status_code == 200
+
+    benchmark(post)
+
+
+@pytest.mark.parametrize('query', ['', '?status=pending', '?userid=bench1'])
+def bench_admin(benchmark, client, dataset, query):
+    def get():
+        response = client.get('/admin' + query)
+        assert response.status_code == 200
+
+    benchmark(get)
@@ -0,0 +1,48 @@
+# Scoring hot path: history reads, rules and detect_fraud at several history sizes
+from datetime import datetime, timezone
+
+import pytest
+
+from conftest import seed
+from utils.fraud_detection import (apply_rule_based_detection, detect_fraud, get_user_history_summary,
+                                   get_user_transaction_history)
+
+HISTORY_SIZES = [100, 1_000, 10_000]
+
+
+@pytest.fixture(scope='module')
+def users(app):
+    return dict(zip(HISTORY_SIZES, seed(HISTORY_SIZES)))
+
+
+@pytest.mark.parametrize('history_size', HISTORY_SIZES)
+def bench_detect_fraud(benchmark, users, history_size):
+    benchmark(detect_fraud, 120.0, 'Chicago', users[history_size])
+
+
+@pytest.mark.parametrize('history_size', HISTORY_SIZES)
+def bench_get_user_transaction_history(benchmark, users, history_size):
+    history = benchmark(get_user_transaction_history, users[history_size])
+    assert len(history) == history_size
+
+
+@pytest.mark.parametrize('history_size', HISTORY_SIZES)
+def bench_get_user_history_summary(benchmark, users, history_size):
+    benchmark(get_user_history_summary, users[history_size])
+
+
+@pytest.mark.parametrize('history_size', HISTORY_SIZES)
+def bench_apply_rule_based_detection(benchmark, users, history_size):
+    userid = users[history_size]
+    summary = get_user_history_summary(userid)
+    now = datetime.now(timezone.utc)
+    benchmark(apply_rule_based_detection, 120.0, 'Chicago', userid, summary, now)
+
+
+@pytest.mark.parametrize('history_size', [1_000])
+def bench_apply_rule_based_detection_raw_history(benchmark, users, history_size):
+    """The same rules fed a raw history list, as callers without a profile do"""
+    userid = users[history_size]
+    history = get_user_transaction_history(userid)
+    now = datetime.now(timezone.utc)
+    benchmark(apply_rule_based_detection, 120.0, 'Chicago', userid, history, now)
@@ -0,0 +1,15 @@
+# End-to-end model training (read history, train, publish) at several data scales
+import pytest
+
+from conftest import seed
+
+SCALES = [1_000, 10_000, 50_000]
+
+
+@pytest.mark.parametrize('rows', SCALES)
+def bench_train_and_save_model(benchmark, app, rows):
+    from ml.train_model import train_and_save_model
+
+    seed([rows // 50] * 50)
+    # Each round trains a 100-tree forest; a couple of rounds is enough
+    benchmark.pedantic(train_and_save_model, rounds=2, iterations=1)
@@ -0,0 +1,145 @@
+# Query latency benchmark for the hot Transaction query patterns, before and after indexing
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+# Add the project root to Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from flask import Flask
+from config import Config
+from models import db
+from models.location import location_code
+from models.transaction import Transaction
+from models.user import User
+from utils.fraud_detection import get_user_transaction_history
+
+LOCATIONS = ['New York', 'Los Angeles', 'Chicago', 'Houston', 'Miami', 'Unknown']
+
+
+def create_app(database_path):
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database_path}'
+    db.init_app(app)
+    return app
+
+
+def populate(n_rows, n_users, chunk_size=50_000):
+    """Fill the scratch database with random transactions"""
+    rng = random.Random(42)
+    now = datetime.now(timezone.utc)
+    codes = [location_code(name) for name in LOCATIONS]
+    db.session.execute(User.__table__.insert(), [
+        {'username': f'user{i}', 'userid': f'user{i}', 'email': f'user{i}@example.com',
+         'phone': f'+1{i:010d}', 'created_at': now}
+        for i in range(n_users)
+    ])
+    for start in range(0, n_rows, chunk_size):
+        rows = []
+        for _ in range(min(chunk_size, n_rows - start)):
+            declined = rng.random() < 0.02
+            approved = not declined and rng.random() < 0.9
+            rows.append({
+                'userid': f'user{rng.randrange(n_users)}',
+                'amount': rng.uniform(1, 2000),
+                'device_id': 'device1',
+                'location_code': rng.choice(codes),
+                'timestamp': now - timedelta(seconds=rng.randrange(90 * 86400)),
+                'is_fraudulent': declined or rng.random() < 0.05,
+                'is_approved': approved,
+                'is_declined': declined
+            })
+        db.session.execute(Transaction.__table__.insert(), rows)
+    db.session.commit()
+
+
+def admin_counts():
+    return {
+        "total": Transaction.query.count(),
+        "fraudulent": Transaction.query.filter_by(is_fraudulent=True).count(),
+        "approved": Transaction.query.filter_by(is_approved=True).count(),
+        "declined": Transaction.query.filter_by(is_declined=True).count(),
+        "pending": Transaction.query.filter(
+            Transaction.is_approved == db.false(),
+            Transaction.is_declined == db.false()
+        ).count()
+    }
+
+
+def measure(func, args_list):
+    """Return (p50, p99) latency in milliseconds over the given argument list"""
+    timings = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        timings.append((time.perf_counter() - start) * 1000)
+        db.session.rollback()
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.99) - 1]
+
+
+def run_queries(n_users, samples):
+    rng = random.Random(7)
+    users = [(f'user{rng.randrange(n_users)}',) for _ in range(samples)]
+    now = datetime.now(timezone.utc)
+    return {
+        'history (userid)': measure(get_user_transaction_history, users),
+        'rule 4 declined (userid, is_declined, ts)': measure(
+            lambda userid: Transaction.query.filter(
+                Transaction.userid == userid,
+                Transaction.is_declined == True,
+                Transaction.timestamp >= now - timedelta(minutes=30)
+            ).count(), users),
+        'recent transactions (userid, ts)': measure(Transaction.get_user_recent_transactions, users),
+        'admin status counts': measure(admin_counts, [()] * max(samples // 20, 3)),
+    }
+
+
+def drop_indexes():
+    for index in Transaction.__table__.indexes:
+        index.drop(db.engine)
+
+
+def create_indexes():
+    for index in Transaction.__table__.indexes:
+        index.create(db.engine)
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql('ANALYZE')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--samples', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        app = create_app(os.path.join(scratch, 'bench.db'))
+        with app.app_context():
+            db.create_all()
+            drop_indexes()
+            print(f"Populating {args.rows:,} transactions for {args.users:,} users...")
+            populate(args.rows, args.users)
+
+            before = run_queries(args.users, args.samples)
+            create_indexes()
+            after = run_queries(args.users, args.samples)
+
+            print(f"\n{'Query':<44} {'before p50/p99 (ms)':>22} {'after p50/p99 (ms)':>22}")
+            print("-" * 90)
+            for name in before:
+                b50, b99 = before[name]
+                a50, a99 = after[name]
+                print(f"{name:<44} {b50:>10.2f}/{b99:<11.2f} {a50:>10.2f}/{a99:<11.2f}")
+
+
+if __name__ == "__main__":
+    main()
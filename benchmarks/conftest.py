@@ -0,0 +1,103 @@
+# Benchmark setup: a scratch SQLite database, model registry and velocity
+# file, seeded at the scale each benchmark module asks for
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+_scratch_dir = tempfile.mkdtemp(prefix='fraudguard-bench-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_scratch_dir, 'fraudguard.db')
+os.environ['ML_MODEL_REGISTRY'] = os.path.join(_scratch_dir, 'models')
+os.environ['VELOCITY_STORE_PATH'] = os.path.join(_scratch_dir, 'velocity.bin')
+os.environ['MAIL_SUPPRESS_SEND'] = '1'
+os.environ['ML_RELOAD_INTERVAL'] = '0'
+
+# Add the project root to Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+import pytest
+
+from models import db
+from models.location import location_code
+from models.notification import Notification
+from models.transaction import Transaction
+from models.transaction_flag import TransactionFlag
+from models.user import User
+from models.user_profile import UserProfile
+from utils.user_profiles import rebuild_profiles
+
+LOCATIONS = ['New York', 'Los Angeles', 'Chicago', 'Houston', 'Miami', 'Denver', 'Boston']
+INSERT_CHUNK = 10_000
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import app as flask_app
+    from ml.random_forest_model import FraudDetectionModel
+    from ml.registry import ModelRegistry
+    from test_feature_engineering import make_transactions
+
+    with flask_app.app_context():
+        db.create_all()
+
+        # Score with a real model, like production does
+        model = FraudDetectionModel()
+        transactions = make_transactions(5000, n_users=100)
+        for i, t in enumerate(transactions):
+            t['is_fraudulent'] = t['amount'] > 3000 or i % 11 == 0
+        model.train(transactions)
+        ModelRegistry(flask_app.config['ML_MODEL_REGISTRY']).publish(model)
+
+        yield flask_app
+
+
+def reset_database():
+    Notification.query.delete()
+    UserProfile.query.delete()
+    TransactionFlag.query.delete()
+    Transaction.query.delete()
+    User.query.delete()
+    db.session.commit()
+
+
+def seed(history_sizes, seed=0, days=90):
+    """
+    Replace all data with one user per entry of history_sizes, holding that
+    many transactions spread over the last `days` days. Returns the user ids.
+    """
+    reset_database()
+    codes = {name: location_code(name) for name in LOCATIONS}
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    userids = [f'bench{i}' for i in range(len(history_sizes))]
+    db.session.execute(db.insert(User), [
+        {'username': userid, 'userid': userid, 'email': f'{userid}@example.com', 'phone': f'+1555{i:07d}'}
+        for i, userid in enumerate(userids)
+    ])
+
+    rows = []
+    for userid, size in zip(userids, history_sizes):
+        home = rng.sample(LOCATIONS, 2)
+        for _ in range(size):
+            fraud = rng.random() < 0.05
+            rows.append({
+                'userid': userid,
+                'amount': round(rng.uniform(5000, 50000) if fraud else rng.lognormvariate(4, 1), 2),
+                'device_id': 'bench-device',
+                'location_code': codes[rng.choice(LOCATIONS) if fraud else rng.choice(home)],
+                # Keep the last 30 minutes free so velocity rules see a quiet user
+                'timestamp': now - timedelta(seconds=rng.randint(1800, days * 86400)),
+                'is_fraudulent': fraud,
+                'is_approved': not fraud,
+                'is_declined': False,
+            })
+            if len(rows) >= INSERT_CHUNK:
+                db.session.execute(db.insert(Transaction), rows)
+                rows = []
+    if rows:
+        db.session.execute(db.insert(Transaction), rows)
+    db.session.commit()
+    rebuild_profiles()
+    return userids
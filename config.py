@@ -4,7 +4,7 @@ from datetime import timedelta
 
 class Config:
     # Database configuration
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///fraudguard.db'
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///fraudguard.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
     # Security
@@ -23,9 +23,83 @@ class Config:
     MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS') is not None
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+    MAIL_SUPPRESS_SEND = os.environ.get('MAIL_SUPPRESS_SEND') is not None
+    
+    # Notification dispatcher configuration
+    NOTIFICATION_WORKERS = int(os.environ.get('NOTIFICATION_WORKERS') or 2)
+    NOTIFICATION_QUEUE_SIZE = int(os.environ.get('NOTIFICATION_QUEUE_SIZE') or 1000)
+    NOTIFICATION_MAX_ATTEMPTS = int(os.environ.get('NOTIFICATION_MAX_ATTEMPTS') or 5)
+    NOTIFICATION_RETRY_BACKOFF = 2.0  # seconds, doubled after every failed attempt
+    NOTIFICATION_SWEEP_INTERVAL = 30.0  # seconds between outbox sweeps
+    NOTIFICATION_SMTP_TIMEOUT = 10.0
+    NOTIFICATION_SMTP_IDLE_TIMEOUT = 60.0  # close pooled sessions idle for this long
+    # seconds before a row claimed by a worker that died mid-send is sent again
+    NOTIFICATION_CLAIM_TIMEOUT = float(os.environ.get('NOTIFICATION_CLAIM_TIMEOUT') or 300)
     
     # SMS configuration
     SMS_API_KEY = os.environ.get('SMS_API_KEY')
     
     # ML Model configuration
-    ML_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ml', 'model.joblib')
+    ML_MODEL_REGISTRY = os.environ.get('ML_MODEL_REGISTRY') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'instance', 'models')
+    # Seconds between checks for a newly promoted model; 0 disables hot reload
+    ML_RELOAD_INTERVAL = float(os.environ.get('ML_RELOAD_INTERVAL') or 10)
+    # When to load the model: 'lazy' (first scoring request), 'background'
+    # (a thread started at app import) or 'eager' (during app import)
+    ML_WARM_UP = os.environ.get('ML_WARM_UP') or 'lazy'
+    
+    # Rule-based detection: rule ids, costs, dependencies, thresholds and
+    # flag messages; edits are picked up without a restart
+    RULES_PATH = os.environ.get('RULES_PATH') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'rules.json')
+    
+    # Shared per-user velocity counters (recent transactions, locations and
+    # declines) used by the rules; an empty path falls back to the database
+    VELOCITY_STORE_PATH = os.environ.get('VELOCITY_STORE_PATH', os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'instance', 'velocity.bin'))
+    VELOCITY_CAPACITY = int(os.environ.get('VELOCITY_CAPACITY') or 65536)  # user slots
+    
+    # SQLite connection pragmas, e.g. WAL and NORMAL for concurrent writers;
+    # unset leaves the SQLite defaults
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS')
+    
+    # Write-behind group commit: scored transactions are queued and committed
+    # in batches by a writer thread; requests wait for their batch to commit
+    GROUP_COMMIT = os.environ.get('GROUP_COMMIT') is not None
+    GROUP_COMMIT_MAX_ROWS = int(os.environ.get('GROUP_COMMIT_MAX_ROWS') or 500)
+    GROUP_COMMIT_MAX_DELAY = float(os.environ.get('GROUP_COMMIT_MAX_DELAY') or 0.005)  # seconds
+    GROUP_COMMIT_QUEUE_SIZE = int(os.environ.get('GROUP_COMMIT_QUEUE_SIZE') or 10000)
+    GROUP_COMMIT_TIMEOUT = float(os.environ.get('GROUP_COMMIT_TIMEOUT') or 10.0)  # seconds a request waits
+    
+    # Request profiling: a sampled fraction of requests (when enabled) and any
+    # request sending PROFILING_TOKEN in X-Profile-Token are profiled, with
+    # the stack sampler ('sample') or cProfile ('cprofile')
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED') is not None
+    PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE') or 0.01)
+    PROFILING_MODE = os.environ.get('PROFILING_MODE') or 'sample'
+    PROFILING_INTERVAL = float(os.environ.get('PROFILING_INTERVAL') or 0.005)  # seconds between stack samples
+    PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN')
+    PROFILING_DIR = os.environ.get('PROFILING_DIR') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'instance', 'profiles')
+    PROFILING_KEEP = int(os.environ.get('PROFILING_KEEP') or 500)  # profiled requests kept on disk
+    
+    # Async scoring (/score/async): threads for database and other blocking
+    # stages, and for model inference, which is CPU-bound
+    SCORING_IO_WORKERS = int(os.environ.get('SCORING_IO_WORKERS') or 8)
+    SCORING_ML_WORKERS = int(os.environ.get('SCORING_ML_WORKERS') or 1)
+    WSGI_THREADS = int(os.environ.get('WSGI_THREADS') or 8)  # threads for the other routes under asgi.py
+    
+    # Batch scoring configuration
+    MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE') or 1000)
+    
+    # IP geolocation configuration
+    GEOIP_DATABASE_PATH = os.environ.get('GEOIP_DATABASE_PATH') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'instance', 'geoip.bin')
+    GEOIP_CACHE_SIZE = int(os.environ.get('GEOIP_CACHE_SIZE') or 65536)
+    
+    # Device fingerprinting: parsed User-Agent strings kept in memory
+    DEVICE_CACHE_SIZE = int(os.environ.get('DEVICE_CACHE_SIZE') or 4096)
+    
+    # User profile configuration
+    PROFILE_RECENT_EVENTS = int(os.environ.get('PROFILE_RECENT_EVENTS') or 100)  # recent events kept per user
@@ -0,0 +1,58 @@
+# Shared pytest setup: the suite runs against a scratch SQLite database
+# so tests never touch the development database in instance/
+import os
+import tempfile
+
+_scratch_dir = tempfile.mkdtemp(prefix='fraudguard-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_scratch_dir, 'fraudguard.db')
+os.environ['MAIL_SUPPRESS_SEND'] = '1'
+os.environ['ML_RELOAD_INTERVAL'] = '0'
+# Tests insert rows directly, so rules read velocity from the database
+os.environ['VELOCITY_STORE_PATH'] = ''
+os.environ['PROFILING_DIR'] = os.path.join(_scratch_dir, 'profiles')
+
+# The benchmark suite has its own conftest and settings: python -m pytest benchmarks
+collect_ignore = ['benchmarks']
+
+import pytest
+from flask import Flask
+from config import Config
+from models import db
+from models.transaction import Transaction
+from models.transaction_flag import TransactionFlag
+from models.user import User
+from models.notification import Notification
+from models.user_profile import UserProfile
+
+
+@pytest.fixture(scope='session', autouse=True)
+def database():
+    """Create the schema once for the whole test session"""
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    yield
+
+
+@pytest.fixture
+def app():
+    """The FraudGuard app, with all rows removed after each test"""
+    from app import app as flask_app
+    flask_app.config['TESTING'] = True
+    with flask_app.app_context():
+        yield flask_app
+        db.session.rollback()
+        Notification.query.delete()
+        UserProfile.query.delete()
+        TransactionFlag.query.delete()
+        Transaction.query.delete()
+        User.query.delete()
+        db.session.commit()
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
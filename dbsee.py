@@ -2,7 +2,6 @@ from flask import Flask
 from models import db
 from models.transaction import Transaction
 from config import Config
-import pandas as pd
 from datetime import datetime
 
 app = Flask(__name__)
@@ -50,7 +49,7 @@ def show_statistics():
         total_amount = db.session.query(db.func.sum(Transaction.amount)).scalar()
         avg_amount = db.session.query(db.func.avg(Transaction.amount)).scalar()
         unique_users = db.session.query(Transaction.userid).distinct().count()
-        unique_locations = db.session.query(Transaction.location).distinct().count()
+        unique_locations = db.session.query(Transaction.location_code).distinct().count()
 
         print("\n=== Transaction Statistics ===")
         print(f"Total Transactions: {total_transactions}")
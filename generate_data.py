@@ -0,0 +1,340 @@
+# Synthetic dataset generator for load and scale testing.
+#
+# Generates users with their own spending habits and transactions day by
+# day with numpy, then streams them into the database in large Core
+# executemany batches, or to JSON Lines for replay with `flask score-stream`.
+# Output is determined by the seed (and --end, which has a fixed default):
+# each day draws from its own generator, so the data doesn't depend on how
+# it is chunked or written.
+import argparse
+import json
+import sys
+import time
+import zlib
+from datetime import datetime, timezone
+
+import numpy as np
+from flask import Flask
+
+from config import Config
+from models import db
+from models.location import location_code
+from models.notification import Notification
+from models.transaction import Transaction
+from models.transaction_flag import TransactionFlag
+from models.user import User
+from models.user_profile import UserProfile
+from utils.user_profiles import rebuild_profiles
+
+# Cities with a rough popularity, for home locations and travel
+LOCATIONS = ['New York', 'Los Angeles', 'Chicago', 'Houston', 'Phoenix', 'Philadelphia', 'San Antonio',
+             'San Diego', 'Dallas', 'Miami', 'Denver', 'Boston', 'Seattle', 'Atlanta', 'Unknown']
+POPULARITY = np.array([18, 12, 9, 8, 5, 5, 4, 4, 4, 6, 4, 5, 4, 5, 2], dtype=float)
+POPULARITY /= POPULARITY.sum()
+
+# Share of a day's transactions per hour (UTC): quiet nights, lunch and evening peaks
+DIURNAL = np.array([1.0, 0.6, 0.4, 0.3, 0.3, 0.5, 1.2, 2.5, 3.8, 4.5, 5.0, 5.8,
+                    6.8, 6.2, 5.4, 5.2, 5.5, 6.2, 7.0, 7.2, 6.4, 5.0, 3.4, 2.0])
+DIURNAL /= DIURNAL.sum()
+WEEKDAY_ACTIVITY = np.array([0.95, 0.95, 0.95, 1.0, 1.1, 1.15, 0.9])  # Monday first
+
+# Where the data ends by default; a fixed date rather than today keeps runs reproducible
+DEFAULT_END = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+TRAVEL_RATE = 0.04         # normal transactions made away from home
+BURST_RATE = 0.0005        # card-testing bursts per user per day
+TAKEOVER_RATE = 0.0002     # account takeovers (one large payment from a new device) per user per day
+USERS_PER_RING = 2000      # one fraud ring per this many users
+RING_ACTIVITY = 0.2        # chance a ring strikes on a given day
+INSERT_CHUNK = 50_000
+
+# approval_notes recorded for each injected pattern
+NOTES = [None, 'Card testing burst', 'Account takeover', 'Fraud ring']
+BURST, TAKEOVER, RING = 1, 2, 3
+
+app = Flask(__name__)
+app.config.from_object(Config)
+db.init_app(app)
+
+
+def make_population(n_users, transactions_per_day, seed=0, prefix='gen'):
+    """Per-user spending habits plus the fraud rings, as numpy arrays"""
+    rng = np.random.default_rng([seed, 0])
+    mean_rate = transactions_per_day / n_users
+    population = {
+        'userid': np.array([f'{prefix}{i:07d}' for i in range(n_users)], dtype=object),
+        # Heavy-tailed activity: most users are occasional, a few are very busy
+        'rate': rng.gamma(0.8, mean_rate / 0.8, n_users),
+        # Log-normal amounts around each user's own typical spend
+        'mu': rng.normal(3.8, 0.8, n_users),
+        'sigma': rng.uniform(0.4, 1.0, n_users),
+        'home': rng.choice(len(LOCATIONS) - 1, n_users, p=POPULARITY[:-1] / POPULARITY[:-1].sum()),
+        'devices': rng.integers(1, 4, n_users),
+        'age_days': rng.integers(30, 1500, n_users),
+    }
+    rings = []
+    for r in range(max(1, n_users // USERS_PER_RING)):
+        size = min(int(rng.integers(5, 13)), n_users)
+        rings.append({
+            'members': rng.choice(n_users, size, replace=False),
+            'location': int(rng.choice(len(LOCATIONS), p=POPULARITY)),
+            'device': f'ring{r}',
+        })
+    population['rings'] = rings
+    return population
+
+
+def generate_day(population, day, day_start, seed=0):
+    """
+    One day of transactions as a dict of columns, sorted by time. `day` is
+    the day's index in the dataset and seeds its generator.
+    """
+    rng = np.random.default_rng([seed, 1, day])
+    n_users = len(population['rate'])
+    weekday = (day_start.astype('datetime64[D]').astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+
+    # Normal spending
+    counts = rng.poisson(population['rate'] * WEEKDAY_ACTIVITY[weekday])
+    user = np.repeat(np.arange(n_users), counts)
+    m = len(user)
+    seconds = rng.choice(24, m, p=DIURNAL) * 3600 + rng.integers(0, 3600, m)
+    amount = np.exp(population['mu'][user] + population['sigma'][user] * rng.standard_normal(m))
+    location = np.where(rng.random(m) < TRAVEL_RATE,
+                        rng.choice(len(LOCATIONS), m, p=POPULARITY), population['home'][user])
+    device = [f'{population["userid"][u]}-d{k}' for u, k in
+              zip(user.tolist(), (rng.random(m) * population['devices'][user]).astype(int).tolist())]
+    columns = [{
+        'user': user, 'seconds': seconds, 'amount': amount, 'location': location, 'device': device,
+        'pattern': np.zeros(m, dtype=np.int8), 'declined': np.zeros(m, dtype=bool),
+    }]
+
+    # Card-testing bursts: 3-8 quick charges from scattered locations
+    n_bursts = rng.poisson(n_users * BURST_RATE)
+    if n_bursts:
+        sizes = rng.integers(3, 9, n_bursts)
+        burst = np.repeat(np.arange(n_bursts), sizes)
+        gaps = rng.integers(20, 120, len(burst))
+        starts = np.cumsum(sizes) - sizes
+        offsets = np.cumsum(gaps) - np.repeat(np.cumsum(gaps)[starts] - gaps[starts], sizes)
+        columns.append({
+            'user': np.repeat(rng.integers(0, n_users, n_bursts), sizes),
+            'seconds': np.minimum(np.repeat(rng.integers(0, 86400 - 1200, n_bursts), sizes) + offsets, 86399),
+            'amount': rng.lognormal(5.5, 0.8, len(burst)),
+            'location': rng.choice(len(LOCATIONS), len(burst), p=POPULARITY),
+            'device': [f'burst{day}-{b}' for b in burst.tolist()],
+            'pattern': np.full(len(burst), BURST, dtype=np.int8),
+            'declined': np.repeat(rng.random(n_bursts) < 0.5, sizes),
+        })
+
+    # Account takeovers: one large payment from a device the user never used
+    n_takeovers = rng.poisson(n_users * TAKEOVER_RATE)
+    if n_takeovers:
+        columns.append({
+            'user': rng.integers(0, n_users, n_takeovers),
+            'seconds': rng.integers(0, 86400, n_takeovers),
+            'amount': rng.uniform(5000, 50000, n_takeovers),
+            'location': rng.choice(len(LOCATIONS), n_takeovers, p=POPULARITY),
+            'device': [f'ato{day}-{i}' for i in range(n_takeovers)],
+            'pattern': np.full(n_takeovers, TAKEOVER, dtype=np.int8),
+            'declined': rng.random(n_takeovers) < 0.3,
+        })
+
+    # Fraud rings: every member pays from the ring's device and city within an hour
+    for ring in population['rings']:
+        if rng.random() >= RING_ACTIVITY:
+            continue
+        per_member = rng.integers(1, 4, len(ring['members']))
+        size = int(per_member.sum())
+        columns.append({
+            'user': np.repeat(ring['members'], per_member),
+            'seconds': rng.integers(0, 82800) + rng.integers(0, 3600, size),
+            'amount': rng.uniform(1000, 9000, size),
+            'location': np.full(size, ring['location']),
+            'device': [ring['device']] * size,
+            'pattern': np.full(size, RING, dtype=np.int8),
+            'declined': np.zeros(size, dtype=bool),
+        })
+
+    merged = {key: np.concatenate([np.asarray(c[key], dtype=object if key == 'device' else None)
+                                   for c in columns]) for key in columns[0]}
+    order = np.argsort(merged['seconds'], kind='stable')
+    merged = {key: values[order] for key, values in merged.items()}
+    merged['amount'] = np.maximum(np.round(merged['amount'], 2), 0.01)
+    merged['timestamp'] = day_start + merged['seconds'].astype('timedelta64[s]')
+    return merged
+
+
+def generate(population, days, end, seed=0):
+    """Yield each day's columns, oldest day first; the last day ends at `end` midnight"""
+    first_day = np.datetime64(end.date(), 'D') - np.timedelta64(days, 'D')
+    for day in range(days):
+        yield generate_day(population, day, (first_day + np.timedelta64(day, 'D')).astype('datetime64[s]'), seed)
+
+
+def user_rows(population, end):
+    # Phone numbers must be unique too; the prefix picks the area code
+    area = 200 + zlib.crc32(population['userid'][0][:-7].encode()) % 800 if len(population['userid']) else 0
+    created = np.datetime64(end.replace(tzinfo=None), 's') - population['age_days'].astype('timedelta64[D]')
+    for i, (userid, created_at) in enumerate(zip(population['userid'], created.astype('datetime64[us]').tolist())):
+        yield {'username': userid, 'userid': userid, 'email': f'{userid}@example.com',
+               'phone': f'+1{area}{i:08d}', 'created_at': created_at}
+
+
+def transaction_rows(population, columns, location_codes=None):
+    """
+    Rows for one day of columns: Transaction table rows given the code of
+    each of LOCATIONS, otherwise with the location names
+    """
+    location_key, locations = ('location_code', location_codes) if location_codes else ('location', LOCATIONS)
+    timestamps = columns['timestamp'].astype('datetime64[us]').tolist()
+    fraud = (columns['pattern'] > 0).tolist()
+    for u, amount, location, device, timestamp, pattern, is_fraud, declined in zip(
+            columns['user'].tolist(), columns['amount'].tolist(), columns['location'].tolist(),
+            columns['device'].tolist(), timestamps, columns['pattern'].tolist(), fraud,
+            columns['declined'].tolist()):
+        yield {
+            'userid': population['userid'][u],
+            'amount': amount,
+            'device_id': device,
+            location_key: locations[location],
+            'timestamp': timestamp,
+            'is_fraudulent': is_fraud,
+            # Legitimate payments were approved on the spot; flagged ones await review or were declined
+            'is_approved': not is_fraud,
+            'is_declined': declined,
+            'approval_timestamp': timestamp if not is_fraud or declined else None,
+            'approval_notes': NOTES[pattern],
+        }
+
+
+def chunks(rows, size=INSERT_CHUNK):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def clear_data():
+    Notification.query.delete()
+    UserProfile.query.delete()
+    TransactionFlag.query.delete()
+    Transaction.query.delete()
+    User.query.delete()
+    db.session.commit()
+
+
+def write_database(population, days, end, seed=0, commit_rows=1_000_000, defer_indexes=True):
+    """
+    Insert the users and transactions with Core executemany, committing every
+    commit_rows transactions, then rebuild the user profiles. With
+    defer_indexes the Transaction indexes are dropped for the load and built
+    once at the end, which is much faster than updating them row by row.
+    Returns the number of transactions written.
+    """
+    written = 0
+    started = time.perf_counter()
+    location_codes = [location_code(name) for name in LOCATIONS]
+    indexes = list(Transaction.__table__.indexes) if defer_indexes else []
+    with db.engine.connect() as conn:
+        if conn.dialect.name == 'sqlite':
+            # A bulk load can be redone from the seed, so trade durability for speed
+            conn.exec_driver_sql('PRAGMA synchronous = OFF')
+            conn.exec_driver_sql('PRAGMA cache_size = -262144')
+        for batch in chunks(user_rows(population, end)):
+            conn.execute(User.__table__.insert(), batch)
+        for index in indexes:
+            index.drop(conn, checkfirst=True)
+        conn.commit()
+
+        try:
+            pending = 0
+            for columns in generate(population, days, end, seed):
+                for batch in chunks(transaction_rows(population, columns, location_codes)):
+                    conn.execute(Transaction.__table__.insert(), batch)
+                    pending += len(batch)
+                if pending >= commit_rows:
+                    conn.commit()
+                    written += pending
+                    pending = 0
+                    elapsed = time.perf_counter() - started
+                    print(f"{written:,} transactions written ({written / elapsed:,.0f}/s)")
+            conn.commit()
+            written += pending
+        finally:
+            conn.rollback()
+            for index in indexes:
+                index.create(conn, checkfirst=True)
+            conn.commit()
+
+    rebuild_profiles()
+    return written
+
+
+def write_jsonl(population, days, end, out, seed=0):
+    """Write the transactions as score-stream input lines; returns the number written"""
+    written = 0
+    for columns in generate(population, days, end, seed):
+        for row in transaction_rows(population, columns):
+            out.write(json.dumps({
+                'userid': row['userid'],
+                'amount': row['amount'],
+                'location': row['location'],
+                'device_id': row['device_id'],
+                'timestamp': row['timestamp'].isoformat(),
+                'is_fraudulent': row['is_fraudulent'],
+            }) + '\n')
+            written += 1
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic FraudGuard dataset")
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--transactions', type=int, default=1_000_000,
+                        help='Approximate number of normal transactions (injected fraud comes on top)')
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--prefix', default='gen', help='User id prefix')
+    parser.add_argument('--end', type=lambda s: datetime.fromisoformat(s).replace(tzinfo=timezone.utc),
+                        default=DEFAULT_END,
+                        help=f'Date the data ends (exclusive, default {DEFAULT_END.date()})')
+    parser.add_argument('--jsonl', metavar='PATH',
+                        help="Write transactions to this JSONL file ('-' for stdout) instead of the "
+                             "Transaction table; users are still added to the database for replay")
+    parser.add_argument('--replace', action='store_true', help='Delete all existing users and transactions first')
+    args = parser.parse_args(argv)
+
+    end = args.end
+    population = make_population(args.users, args.transactions / args.days, args.seed, args.prefix)
+    log = sys.stderr if args.jsonl == '-' else sys.stdout
+
+    with app.app_context():
+        db.create_all()
+        if args.replace:
+            clear_data()
+        elif User.query.filter(User.userid.like(f'{args.prefix}%')).first() is not None:
+            parser.error(f"users with prefix '{args.prefix}' already exist; use --replace or another --prefix")
+
+        started = time.perf_counter()
+        if args.jsonl:
+            with db.engine.begin() as conn:
+                for batch in chunks(user_rows(population, end)):
+                    conn.execute(User.__table__.insert(), batch)
+            if args.jsonl == '-':
+                written = write_jsonl(population, args.days, end, sys.stdout, args.seed)
+            else:
+                with open(args.jsonl, 'w', encoding='utf-8') as out:
+                    written = write_jsonl(population, args.days, end, out, args.seed)
+        else:
+            written = write_database(population, args.days, end, args.seed)
+        elapsed = time.perf_counter() - started
+
+    print(f"Created {args.users:,} users and {written:,} transactions in {elapsed:.1f}s", file=log)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# Load test for the scoring routes: sustained requests per second and latency percentiles
+#
+# Each of --concurrency clients keeps one request in flight for --duration
+# seconds, e.g. to compare the sync and async routes against a running server:
+#   python generate_data.py --users 1000 --transactions 100000 --days 30
+#   uvicorn asgi:application --port 8000
+#   python load_test.py http://127.0.0.1:8000 --path / --path /score/async --concurrency 4 16 64
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+
+class Connection:
+    """A minimal HTTP/1.1 client connection; reconnects when the server closes it"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, path, body):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(
+            f"POST {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+            f"User-Agent: fraudguard-load-test\r\n\r\n".encode() + body
+        )
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Server closed the connection")
+        version, status = status_line.split()[:2]
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if 'content-length' in headers:
+            await self.reader.readexactly(int(headers['content-length']))
+        else:
+            await self.reader.read()  # body runs until the server closes
+            headers['connection'] = 'close'
+        if version == b'HTTP/1.0' or headers.get('connection', '').lower() == 'close':
+            self.close()
+        return int(status)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def make_body(userids, rng):
+    return json.dumps({
+        "userid": rng.choice(userids),
+        "amount": round(rng.lognormvariate(4.0, 1.0), 2)
+    }).encode()
+
+
+async def run_level(url, path, concurrency, duration, warmup, userids, seed):
+    """Closed-loop load at one concurrency level; latencies after the warm-up only"""
+    parts = urlsplit(url)
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+
+    async def client(number):
+        nonlocal errors
+        rng = random.Random(seed * 1000 + number)
+        connection = Connection(parts.hostname, parts.port or 80)
+        try:
+            while True:
+                sent = time.perf_counter()
+                if sent >= stop_at:
+                    return
+                try:
+                    status = await connection.request(path, make_body(userids, rng))
+                except (OSError, ValueError, asyncio.IncompleteReadError):
+                    connection.close()
+                    status = None
+                done = time.perf_counter()
+                if sent >= measure_from:
+                    if status == 200:
+                        latencies.append(done - sent)
+                    else:
+                        errors += 1
+        finally:
+            connection.close()
+
+    await asyncio.gather(*(client(i) for i in range(concurrency)))
+    latencies = np.array(latencies) * 1000
+    return {
+        "path": path,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / duration,
+        "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else float('nan'),
+        "p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else float('nan'),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the FraudGuard scoring routes")
+    parser.add_argument('url', help='Base URL of a running server, e.g. http://127.0.0.1:8000')
+    parser.add_argument('--path', action='append', help='Route to POST to; repeat to compare (default /)')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16, 64],
+                        help='Concurrent clients per level')
+    parser.add_argument('--duration', type=float, default=20.0, help='Measured seconds per level')
+    parser.add_argument('--warmup', type=float, default=2.0, help='Unmeasured seconds before each level')
+    parser.add_argument('--users', type=int, default=1000, help='Number of user ids to draw from')
+    parser.add_argument('--prefix', default='gen', help='User id prefix (as in generate_data.py)')
+    parser.add_argument('--p99-target', type=float, default=None,
+                        help='Also report the best sustained rate per route with p99 under this many ms')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    userids = [f'{args.prefix}{i:07d}' for i in range(args.users)]
+    results = []
+    print(f"{'path':>14} {'clients':>8} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for path in args.path or ['/']:
+        for concurrency in args.concurrency:
+            result = asyncio.run(run_level(args.url, path, concurrency, args.duration, args.warmup,
+                                           userids, args.seed))
+            results.append(result)
+            print(f"{path:>14} {concurrency:>8} {result['requests']:>9} {result['errors']:>7} "
+                  f"{result['rps']:>8.1f} {result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f}")
+            sys.stdout.flush()
+
+    if args.p99_target is not None:
+        print(f"\nBest sustained rate with p99 under {args.p99_target:g} ms:")
+        for path in args.path or ['/']:
+            within = [r for r in results if r['path'] == path and not r['errors']
+                      and r['p99_ms'] <= args.p99_target]
+            best = max(within, key=lambda r: r['rps'], default=None)
+            if best is None:
+                print(f"  {path}: none")
+            else:
+                print(f"  {path}: {best['rps']:.1f} req/s ({best['concurrency']} clients, "
+                      f"p99 {best['p99_ms']:.1f} ms)")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""add transaction indexes
+
+Revision ID: 5119fe4899ee
+Revises: 81ac5a4e20b4
+Create Date: 2026-10-18 18:04:37.118093
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5119fe4899ee'
+down_revision = '81ac5a4e20b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('transaction', schema=None) as batch_op:
+        batch_op.create_index('ix_transaction_userid_timestamp', ['userid', 'timestamp'], unique=False)
+        batch_op.create_index('ix_transaction_userid_declined_timestamp', ['userid', 'is_declined', 'timestamp'], unique=False)
+        batch_op.create_index('ix_transaction_timestamp', ['timestamp'], unique=False)
+        batch_op.create_index('ix_transaction_status', ['is_approved', 'is_declined', 'is_fraudulent'], unique=False)
+        batch_op.create_index('ix_transaction_pending', ['timestamp'], unique=False,
+                              sqlite_where=sa.text('is_approved = 0 AND is_declined = 0'),
+                              postgresql_where=sa.text('NOT is_approved AND NOT is_declined'))
+
+
+def downgrade():
+    with op.batch_alter_table('transaction', schema=None) as batch_op:
+        batch_op.drop_index('ix_transaction_pending')
+        batch_op.drop_index('ix_transaction_status')
+        batch_op.drop_index('ix_transaction_timestamp')
+        batch_op.drop_index('ix_transaction_userid_declined_timestamp')
+        batch_op.drop_index('ix_transaction_userid_timestamp')
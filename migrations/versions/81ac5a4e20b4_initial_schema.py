@@ -0,0 +1,56 @@
+"""initial schema
+
+Revision ID: 81ac5a4e20b4
+Revises: 
+Create Date: 2026-10-18 18:02:11.402761
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '81ac5a4e20b4'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('username', sa.String(length=50), nullable=False),
+    sa.Column('userid', sa.String(length=50), nullable=False),
+    sa.Column('email', sa.String(length=120), nullable=False),
+    sa.Column('phone', sa.String(length=20), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('email'),
+    sa.UniqueConstraint('phone'),
+    sa.UniqueConstraint('userid'),
+    sa.UniqueConstraint('username')
+    )
+    op.create_table('transaction',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('userid', sa.String(length=50), nullable=False),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.Column('device_id', sa.String(length=50), nullable=False),
+    sa.Column('location', sa.String(length=100), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=False),
+    sa.Column('is_fraudulent', sa.Boolean(), nullable=True),
+    sa.Column('is_approved', sa.Boolean(), nullable=True),
+    sa.Column('is_declined', sa.Boolean(), nullable=True),
+    sa.Column('approval_timestamp', sa.DateTime(), nullable=True),
+    sa.Column('approval_notes', sa.Text(), nullable=True),
+    sa.Column('fraud_flags', sa.Text(), nullable=True),
+    sa.Column('approval_token', sa.String(length=100), nullable=True),
+    sa.Column('token_expiry', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['userid'], ['user.userid'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('approval_token')
+    )
+
+
+def downgrade():
+    op.drop_table('transaction')
+    op.drop_table('user')
@@ -0,0 +1,34 @@
+"""add user profile
+
+Revision ID: 9e2b7c4d8a51
+Revises: c3d94e7a1f20
+Create Date: 2026-10-18 19:20:44.031552
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e2b7c4d8a51'
+down_revision = 'c3d94e7a1f20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_profile',
+    sa.Column('userid', sa.String(length=50), nullable=False),
+    sa.Column('transaction_count', sa.Integer(), nullable=False),
+    sa.Column('amount_sum', sa.Float(), nullable=False),
+    sa.Column('location_counts', sa.JSON(), nullable=False),
+    sa.Column('recent_events', sa.JSON(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['userid'], ['user.userid'], ),
+    sa.PrimaryKeyConstraint('userid')
+    )
+    # Existing databases are backfilled with: flask profiles rebuild
+
+
+def downgrade():
+    op.drop_table('user_profile')
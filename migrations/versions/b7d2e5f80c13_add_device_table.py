@@ -0,0 +1,49 @@
+"""add device table
+
+Revision ID: b7d2e5f80c13
+Revises: e4f1a7c92b36
+Create Date: 2026-10-18 21:03:52.640117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d2e5f80c13'
+down_revision = 'e4f1a7c92b36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('device',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('fingerprint', sa.String(length=40), nullable=False),
+    sa.Column('browser', sa.String(length=100), nullable=False),
+    sa.Column('os', sa.String(length=100), nullable=False),
+    sa.Column('hardware', sa.String(length=100), nullable=False),
+    sa.Column('kind', sa.String(length=10), nullable=False),
+    sa.Column('first_seen', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('fingerprint')
+    )
+    with op.batch_alter_table('transaction', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('device_key', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_transaction_device_key_device', 'device', ['device_key'], ['id'])
+
+    with op.batch_alter_table('user_profile', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('device_counts', sa.JSON(), server_default='{}', nullable=False))
+    # Existing transactions only kept the raw User-Agent text, so they have no
+    # device key and profiles start without device counts
+
+
+def downgrade():
+    with op.batch_alter_table('user_profile', schema=None) as batch_op:
+        batch_op.drop_column('device_counts')
+
+    with op.batch_alter_table('transaction', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_transaction_device_key_device', type_='foreignkey')
+        batch_op.drop_column('device_key')
+
+    op.drop_table('device')
@@ -0,0 +1,50 @@
+"""add location table
+
+Revision ID: c5a9e3f17d42
+Revises: b7d2e5f80c13
+Create Date: 2026-10-18 21:48:15.902364
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5a9e3f17d42'
+down_revision = 'b7d2e5f80c13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('location',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.execute('INSERT INTO location (name) SELECT DISTINCT location FROM "transaction" ORDER BY location')
+
+    with op.batch_alter_table('transaction', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('location_code', sa.Integer(), nullable=True))
+    op.execute('UPDATE "transaction" SET location_code = '
+               '(SELECT location.id FROM location WHERE location.name = "transaction".location)')
+
+    with op.batch_alter_table('transaction', schema=None) as batch_op:
+        batch_op.alter_column('location_code', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_foreign_key('fk_transaction_location_code_location', 'location', ['location_code'], ['id'])
+        batch_op.drop_column('location')
+
+
+def downgrade():
+    with op.batch_alter_table('transaction', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('location', sa.String(length=100), nullable=True))
+    op.execute('UPDATE "transaction" SET location = '
+               '(SELECT location.name FROM location WHERE location.id = "transaction".location_code)')
+
+    with op.batch_alter_table('transaction', schema=None) as batch_op:
+        batch_op.alter_column('location', existing_type=sa.String(length=100), nullable=False)
+        batch_op.drop_constraint('fk_transaction_location_code_location', type_='foreignkey')
+        batch_op.drop_column('location_code')
+
+    op.drop_table('location')
@@ -0,0 +1,28 @@
+"""add notification claimed_at
+
+Revision ID: d8e3b61a4f25
+Revises: c5a9e3f17d42
+Create Date: 2026-10-18 22:14:37.208451
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8e3b61a4f25'
+down_revision = 'c5a9e3f17d42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('notification', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('claimed_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    # Rows a worker was sending when the schema was downgraded are sent again
+    op.execute("UPDATE notification SET status = 'pending' WHERE status = 'sending'")
+    with op.batch_alter_table('notification', schema=None) as batch_op:
+        batch_op.drop_column('claimed_at')
@@ -0,0 +1,206 @@
+"""add transaction flags
+
+Revision ID: e4f1a7c92b36
+Revises: 9e2b7c4d8a51
+Create Date: 2026-10-18 20:12:37.418906
+
+"""
+import json
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4f1a7c92b36'
+down_revision = '9e2b7c4d8a51'
+branch_labels = None
+depends_on = None
+
+
+# Flag codes (utils/flags.py) and the default messages (rules.json) as of this
+# revision, so the backfill doesn't change if either does later
+LEGACY_TEXT = 0
+MESSAGES = {
+    1: "Amount ${amount:,.2f} exceeds high-risk threshold ${high_risk_amount:,.2f}",
+    2: "Amount ${amount:,.2f} exceeds suspicious threshold ${suspicious_amount:,.2f}",
+    3: "Amount is {multiplier}x higher than user average (${avg_amount:.2f})",
+    4: "Multiple transactions from different locations within {window_minutes:g} minutes",
+    5: "Card declined {declined} times in last {window_minutes} minutes",
+    6: "High transaction frequency: {count} transactions in {window_minutes:g} minutes",
+    7: "Transaction from suspicious location: {location}",
+    32: "ML Model detected suspicious pattern (confidence: {confidence:.1%})",
+    33: "High risk factor: {feature} (contribution: +{contribution:.1%})",
+}
+RULE_CODES = range(1, 32)
+ML_PATTERN = 32
+AMOUNT = r'\$(?P<{}>[\d,]+\.\d\d)'
+NUMBER = r'(?P<{}>\d+(?:\.\d+)?)'
+PATTERNS = [
+    (1, rf"Amount {AMOUNT.format('amount')} exceeds high-risk threshold {AMOUNT.format('high_risk_amount')}"),
+    (2, rf"Amount {AMOUNT.format('amount')} exceeds suspicious threshold {AMOUNT.format('suspicious_amount')}"),
+    (3, rf"Amount is {NUMBER.format('multiplier')}x higher than user average \({AMOUNT.format('avg_amount')}\)"),
+    (4, rf"Multiple transactions from different locations within {NUMBER.format('window_minutes')} minutes"),
+    (5, rf"Card declined (?P<declined>\d+) times in last {NUMBER.format('window_minutes')} minutes"),
+    (6, rf"High transaction frequency: (?P<count>\d+) transactions in {NUMBER.format('window_minutes')} minutes"),
+    (7, r"Transaction from suspicious location: (?P<location>.*)"),
+    (32, rf"ML Model detected suspicious pattern \(confidence: {NUMBER.format('confidence')}%\)"),
+    (33, rf"High risk factor: (?P<feature>.+) \(contribution: \+{NUMBER.format('contribution')}%\)"),
+]
+PATTERNS = [(code, re.compile(pattern + '$')) for code, pattern in PATTERNS]
+
+
+def parse_number(text):
+    text = text.replace(',', '')
+    return float(text) if '.' in text else int(text)
+
+
+def parse_message(message):
+    """(code, params) for a message one of the known templates produced, or None"""
+    for code, pattern in PATTERNS:
+        match = pattern.match(message)
+        if match is None:
+            continue
+        params = {}
+        for name, value in match.groupdict().items():
+            if name in ('amount', 'location', 'feature'):
+                params[name] = value if name != 'amount' else parse_number(value)
+            elif name in ('confidence', 'contribution'):
+                params[name] = float(value) / 100
+            elif name in ('avg_amount', 'high_risk_amount', 'suspicious_amount'):
+                params[name] = float(value.replace(',', ''))
+            else:
+                params[name] = parse_number(value)
+        return code, params
+    return None
+
+
+def render(code, params, amount, location):
+    return MESSAGES[code].format(**{'amount': amount, 'location': location, **(params or {})})
+
+
+def parse_flags(messages, amount, location):
+    """
+    The (code, params) flags for a transaction's old fraud_flags list.
+    Only flags that render back to exactly the stored text are converted;
+    otherwise the whole list is kept verbatim as one legacy flag.
+    """
+    legacy = [(LEGACY_TEXT, {'messages': messages})]
+    flags = []
+    for message in messages:
+        if message.startswith('Detection method(s):'):
+            continue
+        parsed = parse_message(message)
+        if parsed is None:
+            return legacy
+        code, params = parsed
+        # The transaction's own amount and location aren't stored with a flag
+        params.pop('amount', None)
+        params.pop('location', None)
+        try:
+            if render(code, params, amount, location) != message:
+                return legacy
+        except (KeyError, ValueError):
+            return legacy
+        flags.append((code, params))
+    if flags and render_messages(flags, amount, location) != messages:
+        return legacy
+    return flags
+
+
+def render_messages(flags, amount, location):
+    if not flags:
+        return []
+    if flags[0][0] == LEGACY_TEXT:
+        return list(flags[0][1]['messages'])
+    methods = []
+    if any(code in RULE_CODES for code, _ in flags):
+        methods.append("Rule-based")
+    if any(code == ML_PATTERN for code, _ in flags):
+        methods.append("ML-based")
+    return ([f"Detection method(s): {' & '.join(methods)}"]
+            + [render(code, params, amount, location) for code, params in flags])
+
+
+def upgrade():
+    op.create_table('transaction_flag',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('transaction_id', sa.Integer(), nullable=False),
+    sa.Column('code', sa.SmallInteger(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=False),
+    sa.Column('params', sa.JSON(), nullable=True),
+    sa.ForeignKeyConstraint(['transaction_id'], ['transaction.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('transaction_flag', schema=None) as batch_op:
+        batch_op.create_index('ix_transaction_flag_code_timestamp', ['code', 'timestamp'], unique=False)
+        batch_op.create_index(batch_op.f('ix_transaction_flag_transaction_id'), ['transaction_id'], unique=False)
+
+    with op.batch_alter_table('transaction', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('flag_mask', sa.BigInteger(), server_default='0', nullable=False))
+
+    conn = op.get_bind()
+    transaction = sa.table('transaction',
+                           sa.column('id', sa.Integer), sa.column('amount', sa.Float),
+                           sa.column('location', sa.String), sa.column('timestamp', sa.DateTime),
+                           sa.column('fraud_flags', sa.Text), sa.column('flag_mask', sa.BigInteger))
+    transaction_flag = sa.table('transaction_flag',
+                                sa.column('transaction_id', sa.Integer), sa.column('code', sa.SmallInteger),
+                                sa.column('timestamp', sa.DateTime), sa.column('params', sa.JSON))
+    rows = conn.execute(sa.select(transaction.c.id, transaction.c.amount, transaction.c.location,
+                                  transaction.c.timestamp, transaction.c.fraud_flags)
+                        .where(transaction.c.fraud_flags.isnot(None))).fetchall()
+    for id, amount, location, timestamp, fraud_flags in rows:
+        try:
+            messages = json.loads(fraud_flags)
+        except ValueError:
+            messages = [fraud_flags]
+        if not messages:
+            continue
+        flags = parse_flags(messages, amount, location)
+        mask = 0
+        for code, _ in flags:
+            mask |= 1 << code
+        conn.execute(transaction.update().where(transaction.c.id == id).values(flag_mask=mask))
+        conn.execute(transaction_flag.insert(), [
+            {'transaction_id': id, 'code': code, 'timestamp': timestamp, 'params': params or None}
+            for code, params in flags
+        ])
+
+    with op.batch_alter_table('transaction', schema=None) as batch_op:
+        batch_op.drop_column('fraud_flags')
+
+
+def downgrade():
+    with op.batch_alter_table('transaction', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('fraud_flags', sa.Text(), nullable=True))
+
+    conn = op.get_bind()
+    transaction = sa.table('transaction',
+                           sa.column('id', sa.Integer), sa.column('amount', sa.Float),
+                           sa.column('location', sa.String), sa.column('fraud_flags', sa.Text))
+    transaction_flag = sa.table('transaction_flag',
+                                sa.column('id', sa.Integer), sa.column('transaction_id', sa.Integer),
+                                sa.column('code', sa.SmallInteger), sa.column('params', sa.JSON))
+    conn.execute(transaction.update().values(fraud_flags='[]'))
+    rows = conn.execute(sa.select(transaction.c.id, transaction.c.amount, transaction.c.location,
+                                  transaction_flag.c.code, transaction_flag.c.params)
+                        .join(transaction_flag, transaction_flag.c.transaction_id == transaction.c.id)
+                        .order_by(transaction.c.id, transaction_flag.c.id)).fetchall()
+    flags = {}
+    for id, amount, location, code, params in rows:
+        flags.setdefault((id, amount, location), []).append((code, params))
+    for (id, amount, location), pairs in flags.items():
+        pairs = [(code, params) for code, params in pairs if code == LEGACY_TEXT or code in MESSAGES]
+        conn.execute(transaction.update().where(transaction.c.id == id)
+                     .values(fraud_flags=json.dumps(render_messages(pairs, amount, location))))
+
+    with op.batch_alter_table('transaction', schema=None) as batch_op:
+        batch_op.drop_column('flag_mask')
+
+    with op.batch_alter_table('transaction_flag', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_transaction_flag_transaction_id'))
+        batch_op.drop_index('ix_transaction_flag_code_timestamp')
+
+    op.drop_table('transaction_flag')
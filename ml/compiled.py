@@ -0,0 +1,143 @@
+# Flat-array evaluator for the trained random forest
+import numpy as np
+
+
+class CompiledForest:
+    """
+    A fitted StandardScaler + RandomForestClassifier flattened into contiguous
+    node arrays, evaluated for all trees at once.
+
+    Every tree's nodes are concatenated; leaves point to themselves, so
+    stepping max_depth times from the roots lands every row on its leaf.
+    Results match sklearn bit for bit: inputs are scaled in float64, cast to
+    float32 like sklearn's tree code, and per-tree probabilities are summed in
+    estimator order before dividing by the number of trees.
+    """
+
+    def __init__(self, mean, scale, feature, threshold, left, right, value, roots, max_depth, classes,
+                 path_contributions, bias):
+        self.mean = mean
+        self.scale = scale
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.classes = classes
+        self.path_contributions = path_contributions
+        self.bias = bias
+
+    @classmethod
+    def from_sklearn(cls, model, scaler):
+        n_classes = len(model.classes_)
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+            is_leaf = tree.children_left < 0
+            own = np.arange(offset, offset + n_nodes)
+
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, 0.0, tree.threshold))
+            lefts.append(np.where(is_leaf, own, tree.children_left + offset))
+            rights.append(np.where(is_leaf, own, tree.children_right + offset))
+
+            # Same normalization DecisionTreeClassifier.predict_proba applies
+            value = tree.value[:, 0, :n_classes].astype(np.float64)
+            normalizer = value.sum(axis=1, keepdims=True)
+            normalizer[normalizer == 0.0] = 1.0
+            values.append(value / normalizer)
+
+            roots.append(offset)
+            offset += n_nodes
+
+        feature = np.concatenate(features).astype(np.intp)
+        left = np.concatenate(lefts).astype(np.intp)
+        right = np.concatenate(rights).astype(np.intp)
+        value = np.concatenate(values)
+        roots = np.asarray(roots, dtype=np.intp)
+        max_depth = max(estimator.tree_.max_depth for estimator in model.estimators_)
+        path_contributions, bias = path_contribution_table(
+            feature, left, right, value, roots, max_depth, model.n_features_in_)
+
+        return cls(
+            mean=np.asarray(scaler.mean_, dtype=np.float64),
+            scale=np.asarray(scaler.scale_, dtype=np.float64),
+            feature=feature,
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            left=left,
+            right=right,
+            value=value,
+            roots=roots,
+            max_depth=max_depth,
+            classes=model.classes_,
+            path_contributions=path_contributions,
+            bias=bias
+        )
+
+    def scale_features(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        return ((X - self.mean) / self.scale).astype(np.float32)
+
+    def leaves(self, X_scaled):
+        """Leaf reached in every tree, as an (n_trees, n_rows) array of node ids"""
+        n_rows = X_scaled.shape[0]
+        nodes = np.repeat(self.roots[:, None], n_rows, axis=1)
+        rows = np.arange(n_rows)
+        for _ in range(self.max_depth):
+            go_left = X_scaled[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    def predict_proba(self, X):
+        """Class probabilities for raw (unscaled) feature rows"""
+        leaves = self.leaves(self.scale_features(X))
+        # Summing over the leading axis adds the trees one after another,
+        # the same order sklearn accumulates them in
+        return self.value[leaves].sum(axis=0) / len(self.roots)
+
+    def predict(self, X):
+        """(predicted classes, class probabilities) from one traversal"""
+        probabilities = self.predict_proba(X)
+        return self.classes[np.argmax(probabilities, axis=1)], probabilities
+
+    def explain(self, X):
+        """
+        (predicted classes, class probabilities, contributions) from one traversal.
+        contributions[i, f] is feature f's share of row i's fraud probability:
+        bias + contributions[i].sum() equals probabilities[i, 1].
+        """
+        leaves = self.leaves(self.scale_features(X))
+        probabilities = self.value[leaves].sum(axis=0) / len(self.roots)
+        contributions = self.path_contributions[leaves].sum(axis=0) / len(self.roots)
+        return self.classes[np.argmax(probabilities, axis=1)], probabilities, contributions
+
+
+def path_contribution_table(feature, left, right, value, roots, max_depth, n_features):
+    """
+    Saabas-style attributions precomputed for every node: walking from the
+    root, each split credits its feature with the change in fraud probability
+    between the parent and the child taken. Explaining a prediction is then a
+    lookup of the leaves' rows. Also returns the bias, the forest's mean root
+    probability.
+    """
+    table = np.zeros((len(feature), n_features))
+    if value.shape[1] < 2:
+        # Single-class forest: the fraud probability never changes
+        return table, 0.0
+    fraud = value[:, 1]
+
+    frontier = roots
+    for _ in range(max_depth):
+        frontier = frontier[left[frontier] != frontier]  # internal nodes only
+        if not len(frontier):
+            break
+        for children in (left[frontier], right[frontier]):
+            table[children] = table[frontier]
+            table[children, feature[frontier]] += fraud[children] - fraud[frontier]
+        frontier = np.concatenate([left[frontier], right[frontier]])
+
+    return table, float(fraud[roots].mean())
@@ -1,70 +1,75 @@
 import numpy as np
-import pandas as pd
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler
 import joblib
-from datetime import datetime, timedelta
-import json
-import os
+from ml.compiled import CompiledForest
+from ml.features import FEATURE_NAMES, build_feature_matrix, records_to_columns
+
+# Forest hyperparameters; ml/tuning.py searches over these
+DEFAULT_PARAMS = {
+    'n_estimators': 100,
+    'max_depth': 10,
+    'min_samples_split': 5,
+    'min_samples_leaf': 2,
+}
 
 class FraudDetectionModel:
-    def __init__(self):
-        self.model = RandomForestClassifier(
-            n_estimators=100,
-            max_depth=10,
-            min_samples_split=5,
-            min_samples_leaf=2,
-            random_state=42
-        )
+    def __init__(self, **params):
+        # sklearn takes over a second to import; only pay for it when a model is built
+        from sklearn.ensemble import RandomForestClassifier
+        from sklearn.preprocessing import StandardScaler
+
+        self.params = {**DEFAULT_PARAMS, **params}
+        self.model = RandomForestClassifier(random_state=42, **self.params)
         self.scaler = StandardScaler()
+        self.compiled = None
+    
+    def compile(self):
+        """Flatten the fitted scaler and forest into arrays for fast inference"""
+        self.compiled = CompiledForest.from_sklearn(self.model, self.scaler)
+        return self.compiled
+    
+    def score_features(self, features):
+        """(predictions, class probabilities, fraud contributions) for a raw feature matrix"""
+        compiled = self.compiled or self.compile()
+        return compiled.explain(features)
+    
+    def single_row_features(self, transactions):
+        """Featurize each transaction on its own, as predict() does, in one vectorized call"""
+        columns = records_to_columns(transactions)
+        n = len(transactions)
+        return build_feature_matrix(
+            user_codes=np.arange(n),
+            amounts=columns['amounts'],
+            location_codes=np.zeros(n, dtype=np.int64),
+            timestamps=columns['timestamps']
+        )
         
     def prepare_features(self, transaction_data):
         """
         Prepare features from transaction data
         """
-        features = []
-        for transaction in transaction_data:
-            # Extract time-based features
-            transaction_time = datetime.strptime(transaction['timestamp'], '%Y-%m-%d %H:%M:%S')
-            hour = transaction_time.hour
-            day_of_week = transaction_time.weekday()
-            
-            # Calculate transaction frequency features
-            user_transactions = [t for t in transaction_data if t['userid'] == transaction['userid']]
-            recent_transactions = [t for t in user_transactions 
-                                if (transaction_time - datetime.strptime(t['timestamp'], '%Y-%m-%d %H:%M:%S')).days <= 7]
-            
-            avg_amount = np.mean([t['amount'] for t in user_transactions]) if user_transactions else 0
-            transaction_frequency = len(recent_transactions)
-            
-            # Location-based features
-            location_frequency = len([t for t in user_transactions if t['location'] == transaction['location']])
-            
-            # Combine features
-            feature_vector = [
-                transaction['amount'],
-                avg_amount,
-                transaction['amount'] / (avg_amount if avg_amount > 0 else 1),
-                transaction_frequency,
-                location_frequency,
-                hour,
-                day_of_week
-            ]
-            features.append(feature_vector)
-            
-        return np.array(features)
+        return build_feature_matrix(**records_to_columns(transaction_data))
     
     def train(self, transaction_data):
         """
         Train the Random Forest model
         """
+        labels = np.array([t['is_fraudulent'] for t in transaction_data])
+        return self.train_columns(records_to_columns(transaction_data), labels)
+    
+    def train_columns(self, columns, labels):
+        """
+        Train from columnar input: user_codes, amounts, location_codes and
+        epoch-second timestamps arrays (see ml.features.build_feature_matrix)
+        """
+        from sklearn.model_selection import train_test_split
+
         # Prepare features and labels
-        X = self.prepare_features(transaction_data)
-        y = np.array([t['is_fraudulent'] for t in transaction_data])
+        X = build_feature_matrix(**columns)
+        y = np.asarray(labels, dtype=bool)
         
         # Split the data
         X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+        del X
         
         # Scale features
         X_train_scaled = self.scaler.fit_transform(X_train)
@@ -72,6 +77,7 @@ class FraudDetectionModel:
         
         # Train model
         self.model.fit(X_train_scaled, y_train)
+        self.compile()
         
         # Calculate accuracy
         train_accuracy = self.model.score(X_train_scaled, y_train)
@@ -86,51 +92,65 @@ class FraudDetectionModel:
         """
         Predict if a transaction is fraudulent
         """
-        # Prepare single transaction features
-        features = self.prepare_features([transaction])
-        features_scaled = self.scaler.transform(features)
-        
-        # Get prediction and probability
-        prediction = self.model.predict(features_scaled)[0]
-        probability = self.model.predict_proba(features_scaled)[0]
-        
-        # Get feature importance for explanation
-        feature_importance = dict(zip(
-            ['amount', 'avg_amount', 'amount_ratio', 'transaction_freq', 
-             'location_freq', 'hour', 'day_of_week'],
-            self.model.feature_importances_
-        ))
-        
-        return {
-            'is_fraudulent': bool(prediction),
-            'confidence': float(probability[1]),  # Probability of fraud
-            'feature_importance': feature_importance
-        }
+        return self.predict_batch([transaction])[0]
+    
+    def predict_batch(self, transactions):
+        """
+        Predict a batch of transactions with one vectorized forest call.
+        Each transaction is featurized on its own, exactly as predict() does.
+        feature_contributions attributes the fraud probability to the features
+        of that transaction (see CompiledForest.explain).
+        """
+        if not transactions:
+            return []
+        return self.build_results(self.single_row_features(transactions))
     
-    def save_model(self, filepath=None):
-        """Save the trained model"""
-        if filepath is None:
-            # Get the directory of the current file
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            filepath = os.path.join(current_dir, 'random_forest_model.pkl')
+    def build_results(self, features):
+        predictions, probabilities, contributions = self.score_features(features)
+        return [
+            {
+                'is_fraudulent': bool(prediction),
+                'confidence': float(probability[1]),  # Probability of fraud
+                'feature_contributions': dict(zip(FEATURE_NAMES, contribution.tolist()))
+            }
+            for prediction, probability, contribution in zip(predictions, probabilities, contributions)
+        ]
+    
+    def explain(self, transaction):
+        """
+        Explain one prediction: the fraud probability split into the model's
+        bias (average fraud rate) plus a contribution per feature
+        """
+        return self.explain_batch([transaction])[0]
+    
+    def explain_batch(self, transactions):
+        """explain() for many transactions in one vectorized call"""
+        if not transactions:
+            return []
         
+        features = self.single_row_features(transactions)
+        results = self.build_results(features)
+        for result, row in zip(results, features):
+            result['bias'] = self.compiled.bias
+            result['features'] = dict(zip(FEATURE_NAMES, row.tolist()))
+        return results
+    
+    def save_model(self, filepath):
+        """Save the trained model (use ModelRegistry.publish to make it servable)"""
         joblib.dump({
             'model': self.model,
             'scaler': self.scaler
         }, filepath)
         print(f"Model saved to {filepath}")
     
-    def load_model(self, filepath=None):
+    def load_model(self, filepath):
         """Load a trained model"""
-        if filepath is None:
-            # Get the directory of the current file
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            filepath = os.path.join(current_dir, 'random_forest_model.pkl')
-        
         try:
             saved_model = joblib.load(filepath)
             self.model = saved_model['model']
             self.scaler = saved_model['scaler']
+            self.params = {name: self.model.get_params()[name] for name in DEFAULT_PARAMS}
+            self.compile()
             print(f"Model loaded from {filepath}")
         except Exception as e:
             print(f"Error loading model: {str(e)}")
@@ -0,0 +1,182 @@
+# Versioned store of trained models
+import hashlib
+import json
+import os
+import tempfile
+from datetime import datetime, timezone
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+# Layout:
+#   <root>/current                   name of the active version (replaced atomically)
+#   <root>/versions/<version>/model.pkl
+#   <root>/versions/<version>/metadata.json
+MODEL_FILENAME = 'model.pkl'
+METADATA_FILENAME = 'metadata.json'
+POINTER_FILENAME = 'current'
+
+
+def file_checksum(filepath):
+    """SHA-256 of a file, as a hex string"""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    """Directory of immutable, versioned model artifacts plus a 'current' pointer"""
+
+    def __init__(self, root):
+        self.root = root
+        self.versions_dir = os.path.join(root, 'versions')
+        self.pointer_path = os.path.join(root, POINTER_FILENAME)
+
+    def version_dir(self, version):
+        return os.path.join(self.versions_dir, version)
+
+    def versions(self):
+        """All published versions, oldest first"""
+        if not os.path.isdir(self.versions_dir):
+            return []
+        return sorted(name for name in os.listdir(self.versions_dir)
+                      if os.path.exists(os.path.join(self.versions_dir, name, METADATA_FILENAME)))
+
+    def next_version(self):
+        numbers = [int(name[1:]) for name in os.listdir(self.versions_dir)
+                   if name.startswith('v') and name[1:].isdigit()]
+        return f"v{max(numbers, default=0) + 1:04d}"
+
+    def metadata(self, version):
+        with open(os.path.join(self.version_dir(version), METADATA_FILENAME), encoding='utf-8') as f:
+            return json.load(f)
+
+    def current_version(self):
+        """The active version, or None when nothing was promoted yet"""
+        try:
+            with open(self.pointer_path, encoding='utf-8') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def set_current(self, version):
+        """Atomically point 'current' at a published version"""
+        if version not in self.versions():
+            raise ValueError(f"Unknown model version: {version}")
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix='.current-')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(version + '\n')
+        os.replace(tmp_path, self.pointer_path)
+
+    def publish(self, model, metrics=None, promote=True, **extra):
+        """
+        Store a trained FraudDetectionModel as a new version.
+        The artifact is written to a scratch directory and renamed into place,
+        so readers never see a partially written version.
+        Returns the new version name.
+        """
+        import sklearn
+        from ml.features import FEATURE_NAMES
+
+        os.makedirs(self.versions_dir, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=self.versions_dir, prefix='.staging-')
+        model_path = os.path.join(staging, MODEL_FILENAME)
+        model.save_model(model_path)
+
+        metadata = {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'feature_names': list(FEATURE_NAMES),
+            'metrics': metrics or {},
+            'checksum': file_checksum(model_path),
+            'sklearn_version': sklearn.__version__,
+        }
+        metadata.update(extra)
+
+        while True:
+            version = self.next_version()
+            metadata['version'] = version
+            with open(os.path.join(staging, METADATA_FILENAME), 'w', encoding='utf-8') as f:
+                json.dump(metadata, f, indent=2)
+            try:
+                os.rename(staging, self.version_dir(version))
+                break
+            except OSError:
+                # Another publisher took this version name first
+                if not os.path.isdir(self.version_dir(version)):
+                    raise
+
+        if promote:
+            self.set_current(version)
+        return version
+
+    def load(self, version):
+        """
+        Load a version, checking its checksum and that it was trained on the
+        features this code computes.
+        Returns (model, metadata).
+        """
+        from ml.features import FEATURE_NAMES
+        from ml.random_forest_model import FraudDetectionModel
+
+        metadata = self.metadata(version)
+        model_path = os.path.join(self.version_dir(version), MODEL_FILENAME)
+        if file_checksum(model_path) != metadata['checksum']:
+            raise ValueError(f"Checksum mismatch for model {version}")
+        if metadata['feature_names'] != list(FEATURE_NAMES):
+            raise ValueError(f"Model {version} was trained on features {metadata['feature_names']}")
+
+        model = FraudDetectionModel()
+        model.load_model(model_path)
+        return model, metadata
+
+
+def get_registry():
+    return ModelRegistry(current_app.config['ML_MODEL_REGISTRY'])
+
+
+model_cli = AppGroup('model', help='Manage the versioned ML model registry.')
+
+
+@model_cli.command('list')
+def list_command():
+    """List published model versions"""
+    registry = get_registry()
+    current = registry.current_version()
+    for version in registry.versions():
+        metadata = registry.metadata(version)
+        marker = '*' if version == current else ' '
+        metrics = ', '.join(f"{k}={v:.4f}" if isinstance(v, float) else f"{k}={v}"
+                            for k, v in metadata['metrics'].items())
+        click.echo(f"{marker} {version}  {metadata['created_at']}  {metrics}")
+
+
+@model_cli.command('promote')
+@click.argument('version')
+def promote_command(version):
+    """Make VERSION the model workers serve"""
+    try:
+        get_registry().set_current(version)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Current model is now {version}")
+
+
+@model_cli.command('import')
+@click.argument('filepath', type=click.Path(exists=True, dir_okay=False))
+@click.option('--no-promote', is_flag=True, help='Publish without making it current')
+def import_command(filepath, no_promote):
+    """Publish a model pickle saved by FraudDetectionModel.save_model"""
+    from ml.features import FEATURE_NAMES
+    from ml.random_forest_model import FraudDetectionModel
+
+    model = FraudDetectionModel()
+    model.load_model(filepath)
+    if model.model.n_features_in_ != len(FEATURE_NAMES):
+        raise click.ClickException(
+            f"{filepath} expects {model.model.n_features_in_} features, not {len(FEATURE_NAMES)}")
+    version = get_registry().publish(model, promote=not no_promote,
+                                     source=os.path.basename(filepath))
+    click.echo(f"Published {filepath} as {version}")
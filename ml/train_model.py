@@ -6,69 +6,152 @@ import sys
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(project_root)
 
+from ml.features import CategoryCodes, epoch_seconds
 from ml.random_forest_model import FraudDetectionModel
+from ml.registry import ModelRegistry
+from ml.tuning import OBJECTIVES, candidates, format_results, search as search_params
 from flask import Flask
 from config import Config
 from models import db
 from models.transaction import Transaction
-import json
+import argparse
+import zlib
 from datetime import datetime
+import numpy as np
 
 app = Flask(__name__)
 app.config.from_object(Config)
 db.init_app(app)
 
-def get_historical_transactions():
-    """Get historical transactions from database"""
-    transactions = Transaction.query.all()
-    transaction_data = []
-    
-    for t in transactions:
-        transaction_data.append({
-            'userid': t.userid,
-            'amount': float(t.amount),
-            'location': t.location,
-            'timestamp': t.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-            'is_fraudulent': t.is_fraudulent,
-            'device_id': t.device_id
-        })
-    
-    return transaction_data
+CHUNK_SIZE = 50_000
 
-def train_and_save_model():
-    """Train and save the Random Forest model"""
+
+def in_sample(userids, sample, seed=0):
+    """Keep a stable `sample` fraction of users (all of their transactions, so per-user features stay exact)"""
+    threshold = int(sample * 2**32)
+    salt = f'{seed}:'.encode()
+    return np.fromiter((zlib.crc32(salt + userid.encode()) < threshold for userid in userids),
+                       dtype=bool, count=len(userids))
+
+
+def load_training_columns(start=None, end=None, sample=None, seed=0, chunk_size=CHUNK_SIZE):
+    """
+    Stream labelled transactions into typed column arrays for training.
+    Rows are fetched chunk by chunk from a Core select and written straight
+    into preallocated buffers: user and location codes, float amounts and
+    epoch-second timestamps. start/end limit the time range; sample keeps
+    that fraction of users. Location codes are the location table's ids.
+    Returns (columns, labels).
+    """
+    criteria = []
+    if start is not None:
+        criteria.append(Transaction.timestamp >= start)
+    if end is not None:
+        criteria.append(Transaction.timestamp < end)
+
+    users = CategoryCodes()
+    query = db.select(
+        Transaction.userid,
+        Transaction.amount,
+        Transaction.location_code,
+        # Raw values: numpy parses SQLite's ISO strings far faster than row-by-row datetimes
+        db.type_coerce(Transaction.timestamp, db.String),
+        Transaction.is_fraudulent
+    ).where(*criteria)
+
+    filled = 0
+    with db.engine.connect() as connection, connection.begin():
+        # Upper bound for the buffers, in the same read transaction as the
+        # rows; sampling only leaves them partly filled
+        total = connection.execute(db.select(db.func.count(Transaction.id)).where(*criteria)).scalar()
+        user_codes = np.empty(total, dtype=np.int64)
+        amounts = np.empty(total, dtype=np.float64)
+        location_codes = np.empty(total, dtype=np.int64)
+        timestamps = np.empty(total, dtype=np.int64)
+        labels = np.empty(total, dtype=bool)
+
+        result = connection.execution_options(stream_results=True, yield_per=chunk_size).execute(query)
+        for rows in result.partitions():
+            chunk_userids, chunk_amounts, chunk_locations, chunk_timestamps, chunk_labels = zip(*rows)
+            keep = in_sample(chunk_userids, sample, seed) if sample is not None else slice(None)
+            chunk_user_codes = users.encode(chunk_userids)[keep]
+            n = len(chunk_user_codes)
+            window = slice(filled, filled + n)
+            user_codes[window] = chunk_user_codes
+            amounts[window] = np.asarray(chunk_amounts, dtype=np.float64)[keep]
+            location_codes[window] = np.asarray(chunk_locations, dtype=np.int64)[keep]
+            timestamps[window] = epoch_seconds(chunk_timestamps)[keep]
+            labels[window] = np.asarray(chunk_labels, dtype=bool)[keep]
+            filled += n
+
+    columns = {
+        'user_codes': user_codes[:filled],
+        'amounts': amounts[:filled],
+        'location_codes': location_codes[:filled],
+        'timestamps': timestamps[:filled]
+    }
+    return columns, labels[:filled]
+
+
+def train_and_save_model(start=None, end=None, sample=None, seed=0, search=False, n_jobs=None, folds=4,
+                         objective='precision_per_us'):
+    """
+    Train and save the Random Forest model. With search, the hyperparameters
+    are picked by a cross-validated sweep (ml/tuning.py) first.
+    """
     with app.app_context():
         print("Starting model training process...")
         
         # Get historical transaction data
-        transaction_data = get_historical_transactions()
+        columns, labels = load_training_columns(start, end, sample, seed)
         
-        if not transaction_data:
+        if not len(labels):
             print("No historical transaction data found.")
             return
         
-        print(f"Training model with {len(transaction_data)} transactions...")
-        print("Sample transaction:", transaction_data[0])
+        print(f"Training model with {len(labels)} transactions "
+              f"({int(labels.sum())} fraudulent, {len(np.unique(columns['user_codes']))} users)...")
+        
+        extra = {'training_rows': len(labels)}
+        params = {}
+        if search:
+            print(f"Searching {len(candidates())} candidates over {folds} time-ordered folds...")
+            results = search_params(columns, labels, n_folds=folds, n_jobs=n_jobs, objective=objective)
+            print(format_results(results))
+            params = results[0]['params']
+            print(f"Best by {objective}: {params}")
+            extra['search'] = {'objective': objective, 'folds': folds, 'results': results}
         
         # Initialize and train model
-        model = FraudDetectionModel()
-        metrics = model.train(transaction_data)
+        model = FraudDetectionModel(**params)
+        metrics = model.train_columns(columns, labels)
         
         print("Training completed!")
         print(f"Training accuracy: {metrics['train_accuracy']:.2%}")
         print(f"Test accuracy: {metrics['test_accuracy']:.2%}")
         
-        # Save the trained model
-        model.save_model()
-        print("Model saved successfully!")
-        
-        # Verify the model file exists
-        model_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'random_forest_model.pkl')
-        if os.path.exists(model_path):
-            print(f"Model file verified at: {model_path}")
-            print(f"File size: {os.path.getsize(model_path)} bytes")
-        else:
-            print("Warning: Model file not found after saving!")
+        # Publish the trained model; running workers pick it up on their next poll
+        registry = ModelRegistry(app.config['ML_MODEL_REGISTRY'])
+        extra['params'] = model.params
+        if start is not None or end is not None:
+            extra['training_range'] = [start and start.isoformat(), end and end.isoformat()]
+        if sample is not None:
+            extra['training_sample'] = sample
+        version = registry.publish(model, metrics, **extra)
+        print(f"Model published as {version}")
+        print(f"Model file: {os.path.join(registry.version_dir(version), 'model.pkl')}")
 
 if __name__ == "__main__":
-    train_and_save_model()
+    parser = argparse.ArgumentParser(description="Train the fraud model on the transaction history")
+    parser.add_argument('--since', type=datetime.fromisoformat, help='Only transactions at or after this time')
+    parser.add_argument('--until', type=datetime.fromisoformat, help='Only transactions before this time')
+    parser.add_argument('--sample', type=float, help='Fraction of users to train on (0-1)')
+    parser.add_argument('--seed', type=int, default=0, help='Which users --sample picks')
+    parser.add_argument('--search', action='store_true', help='Pick hyperparameters with a cross-validated sweep')
+    parser.add_argument('--n-jobs', type=int, help='Worker processes for --search (default: all cores)')
+    parser.add_argument('--folds', type=int, default=4, help='Time-ordered folds for --search')
+    parser.add_argument('--objective', choices=OBJECTIVES, default='precision_per_us',
+                        help='What --search maximizes')
+    args = parser.parse_args()
+    train_and_save_model(args.since, args.until, args.sample, args.seed, args.search, args.n_jobs, args.folds,
+                         args.objective)
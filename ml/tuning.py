@@ -0,0 +1,183 @@
+# Hyperparameter search for the fraud forest with time-ordered cross-validation
+import itertools
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from ml.compiled import CompiledForest
+from ml.features import build_feature_matrix, build_features_against
+
+# Candidates are every combination of these values
+PARAM_GRID = {
+    'n_estimators': [25, 50, 100, 200],
+    'max_depth': [6, 10, 14],
+    'min_samples_leaf': [2, 8],
+}
+OBJECTIVES = ['precision_per_us', 'precision', 'recall', 'accuracy']
+LATENCY_ROWS = 200  # single-row predictions timed per candidate
+
+# Input columns, as taken by build_feature_matrix
+COLUMNS = ['user_codes', 'amounts', 'location_codes', 'timestamps']
+# Each fold's feature matrices and labels, built once by search() and
+# memory-mapped by every worker process as fold<k>_<name>
+FOLD_ARRAYS = ['X_train', 'y_train', 'X_test', 'y_test']
+_shared = {}
+
+
+def candidates(grid=None):
+    """Every parameter combination in the grid, as dicts"""
+    grid = grid or PARAM_GRID
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def time_folds(n, n_folds):
+    """
+    Expanding-window folds over rows sorted by time: the data is cut into
+    n_folds + 1 consecutive blocks and fold k trains on blocks 0..k and
+    tests on block k + 1, so a model is never scored on data older than
+    what it learned from. Returns (train, test) position ranges.
+    """
+    bounds = np.linspace(0, n, n_folds + 2).astype(int)
+    return [(slice(0, bounds[k + 1]), slice(bounds[k + 1], bounds[k + 2])) for k in range(n_folds)]
+
+
+def fold_matrices(columns, labels, n_folds):
+    """
+    Yield each fold's arrays as a dict of FOLD_ARRAYS. The training features
+    are built from the train window alone and each test row is featurized
+    against that window, so no feature sees data from after the fold's
+    cutoff. Test rows are in time order.
+    """
+    columns = {name: np.asarray(columns[name]) for name in COLUMNS}
+    labels = np.asarray(labels, dtype=bool)
+    order = np.argsort(columns['timestamps'], kind='stable')
+    for train, test in time_folds(len(order), n_folds):
+        train_rows, test_rows = np.sort(order[train]), order[test]
+        history = {name: values[train_rows] for name, values in columns.items()}
+        yield {
+            'X_train': build_feature_matrix(**history),
+            'y_train': labels[train_rows],
+            'X_test': build_features_against(history, {name: values[test_rows] for name, values in columns.items()}),
+            'y_test': labels[test_rows],
+        }
+
+
+def open_shared(directory):
+    """Process pool initializer: map the fold arrays written by search() read-only"""
+    for filename in os.listdir(directory):
+        name, extension = os.path.splitext(filename)
+        if extension == '.npy':
+            _shared[name] = np.load(os.path.join(directory, filename), mmap_mode='r')
+
+
+def fit_fold(params, fold, n_folds):
+    """
+    Train on one fold's shared matrices and score its test block; the last
+    fold also returns its compiled forest. The forest gets the same
+    parameters FraudDetectionModel(**params) would train with.
+    """
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.metrics import accuracy_score, precision_score, recall_score
+    from sklearn.preprocessing import StandardScaler
+    from ml.random_forest_model import DEFAULT_PARAMS
+
+    X_train, y_train, X_test, y_test = (_shared[f'fold{fold}_{name}'] for name in FOLD_ARRAYS)
+
+    scaler = StandardScaler()
+    model = RandomForestClassifier(random_state=42, n_jobs=1, **{**DEFAULT_PARAMS, **params})
+    started = time.perf_counter()
+    model.fit(scaler.fit_transform(X_train), y_train)
+    fit_seconds = time.perf_counter() - started
+
+    predicted = model.predict(scaler.transform(X_test))
+    result = {
+        'accuracy': accuracy_score(y_test, predicted),
+        'precision': precision_score(y_test, predicted, zero_division=0),
+        'recall': recall_score(y_test, predicted, zero_division=0),
+        'fit_seconds': fit_seconds,
+    }
+    compiled = CompiledForest.from_sklearn(model, scaler) if fold == n_folds - 1 else None
+    return result, compiled
+
+
+def single_row_latency(compiled, X):
+    """Median microseconds to score one row the way FraudDetectionModel.predict does"""
+    timings = []
+    for i in range(len(X)):
+        row = X[i:i + 1]
+        started = time.perf_counter()
+        compiled.explain(row)
+        timings.append(time.perf_counter() - started)
+    return float(np.median(timings) * 1e6)
+
+
+def search(columns, labels, grid=None, n_folds=4, n_jobs=None, objective='precision_per_us'):
+    """
+    Cross-validate every candidate in the grid on time-ordered folds, with
+    (candidate, fold) fits spread over n_jobs processes. Each fold's feature
+    matrices are built once (see fold_matrices) and written to temporary
+    .npy files that every worker memory-maps, rather than being pickled to
+    or rebuilt by each task.
+
+    Returns one dict per candidate, best first by objective: its params,
+    mean accuracy / precision / recall over the folds, fit time, the median
+    single-row inference latency in microseconds (timed here, one candidate
+    at a time, so workers don't skew it) and precision_per_us.
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Unknown objective: {objective}")
+    params_list = candidates(grid)
+
+    directory = tempfile.mkdtemp(prefix='fraudguard-search-')
+    try:
+        for fold, arrays in enumerate(fold_matrices(columns, labels, n_folds)):
+            for name, values in arrays.items():
+                np.save(os.path.join(directory, f'fold{fold}_{name}.npy'), values)
+        # The newest rows, from the last fold's test block
+        latency_rows = arrays['X_test'][-LATENCY_ROWS:].copy()
+        del arrays
+
+        # Fresh interpreters: forking a process that runs Flask or DB threads isn't safe
+        with ProcessPoolExecutor(max_workers=n_jobs or os.cpu_count(),
+                                 mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=open_shared, initargs=(directory,)) as executor:
+            futures = {
+                (i, fold): executor.submit(fit_fold, params, fold, n_folds)
+                for i, params in enumerate(params_list) for fold in range(n_folds)
+            }
+            outcomes = {key: future.result() for key, future in futures.items()}
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    results = []
+    for i, params in enumerate(params_list):
+        folds = [outcomes[(i, fold)][0] for fold in range(n_folds)]
+        result = {'params': params}
+        for metric in ('accuracy', 'precision', 'recall', 'fit_seconds'):
+            result[metric] = float(np.mean([fold[metric] for fold in folds]))
+        result['latency_us'] = single_row_latency(outcomes[(i, n_folds - 1)][1], latency_rows)
+        result['precision_per_us'] = result['precision'] / result['latency_us']
+        results.append(result)
+
+    results.sort(key=lambda result: result[objective], reverse=True)
+    return results
+
+
+def format_results(results):
+    """The search results as a text table, in the given order"""
+    names = list(results[0]['params']) if results else []
+    header = names + ['accuracy', 'precision', 'recall', 'latency_us', 'prec/us']
+    lines = ['  '.join(f'{name:>12}' for name in header)]
+    for result in results:
+        values = [str(result['params'][name]) for name in names] + [
+            f"{result['accuracy']:.4f}", f"{result['precision']:.4f}", f"{result['recall']:.4f}",
+            f"{result['latency_us']:.1f}", f"{result['precision_per_us']:.5f}"
+        ]
+        lines.append('  '.join(f'{value:>12}' for value in values))
+    return '\n'.join(lines)
@@ -0,0 +1,15 @@
+# Device dimension: each distinct parsed user agent, stored once (see utils/device_info.py)
+from models import db
+from datetime import datetime, timezone
+
+class Device(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    fingerprint = db.Column(db.String(40), unique=True, nullable=False)  # sha1 of the parsed fields
+    browser = db.Column(db.String(100), nullable=False)  # family and major version, e.g. 'Chrome 120'
+    os = db.Column(db.String(100), nullable=False)
+    hardware = db.Column(db.String(100), nullable=False)  # device family, e.g. 'iPhone'; 'Other' for PCs
+    kind = db.Column(db.String(10), nullable=False)  # pc, mobile, tablet, bot or other
+    first_seen = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f'<Device {self.id}: {self.browser} / {self.os} / {self.hardware}>'
@@ -0,0 +1,78 @@
+# Location dimension: each city name stored once, referenced by a small integer code
+import threading
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db
+
+class Location(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+
+    def __repr__(self):
+        return f'<Location {self.id}: {self.name}>'
+
+
+# name <-> code for every location this process has seen; locations are few
+_codes = {}
+_names = {}
+_lock = threading.Lock()
+
+
+def _remember(rows):
+    with _lock:
+        for code, name in rows:
+            _codes[name] = code
+            _names[code] = name
+
+
+def location_code(name):
+    """
+    The code of a location name, inserting it if it is new. A new name is
+    inserted in its own short transaction, so that happens before the
+    session writes anything (on SQLite the session's write lock would block it).
+    """
+    code = _codes.get(name)
+    if code is not None:
+        return code
+    table = Location.__table__
+    query = db.select(table.c.id).where(table.c.name == name)
+    # Reads go through the session, which may already hold the database lock;
+    # without flushing, so pending rows don't take it
+    with db.session.no_autoflush:
+        code = db.session.execute(query).scalar()
+    if code is None:
+        try:
+            with db.engine.begin() as connection:
+                code = connection.execute(table.insert().values(name=name)).inserted_primary_key[0]
+        except IntegrityError:
+            # Another worker inserted it first
+            with db.engine.begin() as connection:
+                code = connection.execute(query).scalar_one()
+    _remember([(code, name)])
+    return code
+
+
+def location_name(code):
+    """The name of a location code"""
+    name = _names.get(code)
+    if name is None:
+        with db.session.no_autoflush:
+            _remember(db.session.execute(db.select(Location.__table__.c.id, Location.__table__.c.name)))
+        name = _names[code]
+    return name
+
+
+def location_names(codes):
+    """Names for a sequence of location codes, in order"""
+    missing = set(codes) - _names.keys()
+    if missing:
+        location_name(missing.pop())  # reloads them all
+    return [_names[code] for code in codes]
+
+
+def forget_locations():
+    """Drop the cached codes, e.g. after the location table was emptied"""
+    with _lock:
+        _codes.clear()
+        _names.clear()
@@ -1,33 +1,83 @@
 # Transaction model
 from models import db  # Import db from models/__init__.py
+from models.device import Device
+from models.location import Location, location_code, location_name
+from models.transaction_flag import TransactionFlag
 from datetime import datetime, timezone, timedelta
 import secrets
+from sqlalchemy.ext.hybrid import hybrid_property
 
 class Transaction(db.Model):
+    __table_args__ = (
+        # History fetch, recent-transaction windows and per-user ordering
+        db.Index('ix_transaction_userid_timestamp', 'userid', 'timestamp'),
+        # Rule 4: declined transactions per user in a time window
+        db.Index('ix_transaction_userid_declined_timestamp', 'userid', 'is_declined', 'timestamp'),
+        # Admin listing, newest first
+        db.Index('ix_transaction_timestamp', 'timestamp'),
+        # Admin status counts can be answered from this index alone
+        db.Index('ix_transaction_status', 'is_approved', 'is_declined', 'is_fraudulent'),
+        # Pending review queue (neither approved nor declined)
+        db.Index(
+            'ix_transaction_pending', 'timestamp',
+            sqlite_where=db.text('is_approved = 0 AND is_declined = 0'),
+            postgresql_where=db.text('NOT is_approved AND NOT is_declined')
+        ),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     userid = db.Column(db.String(50), db.ForeignKey('user.userid'), nullable=False)
     amount = db.Column(db.Float, nullable=False)
-    device_id = db.Column(db.String(50), nullable=False)
-    location = db.Column(db.String(100), nullable=False)
+    device_id = db.Column(db.String(50), nullable=False)  # readable device label
+    device_key = db.Column(db.Integer, db.ForeignKey('device.id'), nullable=True)  # parsed, interned device
+    location_code = db.Column(db.Integer, db.ForeignKey('location.id'), nullable=False)  # see models/location.py
     timestamp = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
     is_fraudulent = db.Column(db.Boolean, default=False)
     is_approved = db.Column(db.Boolean, default=False)
     is_declined = db.Column(db.Boolean, default=False)
     approval_timestamp = db.Column(db.DateTime, nullable=True)
     approval_notes = db.Column(db.Text, nullable=True)
-    fraud_flags = db.Column(db.Text, nullable=True)  # Store reasons for flagging
+    # Bit 1 << code for each flag raised (codes in utils/flags.py); details in TransactionFlag
+    flag_mask = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
     approval_token = db.Column(db.String(100), unique=True, nullable=True)
     token_expiry = db.Column(db.DateTime, nullable=True)
 
+    flags = db.relationship(TransactionFlag, order_by=TransactionFlag.id, cascade='all, delete-orphan')
+    device = db.relationship(Device)
+
     def __repr__(self):
         return f'<Transaction {self.id}: ${self.amount} by {self.userid}>'
 
+    @hybrid_property
+    def location(self):
+        """The location name; rows store its code"""
+        return location_name(self.location_code) if self.location_code is not None else None
+
+    @location.setter
+    def location(self, name):
+        self.location_code = location_code(name)
+
+    @location.expression
+    def location(cls):
+        return db.select(Location.name).where(Location.id == cls.location_code).scalar_subquery()
+
     def generate_approval_token(self):
         """Generate a unique token for transaction approval"""
         self.approval_token = secrets.token_urlsafe(32)
         self.token_expiry = datetime.now(timezone.utc) + timedelta(hours=24)
         return self.approval_token
 
+    def set_flags(self, flags):
+        """Record (code, params) fraud flags, in the order they were raised; set the timestamp first"""
+        self.flag_mask = 0
+        for code, _ in flags:
+            self.flag_mask |= 1 << code
+        self.flags = [TransactionFlag(code=code, params=params or None, timestamp=self.timestamp)
+                      for code, params in flags]
+
+    def flag_pairs(self):
+        return [(flag.code, flag.params) for flag in self.flags]
+
     @classmethod
     def get_user_recent_transactions(cls, userid, minutes=5):
         """Get user's transactions in the last X minutes"""
@@ -56,3 +106,55 @@ class Transaction(db.Model):
         ).scalar()
         return result or 0.0
 
+    @classmethod
+    def status_filter(cls, status):
+        """SQL criterion for an admin status filter (pending, approved, declined, fraudulent)"""
+        # Literal true()/false() let SQLite match the partial ix_transaction_pending index
+        if status == 'pending':
+            return db.and_(cls.is_approved == db.false(), cls.is_declined == db.false())
+        if status == 'approved':
+            return cls.is_approved == db.true()
+        if status == 'declined':
+            return cls.is_declined == db.true()
+        if status == 'fraudulent':
+            return cls.is_fraudulent == db.true()
+        raise ValueError(f"Unknown status: {status}")
+
+    @classmethod
+    def get_status_counts(cls, *criteria):
+        """Total, fraudulent, approved, declined and pending counts in a single pass"""
+        def count_where(condition):
+            return db.func.coalesce(db.func.sum(db.case((condition, 1), else_=0)), 0)
+
+        row = db.session.query(
+            db.func.count(cls.id),
+            count_where(cls.status_filter('fraudulent')),
+            count_where(cls.status_filter('approved')),
+            count_where(cls.status_filter('declined')),
+            count_where(cls.status_filter('pending'))
+        ).filter(*criteria).one()
+
+        return dict(zip(['total', 'fraudulent', 'approved', 'declined', 'pending'], row))
+
+    @classmethod
+    def get_page(cls, *criteria, before=None, after=None, per_page=50):
+        """
+        Keyset page of transactions ordered newest first on (timestamp, id).
+        before/after are (timestamp, id) cursors of the last/first row of the
+        neighbouring page. Returns (transactions, has_older, has_newer).
+        """
+        query = cls.query.filter(*criteria).options(db.selectinload(cls.flags))
+        key = db.tuple_(cls.timestamp, cls.id)
+
+        if after is not None:
+            # Walk forwards from the cursor, then flip back to newest first
+            rows = query.filter(key > after).order_by(
+                cls.timestamp.asc(), cls.id.asc()
+            ).limit(per_page + 1).all()
+            has_newer = len(rows) > per_page
+            return list(reversed(rows[:per_page])), True, has_newer
+
+        if before is not None:
+            query = query.filter(key < before)
+        rows = query.order_by(cls.timestamp.desc(), cls.id.desc()).limit(per_page + 1).all()
+        return rows[:per_page], len(rows) > per_page, before is not None
@@ -0,0 +1,30 @@
+# Fraud flags raised on a transaction, one row per flag (codes in utils/flags.py)
+from models import db
+
+class TransactionFlag(db.Model):
+    __table_args__ = (
+        # Per-flag counts over a time range are answered from this index alone
+        db.Index('ix_transaction_flag_code_timestamp', 'code', 'timestamp'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transaction.id'), nullable=False, index=True)
+    code = db.Column(db.SmallInteger, nullable=False)
+    # The transaction's timestamp, so time-ranged flag queries don't need the join
+    timestamp = db.Column(db.DateTime, nullable=False)
+    params = db.Column(db.JSON, nullable=True)  # values the flag's message is rendered from
+
+    def __repr__(self):
+        return f'<TransactionFlag {self.code} on transaction {self.transaction_id}>'
+
+    @classmethod
+    def count_by_code(cls, since=None, until=None, codes=None):
+        """{code: times it was raised} on transactions with timestamps in [since, until)"""
+        query = db.session.query(cls.code, db.func.count()).group_by(cls.code)
+        if codes is not None:
+            query = query.filter(cls.code.in_(list(codes)))
+        if since is not None:
+            query = query.filter(cls.timestamp >= since)
+        if until is not None:
+            query = query.filter(cls.timestamp < until)
+        return dict(query.all())
@@ -0,0 +1,29 @@
+# Per-user behavioral profile, maintained alongside the transaction table
+from models import db
+from datetime import datetime, timezone
+
+class UserProfile(db.Model):
+    userid = db.Column(db.String(50), db.ForeignKey('user.userid'), primary_key=True)
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+    amount_sum = db.Column(db.Float, nullable=False, default=0.0)
+    location_counts = db.Column(db.JSON, nullable=False, default=dict)  # {location: count}
+    recent_events = db.Column(db.JSON, nullable=False, default=list)  # [[epoch_seconds, location], ...] oldest first
+    device_counts = db.Column(db.JSON, nullable=False, default=dict, server_default='{}')  # {str(device key): count}
+    updated_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f'<UserProfile {self.userid}: {self.transaction_count} transactions>'
+
+    @property
+    def average_amount(self):
+        return self.amount_sum / self.transaction_count if self.transaction_count else 0.0
+
+    def to_summary(self):
+        """History summary in the shape the fraud rules consume"""
+        return {
+            'count': self.transaction_count,
+            'amount_sum': self.amount_sum,
+            'location_counts': dict(self.location_counts or {}),
+            'recent_events': [tuple(event) for event in (self.recent_events or [])],
+            'device_counts': dict(self.device_counts or {})
+        }
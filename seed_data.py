@@ -1,7 +1,10 @@
 from flask import Flask
 from models import db
 from models.transaction import Transaction
+from models.transaction_flag import TransactionFlag
 from models.user import User
+from models.user_profile import UserProfile
+from utils.user_profiles import rebuild_profiles
 from config import Config
 from datetime import datetime, timedelta, timezone
 import random
@@ -14,6 +17,8 @@ def create_sample_data():
     """Create sample transaction data for training"""
     with app.app_context():
         # Clear existing data
+        UserProfile.query.delete()
+        TransactionFlag.query.delete()
         Transaction.query.delete()
         User.query.delete()
         db.session.commit()
@@ -117,6 +122,7 @@ def create_sample_data():
         # Add all transactions to database
         db.session.bulk_save_objects(transactions)
         db.session.commit()
+        rebuild_profiles()
         
         print(f"Created {len(users)} sample users")
         print(f"Created {len(transactions)} sample transactions")
@@ -0,0 +1,96 @@
+import re
+from datetime import datetime, timedelta
+from urllib.parse import unquote
+
+import pytest
+
+from models import db
+from models.transaction import Transaction
+from models.user import User
+
+
+@pytest.fixture
+def transactions(app):
+    db.session.add_all([
+        User(username='admin1', userid='admin1', email='admin1@example.com', phone='+15550002001'),
+        User(username='admin2', userid='admin2', email='admin2@example.com', phone='+15550002002'),
+    ])
+    base = datetime(2025, 3, 1, 12, 0, 0)
+    rows = []
+    for i in range(7):
+        rows.append(Transaction(
+            userid='admin1' if i % 2 else 'admin2',
+            amount=10.0 + i,
+            device_id='device1',
+            location='Chicago',
+            # Two rows share a timestamp so the id tie-breaker matters
+            timestamp=base + timedelta(days=i // 2 if i < 4 else i),
+            is_fraudulent=i in (1, 4),
+            is_approved=i in (0, 2, 3),
+            is_declined=i == 4,
+        ))
+    db.session.add_all(rows)
+    db.session.commit()
+    return rows
+
+
+def page_ids(html):
+    return [int(i) for i in re.findall(r'<td>(\d+)</td>\s*<td>admin', html)]
+
+
+def link(html, label):
+    match = re.search(r'href="([^"]+)">[^<]*' + label, html)
+    return unquote(match.group(1)).replace('&amp;', '&') if match and match.group(1) != '#' else None
+
+
+def test_keyset_pages_cover_every_row_once(client, transactions):
+    expected = [t.id for t in sorted(transactions, key=lambda t: (t.timestamp, t.id), reverse=True)]
+
+    seen = []
+    html = client.get('/admin?per_page=3').get_data(as_text=True)
+    pages = [html]
+    while True:
+        seen.extend(page_ids(html))
+        older = link(html, 'Older')
+        if not older:
+            break
+        html = client.get(older).get_data(as_text=True)
+        pages.append(html)
+    assert seen == expected
+    assert len(pages) == 3
+
+    # Walking back with the newer links returns the previous pages
+    newer = link(pages[-1], 'Newer')
+    assert page_ids(client.get(newer).get_data(as_text=True)) == page_ids(pages[1])
+
+
+def test_stats_single_pass_match_counts(client, transactions):
+    stats = Transaction.get_status_counts()
+    assert stats == {
+        'total': Transaction.query.count(),
+        'fraudulent': Transaction.query.filter_by(is_fraudulent=True).count(),
+        'approved': Transaction.query.filter_by(is_approved=True).count(),
+        'declined': Transaction.query.filter_by(is_declined=True).count(),
+        'pending': Transaction.query.filter_by(is_approved=False, is_declined=False).count(),
+    }
+
+
+def test_filters(client, transactions):
+    html = client.get('/admin?status=pending').get_data(as_text=True)
+    assert sorted(page_ids(html)) == sorted(
+        t.id for t in transactions if not t.is_approved and not t.is_declined)
+
+    html = client.get('/admin?userid=admin1&date_from=2025-03-02&date_to=2025-03-02').get_data(as_text=True)
+    assert page_ids(html) == [t.id for t in transactions
+                             if t.userid == 'admin1' and t.timestamp.date().isoformat() == '2025-03-02']
+
+    assert client.get('/admin?status=bogus').status_code == 400
+    assert client.get('/admin?before=garbage').status_code == 400
+
+
+def test_decline_keeps_filters(client, transactions):
+    pending = next(t for t in transactions if not t.is_approved and not t.is_declined)
+    response = client.post(f'/admin/decline/{pending.id}?status=pending')
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/admin?status=pending')
+    assert db.session.get(Transaction, pending.id).is_declined
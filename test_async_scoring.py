@@ -0,0 +1,146 @@
+import asyncio
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from models import db
+from models.location import Location, forget_locations
+from models.notification import Notification
+from models.transaction import Transaction
+from models.user import User
+from models.user_profile import UserProfile
+import utils.fraud_detection as fraud_detection
+from utils.fraud_detection import detect_fraud, render_fraud_flags
+from utils.geoip import LOCAL_LOCATION
+
+FIREFOX = b"Mozilla/5.0 (X11; Linux x86_64; rv:120.0) Gecko/20100101 Firefox/120.0"
+
+
+@pytest.fixture
+def users(app, monkeypatch):
+    # ML confidence depends on the wall-clock hour, keep comparisons deterministic
+    monkeypatch.setattr(fraud_detection, 'ML_MODEL_AVAILABLE', False)
+    db.session.add_all([
+        User(username=f'async{i}', userid=f'async{i}', email=f'async{i}@example.com', phone=f'+1555200{i:04d}')
+        for i in range(2)
+    ])
+    db.session.add(Transaction(userid='async0', amount=100.0, device_id='device1', location='Unknown',
+                               timestamp=datetime.now(timezone.utc) - timedelta(days=2), is_approved=True))
+    db.session.commit()
+    yield
+    app.extensions['async_scorer'].stop()
+
+
+@pytest.mark.parametrize('amount', [80.0, 15000.0])
+def test_async_route_matches_detect_fraud(client, users, amount):
+    # The test client connects from 127.0.0.1
+    is_fraudulent, fraud_flags = detect_fraud(amount, LOCAL_LOCATION, 'async0')
+
+    response = client.post('/score/async', json={'userid': 'async0', 'amount': amount})
+    assert response.status_code == 200
+    result = response.get_json()
+
+    assert result['success']
+    assert result['fraud_detected'] == is_fraudulent
+    assert result['fraud_flags'] == render_fraud_flags(fraud_flags, amount, LOCAL_LOCATION)
+    assert result['is_approved'] != is_fraudulent
+    assert ('approval_token' in result) == is_fraudulent
+
+    transaction = db.session.get(Transaction, result['transaction_id'])
+    assert transaction.amount == amount and transaction.location == LOCAL_LOCATION
+    assert db.session.get(UserProfile, 'async0').transaction_count == 2
+    if is_fraudulent:
+        # The alert (with its approval link) went to the outbox
+        assert transaction.approval_token == result['approval_token']
+        assert Notification.query.filter_by(recipient='async0@example.com').count() == 1
+
+
+def test_async_route_rejects_bad_requests(client, users):
+    assert 'Invalid user ID' in client.post('/score/async', json={'userid': 'nobody', 'amount': 5}).get_json()['error']
+    assert 'greater than 0' in client.post('/score/async', json={'userid': 'async1', 'amount': -5}).get_json()['error']
+    assert client.post('/score/async', json={'amount': 5}).status_code == 400
+    assert client.post('/score/async', data='not json').status_code == 400
+    assert Transaction.query.count() == 1
+
+
+def test_async_route_with_group_commit(app, client, users, monkeypatch):
+    monkeypatch.setitem(app.config, 'GROUP_COMMIT', True)
+    writer = app.extensions['transaction_writer']
+    try:
+        result = client.post('/score/async', json={'userid': 'async1', 'amount': 25.0}).get_json()
+    finally:
+        writer.stop()
+    assert result['success']
+    assert db.session.get(Transaction, result['transaction_id']).userid == 'async1'
+    assert writer.stats()['rows'] >= 1
+
+
+def test_asgi_application_serves_async_route(app):
+    from asgi import application
+
+    db.session.add_all([
+        User(username=f'async{i}', userid=f'async{i}', email=f'async{i}@example.com', phone=f'+1555200{i:04d}')
+        for i in range(2)
+    ])
+    # No location interned yet, in the table or in this process
+    Location.query.delete()
+    db.session.commit()
+    forget_locations()
+
+    async def request(body):
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': 'POST', 'path': '/score/async', 'scheme': 'http',
+                 'headers': [(b'host', b'testserver'), (b'user-agent', FIREFOX)], 'client': ('127.0.0.1', 1234)}
+        await application(scope, receive, send)
+        return sent[0]['status'], json.loads(sent[1]['body'])
+
+    async def concurrently():
+        return await asyncio.gather(*(
+            request(json.dumps({'userid': f'async{i % 2}', 'amount': 20.0 + i if i else 50000.0}).encode())
+            for i in range(6)
+        ))
+
+    # The event loop runs without an app context, as under uvicorn
+    results = []
+    loop_thread = threading.Thread(target=lambda: results.extend(asyncio.run(concurrently())))
+    loop_thread.start()
+    loop_thread.join()
+    app.extensions['async_scorer'].stop()
+
+    assert all(status == 200 and body['success'] for status, body in results), results
+    assert len({body['transaction_id'] for _, body in results}) == 6
+    assert results[0][1]['fraud_detected'] and 'approval_token' in results[0][1]
+    assert Transaction.query.filter_by(device_id='Firefox 120 / Linux / Other').count() == 6
+    assert Transaction.query.filter_by(location=LOCAL_LOCATION).count() == 6
+    assert Location.query.filter_by(name=LOCAL_LOCATION).count() == 1
+
+
+def test_asgi_application_serves_flask_routes(app):
+    from asgi import application
+
+    async def get(path):
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            sent.append(message)
+
+        await application({'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'',
+                           'headers': [(b'host', b'testserver')]}, receive, send)
+        return sent[0]['status'], json.loads(sent[1]['body'])
+
+    status, body = asyncio.run(get('/health'))
+    assert status == 200 and body['status'] == 'ok'
+    assert asyncio.run(get('/missing'))[0] == 404
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from models import db
+from models.transaction import Transaction
+from models.user import User
+import utils.fraud_detection as fraud_detection
+from utils.fraud_detection import detect_fraud, render_fraud_flags
+from ml.random_forest_model import FraudDetectionModel
+from test_feature_engineering import make_transactions
+
+
+@pytest.fixture
+def users(app):
+    users = [
+        User(username=f'batch{i}', userid=f'batch{i}', email=f'batch{i}@example.com', phone=f'+1555100{i:04d}')
+        for i in range(3)
+    ]
+    db.session.add_all(users)
+
+    now = datetime.now(timezone.utc)
+    db.session.add_all([
+        Transaction(userid='batch0', amount=100.0, device_id='device1', location='Chicago',
+                    timestamp=now - timedelta(days=2), is_approved=True),
+        Transaction(userid='batch1', amount=50.0, device_id='device1', location='Miami',
+                    timestamp=now - timedelta(minutes=2), is_approved=True),
+        Transaction(userid='batch1', amount=60.0, device_id='device1', location='Houston',
+                    timestamp=now - timedelta(minutes=1), is_approved=True),
+    ])
+    db.session.commit()
+    return users
+
+
+@pytest.fixture
+def rules_only(monkeypatch):
+    # ML confidence depends on the wall-clock hour, keep comparisons deterministic
+    monkeypatch.setattr(fraud_detection, 'ML_MODEL_AVAILABLE', False)
+
+
+def test_batch_matches_detect_fraud(client, users, rules_only, monkeypatch):
+    monkeypatch.setattr('app.send_fraud_alert', lambda user, transaction: True)
+    items = [
+        {'userid': 'batch0', 'amount': 80.0, 'location': 'Chicago'},
+        {'userid': 'batch0', 'amount': 15000.0, 'location': 'Chicago'},
+        {'userid': 'batch1', 'amount': 40.0, 'location': 'New York'},
+        {'userid': 'batch2', 'amount': 10.0, 'location': 'Unknown'},
+    ]
+    expected = [detect_fraud(item['amount'], item['location'], item['userid']) for item in items]
+
+    response = client.post('/score/batch', json={'transactions': items})
+    assert response.status_code == 200
+    results = response.get_json()['results']
+
+    assert len(results) == len(items)
+    for result, (is_fraudulent, fraud_flags), item in zip(results, expected, items):
+        assert result['success']
+        assert result['fraud_detected'] == is_fraudulent
+        assert result['fraud_flags'] == render_fraud_flags(fraud_flags, item['amount'], item['location'])
+        assert result['is_approved'] != is_fraudulent
+        assert ('approval_token' in result) == is_fraudulent
+
+    assert Transaction.query.count() == 3 + len(items)
+
+
+def test_batch_reports_invalid_items(client, users, rules_only):
+    response = client.post('/score/batch', json={'transactions': [
+        {'userid': 'batch0', 'amount': 20.0, 'location': 'Chicago'},
+        {'userid': 'nobody', 'amount': 20.0},
+        {'userid': 'batch0', 'amount': -5},
+        {'amount': 20.0},
+    ]})
+    results = response.get_json()['results']
+
+    assert results[0]['success']
+    assert [r['success'] for r in results[1:]] == [False, False, False]
+    assert 'Invalid user ID' in results[1]['error']
+    assert 'greater than 0' in results[2]['error']
+
+
+def test_batch_rejects_bad_body(client, app):
+    assert client.post('/score/batch', json={'transactions': []}).status_code == 400
+    assert client.post('/score/batch', json=[1, 2]).status_code == 400
+
+    app.config['MAX_BATCH_SIZE'] = 2
+    try:
+        response = client.post('/score/batch', json={'transactions': [{}] * 3})
+        assert response.status_code == 400
+    finally:
+        app.config['MAX_BATCH_SIZE'] = 1000
+
+
+def test_predict_batch_matches_predict():
+    model = FraudDetectionModel()
+    model.model.set_params(n_estimators=10)
+    model.train(make_transactions(500, n_users=10))
+
+    transactions = make_transactions(50, n_users=5, seed=1)
+    batch = model.predict_batch(transactions)
+    single = [model.predict(t) for t in transactions]
+
+    assert [p['is_fraudulent'] for p in batch] == [p['is_fraudulent'] for p in single]
+    np.testing.assert_allclose([p['confidence'] for p in batch], [p['confidence'] for p in single])
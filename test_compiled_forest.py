@@ -0,0 +1,85 @@
+import numpy as np
+
+from ml.compiled import CompiledForest
+from ml.random_forest_model import FraudDetectionModel
+from test_feature_engineering import make_transactions
+
+
+def train_model(n_estimators=100, seed=0):
+    model = FraudDetectionModel()
+    model.model.set_params(n_estimators=n_estimators)
+    transactions = make_transactions(2000, seed=seed)
+    for i, t in enumerate(transactions):
+        t['is_fraudulent'] = t['amount'] > 3000 or i % 11 == 0
+    model.train(transactions)
+    return model
+
+
+def test_compiled_matches_sklearn():
+    model = train_model()
+    X = model.prepare_features(make_transactions(3000, seed=7))
+    X_scaled = model.scaler.transform(X)
+
+    predictions, probabilities = model.compiled.predict(X)
+
+    np.testing.assert_array_equal(probabilities, model.model.predict_proba(X_scaled))
+    np.testing.assert_array_equal(predictions, model.model.predict(X_scaled))
+
+
+def test_predict_matches_sklearn():
+    model = train_model(n_estimators=10)
+    transaction = make_transactions(1, seed=3)[0]
+    result = model.predict(transaction)
+
+    X_scaled = model.scaler.transform(model.prepare_features([transaction]))
+    assert result['confidence'] == model.model.predict_proba(X_scaled)[0, 1]
+    assert result['is_fraudulent'] == bool(model.model.predict(X_scaled)[0])
+
+
+def test_contributions_sum_to_probability():
+    model = train_model(n_estimators=20)
+    transactions = make_transactions(200, seed=4)
+    explanations = model.explain_batch(transactions)
+
+    for explanation in explanations:
+        total = explanation['bias'] + sum(explanation['feature_contributions'].values())
+        assert abs(total - explanation['confidence']) < 1e-9
+    assert model.explain(transactions[0]) == explanations[0]
+    # Attributions differ between transactions, unlike global importances
+    assert len({tuple(e['feature_contributions'].values()) for e in explanations}) > 1
+
+
+def test_contributions_match_path_walk():
+    """The precomputed table agrees with walking one tree's decision path"""
+    model = train_model(n_estimators=1)
+    forest = model.compiled
+    tree = model.model.estimators_[0].tree_
+    X = model.prepare_features(make_transactions(20, seed=5))
+    X_scaled = model.scaler.transform(X).astype(np.float32)
+
+    _, _, contributions = forest.explain(X)
+    for row, expected_row in zip(X_scaled, contributions):
+        expected = np.zeros(X.shape[1])
+        node = 0
+        while tree.children_left[node] >= 0:
+            feature = tree.feature[node]
+            child = (tree.children_left[node] if row[feature] <= tree.threshold[node]
+                     else tree.children_right[node])
+            expected[feature] += forest.value[child, 1] - forest.value[node, 1]
+            node = child
+        np.testing.assert_allclose(expected_row, expected, atol=1e-12)
+
+
+def test_single_leaf_trees():
+    # Every label is the same, so each tree is a lone root leaf
+    model = FraudDetectionModel()
+    model.model.set_params(n_estimators=5)
+    transactions = make_transactions(50, seed=1)
+    for t in transactions:
+        t['is_fraudulent'] = False
+    model.train(transactions)
+
+    X = model.prepare_features(transactions)
+    forest = CompiledForest.from_sklearn(model.model, model.scaler)
+    np.testing.assert_array_equal(forest.predict_proba(X),
+                                  model.model.predict_proba(model.scaler.transform(X)))
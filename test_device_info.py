@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from models import db
+from models.device import Device
+from models.transaction import Transaction
+from models.user import User
+from models.user_profile import UserProfile
+from utils.device_info import DeviceResolver, resolve_device
+from utils.fraud_detection import apply_rule_based_detection, get_user_history_summary
+from utils.flags import FLAG_CODES
+from utils.user_profiles import check_profiles, rebuild_profiles
+
+CHROME = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.{}.0 Safari/537.36"
+IPHONE = ("Mozilla/5.0 (iPhone; CPU iPhone OS 17_2 like Mac OS X) AppleWebKit/605.1.15 "
+          "(KHTML, like Gecko) Version/17.2 Mobile/15E148 Safari/604.1")
+NEW_DEVICE = FLAG_CODES[('new_device', 'new_device')]
+
+
+@pytest.fixture
+def user(app):
+    db.session.add(User(username='device1', userid='device1', email='device1@example.com', phone='+15550006001'))
+    db.session.commit()
+    return 'device1'
+
+
+def test_user_agents_are_parsed_once_and_interned(app):
+    resolver = DeviceResolver(cache_size=2)
+    chrome = resolver.resolve(CHROME.format(1))
+    assert (chrome['browser'], chrome['os'], chrome['kind']) == ('Chrome 120', 'Windows 10', 'pc')
+    assert chrome['label'] == 'Chrome 120 / Windows 10 / Other'
+
+    # Another patch release is the same device; the repeat is a cache hit
+    assert resolver.resolve(CHROME.format(2))['key'] == chrome['key']
+    assert resolver.resolve(CHROME.format(2))['key'] == chrome['key']
+    assert resolver.cache_info().hits == 1
+
+    iphone = resolver.resolve(IPHONE)
+    assert iphone['kind'] == 'mobile' and iphone['key'] != chrome['key']
+    assert resolver.cache_info().currsize == 2
+
+    # A fresh resolver finds the rows already interned
+    assert DeviceResolver().resolve(IPHONE)['key'] == iphone['key']
+    assert Device.query.filter_by(fingerprint=iphone['fingerprint']).count() == 1
+
+
+def test_scoring_stores_the_device_and_counts_it_in_the_profile(client, user):
+    response = client.post('/', json={'userid': user, 'amount': 25.0}, headers={'User-Agent': IPHONE})
+    assert response.get_json()['success']
+
+    transaction = Transaction.query.filter_by(userid=user).one()
+    assert transaction.device_key == resolve_device(IPHONE)['key']
+    assert transaction.device.hardware == 'iPhone'
+    assert transaction.device_id == 'Mobile Safari 17 / iOS 17 / iPhone'
+    assert db.session.get(UserProfile, user).device_counts == {str(transaction.device_key): 1}
+    assert check_profiles() == []
+
+
+def test_new_device_rule_needs_an_established_user(app, user):
+    chrome = resolve_device(CHROME.format(1))['key']
+    iphone = resolve_device(IPHONE)['key']
+    now = datetime.now(timezone.utc)
+    db.session.add_all([
+        Transaction(userid=user, amount=20.0, device_id='Chrome', device_key=chrome, location='Chicago',
+                    timestamp=now - timedelta(days=days + 1))
+        for days in range(4)
+    ])
+    db.session.commit()
+    rebuild_profiles()
+
+    def flags(device_key):
+        history = get_user_history_summary(user)
+        return [code for code, _ in apply_rule_based_detection(20.0, 'Chicago', user, history, now,
+                                                               device_key=device_key)]
+
+    # Four transactions from one device are not yet enough to call another one unusual
+    assert NEW_DEVICE not in flags(iphone)
+
+    db.session.add(Transaction(userid=user, amount=20.0, device_id='Chrome', device_key=chrome,
+                               location='Chicago', timestamp=now - timedelta(hours=1)))
+    db.session.commit()
+    rebuild_profiles()
+    assert NEW_DEVICE in flags(iphone)
+    assert NEW_DEVICE not in flags(chrome)
+    assert NEW_DEVICE not in flags(None)
@@ -0,0 +1,93 @@
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from ml.features import FEATURE_NAMES, build_features_against, records_to_columns
+from ml.random_forest_model import FraudDetectionModel
+
+
+def reference_prepare_features(transaction_data):
+    """Original row-by-row implementation, kept to check the columnar builder against"""
+    features = []
+    for transaction in transaction_data:
+        transaction_time = datetime.strptime(transaction['timestamp'], '%Y-%m-%d %H:%M:%S')
+        hour = transaction_time.hour
+        day_of_week = transaction_time.weekday()
+
+        user_transactions = [t for t in transaction_data if t['userid'] == transaction['userid']]
+        recent_transactions = [t for t in user_transactions
+                               if (transaction_time - datetime.strptime(t['timestamp'], '%Y-%m-%d %H:%M:%S')).days <= 7]
+
+        avg_amount = np.mean([t['amount'] for t in user_transactions]) if user_transactions else 0
+        transaction_frequency = len(recent_transactions)
+        location_frequency = len([t for t in user_transactions if t['location'] == transaction['location']])
+
+        features.append([
+            transaction['amount'],
+            avg_amount,
+            transaction['amount'] / (avg_amount if avg_amount > 0 else 1),
+            transaction_frequency,
+            location_frequency,
+            hour,
+            day_of_week
+        ])
+
+    return np.array(features)
+
+
+def make_transactions(n, n_users=20, seed=0):
+    rng = random.Random(seed)
+    base_time = datetime(2024, 1, 1)
+    locations = ['New York', 'Los Angeles', 'Chicago', 'Houston', 'Miami', 'Unknown']
+    transactions = []
+    for _ in range(n):
+        timestamp = base_time + timedelta(seconds=rng.randint(0, 60 * 86400))
+        transactions.append({
+            'userid': f'user{rng.randint(1, n_users)}',
+            'amount': round(rng.uniform(1, 5000), 2),
+            'location': rng.choice(locations),
+            'timestamp': timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+            'is_fraudulent': rng.random() < 0.1,
+            'device_id': 'device1'
+        })
+    return transactions
+
+
+def test_prepare_features_matches_reference():
+    transactions = make_transactions(1500)
+    # Exact 8-day boundaries and duplicate timestamps are the interesting edges
+    transactions.append(dict(transactions[0], timestamp=(
+        datetime.strptime(transactions[0]['timestamp'], '%Y-%m-%d %H:%M:%S') + timedelta(days=8)
+    ).strftime('%Y-%m-%d %H:%M:%S')))
+    transactions.append(dict(transactions[1]))
+
+    expected = reference_prepare_features(transactions)
+    actual = FraudDetectionModel().prepare_features(transactions)
+
+    assert actual.shape == (len(transactions), len(FEATURE_NAMES))
+    np.testing.assert_allclose(actual, expected, rtol=1e-9)
+
+
+def test_prepare_features_single_transaction():
+    transaction = make_transactions(1)[0]
+    np.testing.assert_allclose(
+        FraudDetectionModel().prepare_features([transaction]),
+        reference_prepare_features([transaction])
+    )
+
+
+def test_prepare_features_empty():
+    assert FraudDetectionModel().prepare_features([]).shape == (0, len(FEATURE_NAMES))
+
+
+def test_features_against_history_match_adding_each_row_alone():
+    transactions = make_transactions(300, n_users=10)
+    history, rows = transactions[:240], transactions[240:]
+    columns = records_to_columns(transactions)
+    split = {name: (values[:240], values[240:]) for name, values in columns.items()}
+
+    features = build_features_against({name: h for name, (h, _) in split.items()},
+                                      {name: r for name, (_, r) in split.items()})
+    expected = np.array([reference_prepare_features(history + [row])[-1] for row in rows])
+    np.testing.assert_allclose(features, expected)
@@ -0,0 +1,86 @@
+from datetime import datetime
+
+import pytest
+
+from models import db
+from models.transaction import Transaction
+from models.transaction_flag import TransactionFlag
+from models.user import User
+from utils.flags import FLAG_CODES, LEGACY_TEXT, ML_PATTERN, ML_RISK_FACTOR, flag_mask, mask_codes
+from utils.fraud_detection import render_fraud_flags
+
+SUSPICIOUS = FLAG_CODES[('amount_threshold', 'suspicious')]
+LOCATION = FLAG_CODES[('suspicious_location', 'location')]
+
+
+@pytest.fixture
+def user(app):
+    db.session.add(User(username='flags1', userid='flags1', email='flags1@example.com', phone='+15550005001'))
+    db.session.commit()
+    return 'flags1'
+
+
+def add_transaction(user, timestamp, flags):
+    transaction = Transaction(userid=user, amount=25000.0, device_id='device1', location='Unknown',
+                              timestamp=timestamp, is_fraudulent=bool(flags))
+    transaction.set_flags(flags)
+    db.session.add(transaction)
+    return transaction
+
+
+def test_flags_render_from_codes_and_params(app):
+    flags = [
+        (SUSPICIOUS, {'suspicious_amount': 10000.0}),
+        (LOCATION, None),
+        (ML_PATTERN, {'confidence': 0.912}),
+        (ML_RISK_FACTOR, {'feature': 'amount', 'contribution': 0.305}),
+    ]
+    assert render_fraud_flags(flags, 25000.0, 'Unknown') == [
+        "Detection method(s): Rule-based & ML-based",
+        "Amount $25,000.00 exceeds suspicious threshold $10,000.00",
+        "Transaction from suspicious location: Unknown",
+        "ML Model detected suspicious pattern (confidence: 91.2%)",
+        "High risk factor: amount (contribution: +30.5%)",
+    ]
+    assert render_fraud_flags([], 25000.0, 'Unknown') == []
+
+    legacy = ["Detection method(s): Rule-based", "Something from an older release"]
+    assert render_fraud_flags([(LEGACY_TEXT, {'messages': legacy})], 1.0, 'Chicago') == legacy
+
+
+def test_mask_and_flag_rows_are_stored(app, user):
+    flags = [(SUSPICIOUS, {'suspicious_amount': 10000.0}), (ML_RISK_FACTOR, {'feature': 'amount', 'contribution': 0.3}),
+             (ML_RISK_FACTOR, {'feature': 'hour', 'contribution': 0.1})]
+    transaction = add_transaction(user, datetime(2025, 3, 1, 12), flags)
+    db.session.commit()
+    db.session.expire_all()
+
+    transaction = db.session.get(Transaction, transaction.id)
+    assert transaction.flag_mask == flag_mask(flags) == (1 << SUSPICIOUS) | (1 << ML_RISK_FACTOR)
+    assert mask_codes(transaction.flag_mask) == [SUSPICIOUS, ML_RISK_FACTOR]
+    assert transaction.flag_pairs() == flags
+    assert Transaction.query.filter(Transaction.flag_mask.op('&')(1 << SUSPICIOUS) != 0).count() == 1
+
+
+def test_admin_flags_counts_by_code_and_date(client, user):
+    add_transaction(user, datetime(2025, 3, 1, 12), [(SUSPICIOUS, {'suspicious_amount': 10000.0}), (LOCATION, None)])
+    add_transaction(user, datetime(2025, 3, 2, 12), [(LOCATION, None)])
+    add_transaction(user, datetime(2025, 3, 5, 12), [(LOCATION, None)])
+    add_transaction(user, datetime(2025, 3, 2, 13), [])
+    db.session.commit()
+
+    flags = client.get('/admin/flags?date_from=2025-03-01&date_to=2025-03-02').get_json()['flags']
+    assert flags == [
+        {'code': SUSPICIOUS, 'name': 'amount_threshold.suspicious', 'count': 1},
+        {'code': LOCATION, 'name': 'suspicious_location.location', 'count': 2},
+    ]
+    assert client.get('/admin/flags').get_json()['flags'][-1]['count'] == 3
+
+
+def test_flag_counts_are_read_from_the_index(app):
+    query = db.session.query(TransactionFlag.code, db.func.count()).filter(
+        TransactionFlag.code.in_([SUSPICIOUS]), TransactionFlag.timestamp >= datetime(2025, 3, 1)
+    ).group_by(TransactionFlag.code)
+    sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+    plan = ' '.join(row[-1] for row in db.session.execute(db.text('EXPLAIN QUERY PLAN ' + sql)))
+    assert 'COVERING INDEX ix_transaction_flag_code_timestamp' in plan
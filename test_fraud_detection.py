@@ -1,9 +1,8 @@
 from flask import Flask
 from models import db
-from utils.fraud_detection import detect_fraud
+from utils.fraud_detection import detect_fraud, render_fraud_flags
 from config import Config
 from datetime import datetime, timedelta, timezone
-import json
 
 app = Flask(__name__)
 app.config.from_object(Config)
@@ -23,7 +22,7 @@ def test_fraud_detection():
         print(f"Amount: ${amount:,.2f}")
         print(f"Location: {location}")
         print(f"Result: {'Fraudulent' if is_fraudulent else 'Legitimate'}")
-        print(f"Flags: {json.loads(flags)}\n")
+        print(f"Flags: {render_fraud_flags(flags, amount, location)}\n")
         
         # Test Case 2: High Amount Transaction
         print("Scenario 2: High Amount Transaction")
@@ -34,7 +33,7 @@ def test_fraud_detection():
         print(f"Amount: ${amount:,.2f}")
         print(f"Location: {location}")
         print(f"Result: {'Fraudulent' if is_fraudulent else 'Legitimate'}")
-        print(f"Flags: {json.loads(flags)}\n")
+        print(f"Flags: {render_fraud_flags(flags, amount, location)}\n")
         
         # Test Case 3: Rapid Location Change
         print("Scenario 3: Rapid Location Change")
@@ -45,7 +44,7 @@ def test_fraud_detection():
         print(f"Amount: ${amount:,.2f}")
         print(f"Location: {location}")
         print(f"Result: {'Fraudulent' if is_fraudulent else 'Legitimate'}")
-        print(f"Flags: {json.loads(flags)}\n")
+        print(f"Flags: {render_fraud_flags(flags, amount, location)}\n")
         
         # Test Case 4: Amount Anomaly (5x user average)
         print("Scenario 4: Amount Anomaly")
@@ -56,7 +55,7 @@ def test_fraud_detection():
         print(f"Amount: ${amount:,.2f}")
         print(f"Location: {location}")
         print(f"Result: {'Fraudulent' if is_fraudulent else 'Legitimate'}")
-        print(f"Flags: {json.loads(flags)}\n")
+        print(f"Flags: {render_fraud_flags(flags, amount, location)}\n")
         
         # Test Case 5: Suspicious Location
         print("Scenario 5: Suspicious Location")
@@ -67,7 +66,7 @@ def test_fraud_detection():
         print(f"Amount: ${amount:,.2f}")
         print(f"Location: {location}")
         print(f"Result: {'Fraudulent' if is_fraudulent else 'Legitimate'}")
-        print(f"Flags: {json.loads(flags)}")
+        print(f"Flags: {render_fraud_flags(flags, amount, location)}")
 
 if __name__ == "__main__":
     test_fraud_detection() 
\ No newline at end of file
@@ -0,0 +1,83 @@
+import io
+import json
+from datetime import datetime, timezone
+
+import numpy as np
+
+from models import db
+from models.transaction import Transaction
+from models.user import User
+from models.user_profile import UserProfile
+import generate_data
+
+END = datetime(2024, 3, 1, tzinfo=timezone.utc)
+
+
+def all_days(population, days=14, seed=0):
+    return list(generate_data.generate(population, days, END, seed))
+
+
+def test_generation_is_deterministic():
+    population = generate_data.make_population(3000, 3000, seed=7)
+    first, second = all_days(population, seed=7), all_days(generate_data.make_population(3000, 3000, seed=7), seed=7)
+    for a, b in zip(first, second):
+        for key in a:
+            np.testing.assert_array_equal(a[key], b[key])
+
+    other = all_days(generate_data.make_population(3000, 3000, seed=8), seed=8)
+    assert not np.array_equal(first[0]['amount'][:100], other[0]['amount'][:100])
+
+
+def test_days_are_ordered_and_fraud_is_injected():
+    population = generate_data.make_population(5000, 5000)
+    days = all_days(population)
+    timestamps = np.concatenate([day['timestamp'] for day in days])
+    assert np.all(np.diff(timestamps.astype(np.int64)) >= 0)
+    assert timestamps[0] >= np.datetime64('2024-02-16') and timestamps[-1] < np.datetime64('2024-03-01')
+
+    patterns = np.concatenate([day['pattern'] for day in days])
+    assert {generate_data.BURST, generate_data.TAKEOVER, generate_data.RING} <= set(patterns.tolist())
+    assert 0.001 < np.mean(patterns > 0) < 0.05
+    assert np.all(np.concatenate([day['amount'] for day in days]) > 0)
+
+    hours = (timestamps.astype('datetime64[h]').astype(np.int64) % 24)[patterns == 0]
+    assert np.sum(hours == 19) > 5 * np.sum(hours == 3)
+
+
+def test_write_database(app):
+    population = generate_data.make_population(200, 400, prefix='gentest')
+    expected = sum(len(day['user']) for day in all_days(population, days=5))
+
+    written = generate_data.write_database(population, 5, END)
+    assert written == expected
+    assert User.query.filter(User.userid.like('gentest%')).count() == 200
+    assert Transaction.query.count() == expected
+    assert Transaction.query.filter_by(is_fraudulent=True, is_approved=True).count() == 0
+    assert UserProfile.query.count() == db.session.query(Transaction.userid).distinct().count()
+
+    # The indexes dropped for the load are back
+    indexes = {ix['name'] for ix in db.inspect(db.engine).get_indexes('transaction')}
+    assert {ix.name for ix in Transaction.__table__.indexes} <= indexes
+
+
+def test_jsonl_matches_generated_rows():
+    population = generate_data.make_population(200, 400)
+    out = io.StringIO()
+    written = generate_data.write_jsonl(population, 3, END, out)
+    lines = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert written == len(lines) == sum(len(day['user']) for day in all_days(population, days=3))
+    assert set(lines[0]) == {'userid', 'amount', 'location', 'device_id', 'timestamp', 'is_fraudulent'}
+    assert lines[0]['timestamp'] <= lines[-1]['timestamp']
+
+
+def test_runs_without_end_are_reproducible(app, tmp_path):
+    outputs = []
+    for run in range(2):
+        path = tmp_path / f'feed{run}.jsonl'
+        generate_data.main(['--users', '50', '--transactions', '200', '--days', '2', '--seed', '3',
+                            '--prefix', 'genrepro', '--jsonl', str(path), '--replace'])
+        created = [u.created_at for u in User.query.filter(User.userid.like('genrepro%')).order_by(User.userid)]
+        outputs.append((path.read_text(), created))
+    assert outputs[0] == outputs[1] and outputs[0][0]
+    # Not relative to today: the default end is a fixed date
+    assert json.loads(outputs[0][0].splitlines()[-1])['timestamp'] < generate_data.DEFAULT_END.replace(tzinfo=None).isoformat()
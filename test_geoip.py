@@ -0,0 +1,150 @@
+import ipaddress
+
+import pytest
+
+from utils.geoip import (GeoIPResolver, LOCAL_LOCATION, UNKNOWN_LOCATION, UNRESOLVED_LOCATION, import_csv,
+                         resolve_location)
+
+
+def ip(value):
+    return str(int(ipaddress.ip_address(value)))
+
+
+@pytest.fixture
+def resolver(tmp_path):
+    csv_path = tmp_path / 'ranges.csv'
+    csv_path.write_text(
+        '"ip_from","ip_to","country_code","country_name","region_name","city_name"\n'
+        f'"{ip("10.0.0.0")}","{ip("10.255.255.255")}","US","United States","Illinois","Chicago"\n'
+        f'"{ip("1.0.0.0")}","{ip("1.0.0.255")}","AU","Australia","Queensland","Brisbane"\n'
+        f'"{ip("8.8.8.0")}","{ip("8.8.8.255")}","US","United States","California","-"\n'
+        '"2001:db8::","2001:db8::ffff","US","United States","Texas","Houston"\n'
+        '192.168.0.0,192.168.0.255,EU,DE,Berlin,Berlin,52.5,13.4\n'
+    )
+    output = str(tmp_path / 'geoip.bin')
+    assert import_csv(str(csv_path), output) == 5
+    return GeoIPResolver(output, cache_size=16)
+
+
+def test_lookup_ranges(resolver):
+    assert resolver.lookup('10.1.2.3') == 'Chicago'
+    assert resolver.lookup('10.255.255.255') == 'Chicago'
+    assert resolver.lookup('1.0.0.0') == 'Brisbane'
+    assert resolver.lookup('192.168.0.17') == 'Berlin'
+    assert resolver.lookup('::ffff:10.0.0.1') == 'Chicago'
+    assert resolver.lookup('2001:db8::1') == 'Houston'
+    assert resolver.lookup('2001:db8::ffff') == 'Houston'
+
+
+def test_unresolvable_addresses(resolver):
+    assert resolver.lookup('8.8.8.8') == UNKNOWN_LOCATION
+    assert resolver.lookup('11.0.0.1') == UNKNOWN_LOCATION
+    assert resolver.lookup('0.0.0.1') == UNKNOWN_LOCATION
+    assert resolver.lookup('2001:db8::1:0') == UNKNOWN_LOCATION
+    assert resolver.lookup('2a00:1450:4001::1') == UNKNOWN_LOCATION
+    assert resolver.lookup('not-an-ip') == UNKNOWN_LOCATION
+
+
+def test_lookup_is_cached(resolver):
+    resolver.lookup('10.0.0.1')
+    resolver.lookup('10.0.0.1')
+    info = resolver.cache_info()
+    assert info.hits == 1 and info.maxsize == 16
+
+
+@pytest.fixture
+def ipv4_only_resolver(tmp_path):
+    csv_path = tmp_path / 'ranges4.csv'
+    csv_path.write_text(f'"{ip("1.0.0.0")}","{ip("1.0.0.255")}","AU","Australia","Queensland","Brisbane"\n')
+    output = str(tmp_path / 'geoip4.bin')
+    assert import_csv(str(csv_path), output) == 1
+    return GeoIPResolver(output, cache_size=16)
+
+
+def test_ipv6_clients_of_an_ipv4_only_table_are_unresolved(ipv4_only_resolver):
+    assert ipv4_only_resolver.lookup('2a00:1450:4001::1') == UNRESOLVED_LOCATION
+    assert ipv4_only_resolver.lookup('::1') == LOCAL_LOCATION
+    assert ipv4_only_resolver.lookup('::ffff:1.0.0.7') == 'Brisbane'
+    assert ipv4_only_resolver.lookup('8.8.8.8') == UNKNOWN_LOCATION
+
+
+def test_integer_ipv6_ranges_are_imported(tmp_path):
+    csv_path = tmp_path / 'ranges6.csv'
+    csv_path.write_text(
+        # IP2Location IPv6 style: integers, with IPv4 ranges as IPv4-mapped addresses
+        f'"{ip("::ffff:1.0.0.0")}","{ip("::ffff:1.0.0.255")}","AU","Australia","Queensland","Brisbane"\n'
+        f'"{ip("2a00:1450::")}","{ip("2a00:1450:ffff:ffff:ffff:ffff:ffff:ffff")}","DE","Germany","Hesse","Frankfurt"\n'
+    )
+    output = str(tmp_path / 'geoip6.bin')
+    assert import_csv(str(csv_path), output) == 2
+    resolver = GeoIPResolver(output)
+    assert resolver.lookup('1.0.0.9') == 'Brisbane'
+    assert resolver.lookup('2a00:1450:4001::1') == 'Frankfurt'
+    assert resolver.lookup('2a00:1451::1') == UNKNOWN_LOCATION
+
+
+def test_rejects_foreign_files(tmp_path):
+    path = tmp_path / 'bogus.bin'
+    path.write_bytes(b'\0' * 64)
+    with pytest.raises(ValueError):
+        GeoIPResolver(str(path))
+
+
+def test_index_uses_client_ip(client, app, resolver, monkeypatch):
+    import utils.geoip
+    from models import db
+    from models.user import User
+    from models.transaction import Transaction
+
+    monkeypatch.setattr(utils.geoip, '_resolver', resolver)
+    monkeypatch.setattr('app.send_fraud_alert', lambda user, transaction: True)
+    db.session.add(User(username='geo', userid='geo', email='geo@example.com', phone='+15550000999'))
+    db.session.commit()
+
+    client.post('/', json={'userid': 'geo', 'amount': 25.0}, environ_base={'REMOTE_ADDR': '10.9.8.7'})
+    assert Transaction.query.filter_by(userid='geo').one().location == 'Chicago'
+
+
+def test_private_addresses_without_a_range_are_local(resolver):
+    assert resolver.lookup('127.0.0.1') == LOCAL_LOCATION
+    assert resolver.lookup('172.16.4.2') == LOCAL_LOCATION
+    assert resolver.lookup('::1') == LOCAL_LOCATION
+    # A range in the table still wins
+    assert resolver.lookup('10.0.0.1') == 'Chicago'
+
+
+def test_missing_table_is_not_suspicious(client, app, monkeypatch, tmp_path):
+    import utils.geoip
+    from models import db
+    from models.user import User
+    from models.transaction import Transaction
+
+    monkeypatch.setattr(utils.geoip, '_resolver', None)
+    monkeypatch.setitem(app.config, 'GEOIP_DATABASE_PATH', str(tmp_path / 'missing.bin'))
+    assert resolve_location('127.0.0.1') == LOCAL_LOCATION
+    assert resolve_location('8.8.8.8') == UNRESOLVED_LOCATION
+
+    monkeypatch.setattr('app.send_fraud_alert', lambda user, transaction: True)
+    db.session.add(User(username='geo2', userid='geo2', email='geo2@example.com', phone='+15550000998'))
+    db.session.commit()
+    for remote_addr in ['127.0.0.1', '8.8.8.8']:
+        response = client.post('/', json={'userid': 'geo2', 'amount': 30.0}, environ_base={'REMOTE_ADDR': remote_addr})
+        assert not response.get_json()['fraud_detected']
+    assert [t.location for t in Transaction.query.filter_by(userid='geo2').order_by(Transaction.id)] == [
+        LOCAL_LOCATION, UNRESOLVED_LOCATION]
+
+
+def test_ipv6_client_is_not_flagged(client, app, ipv4_only_resolver, monkeypatch):
+    import utils.geoip
+    from models import db
+    from models.user import User
+    from models.transaction import Transaction
+
+    monkeypatch.setattr(utils.geoip, '_resolver', ipv4_only_resolver)
+    monkeypatch.setattr('app.send_fraud_alert', lambda user, transaction: True)
+    db.session.add(User(username='geo6', userid='geo6', email='geo6@example.com', phone='+15550000997'))
+    db.session.commit()
+
+    response = client.post('/', json={'userid': 'geo6', 'amount': 30.0}, environ_base={'REMOTE_ADDR': '2a00:1450:4001::1'})
+    assert not response.get_json()['fraud_detected']
+    assert Transaction.query.filter_by(userid='geo6').one().location == UNRESOLVED_LOCATION
@@ -0,0 +1,97 @@
+import threading
+from datetime import datetime, timezone
+
+import pytest
+from flask import Flask
+
+from config import Config
+from models import db
+from models.transaction import Transaction
+from models.user import User
+from models.user_profile import UserProfile
+import utils.fraud_detection as fraud_detection
+from utils.group_commit import TransactionWriter, apply_sqlite_pragmas
+
+
+@pytest.fixture
+def writer(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'GROUP_COMMIT', True)
+    monkeypatch.setitem(app.config, 'GROUP_COMMIT_MAX_DELAY', 0.05)
+    monkeypatch.setattr(fraud_detection, 'ML_MODEL_AVAILABLE', False)
+    monkeypatch.setattr('app.send_fraud_alert', lambda user, transaction: True)
+    writer = app.extensions['transaction_writer']
+    yield writer
+    writer.stop()
+
+
+def add_users(n):
+    db.session.add_all([User(username=f'gc{i}', userid=f'gc{i}', email=f'gc{i}@example.com',
+                             phone=f'+1555000{5000 + i}') for i in range(n)])
+    db.session.commit()
+
+
+def new_transaction(userid, amount=25.0):
+    return Transaction(userid=userid, amount=amount, device_id='device1', location='Chicago',
+                       timestamp=datetime.now(timezone.utc), is_approved=True)
+
+
+def test_concurrent_requests_share_commits(app, client, writer):
+    add_users(4)
+    results = []
+
+    def post(i):
+        response = client.post('/', json={'userid': f'gc{i % 4}', 'amount': 20.0 + i})
+        results.append(response.get_json())
+
+    threads = [threading.Thread(target=post, args=(i,)) for i in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert all(result['success'] for result in results)
+    ids = {result['transaction_id'] for result in results}
+    assert len(ids) == 20 and None not in ids
+    # Every acknowledged transaction is already committed, with its profile update
+    assert Transaction.query.filter(Transaction.id.in_(ids)).count() == 20
+    assert sum(p.transaction_count for p in UserProfile.query.all()) == 20
+    assert writer.stats()['batches'] < 20
+
+
+def test_failed_row_does_not_fail_its_batch(app, writer):
+    add_users(1)
+    broken = new_transaction('gc0')
+    broken.amount = None
+    futures = [writer.submit(new_transaction('gc0', amount)) for amount in (10.0, 20.0)]
+    futures.insert(1, writer.submit(broken))
+
+    assert futures[0].result(timeout=10) and futures[2].result(timeout=10)
+    with pytest.raises(Exception):
+        futures[1].result(timeout=10)
+    assert sorted(t.amount for t in Transaction.query.all()) == [10.0, 20.0]
+
+
+def test_stop_commits_queued_rows(app, writer):
+    add_users(1)
+    futures = [writer.submit(new_transaction('gc0')) for _ in range(5)]
+    writer.stop()
+    assert all(future.done() for future in futures)
+    assert Transaction.query.count() == 5
+
+
+def test_sqlite_pragmas(tmp_path):
+    pragma_app = Flask(__name__)
+    pragma_app.config.from_object(Config)
+    pragma_app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'wal.db'}"
+    pragma_app.config['SQLITE_JOURNAL_MODE'] = 'wal'
+    pragma_app.config['SQLITE_SYNCHRONOUS'] = 'NORMAL'
+    db.init_app(pragma_app)
+    apply_sqlite_pragmas(pragma_app)
+    with pragma_app.app_context():
+        assert db.session.execute(db.text('PRAGMA journal_mode')).scalar() == 'wal'
+        assert db.session.execute(db.text('PRAGMA synchronous')).scalar() == 1  # NORMAL
+        db.session.remove()
+
+    pragma_app.config['SQLITE_SYNCHRONOUS'] = 'SOMETIMES'
+    with pytest.raises(ValueError):
+        TransactionWriter(pragma_app)
@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta, timezone
+
+from models import db
+from models.location import Location, forget_locations, location_code, location_name, location_names
+from models.transaction import Transaction
+from models.user import User
+from models.user_profile import UserProfile
+from utils.user_profiles import check_profiles, rebuild_profiles
+
+
+def test_location_names_are_interned_once(app):
+    code = location_code('Reykjavik')
+    assert location_code('Reykjavik') == code
+    assert Location.query.filter_by(name='Reykjavik').count() == 1
+
+    # A cold cache reloads the codes from the table
+    forget_locations()
+    assert location_name(code) == 'Reykjavik'
+    assert location_names([code, location_code('Oslo'), code]) == ['Reykjavik', 'Oslo', 'Reykjavik']
+    assert location_code('Reykjavik') == code
+
+
+def test_transactions_store_the_code_and_read_back_the_name(app):
+    db.session.add(User(username='loc1', userid='loc1', email='loc1@example.com', phone='+15550007001'))
+    code = location_code('Lisbon')
+    now = datetime.now(timezone.utc)
+    db.session.add_all([
+        Transaction(userid='loc1', amount=10.0, device_id='pytest', location='Lisbon', timestamp=now - timedelta(hours=2)),
+        Transaction(userid='loc1', amount=30.0, device_id='pytest', location='Porto', timestamp=now - timedelta(hours=1)),
+        Transaction(userid='loc1', amount=20.0, device_id='pytest', location='Lisbon', timestamp=now)
+    ])
+    db.session.commit()
+    db.session.expire_all()
+
+    lisbon = Transaction.query.filter_by(location='Lisbon').order_by(Transaction.id).all()
+    assert [t.amount for t in lisbon] == [10.0, 20.0]
+    assert {t.location_code for t in lisbon} == {code}
+    assert lisbon[0].location == 'Lisbon'
+
+    rebuild_profiles()
+    profile = db.session.get(UserProfile, 'loc1')
+    assert profile.location_counts == {'Lisbon': 2, 'Porto': 1}
+    assert [location for _, location in profile.recent_events] == ['Lisbon', 'Porto', 'Lisbon']
+    assert check_profiles() == []
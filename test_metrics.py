@@ -0,0 +1,80 @@
+import re
+
+import pytest
+
+from models import db
+from models.user import User
+import utils.fraud_detection as fraud_detection
+from utils.metrics import Registry
+
+
+def sample(text, name, **labels):
+    """The value of one sample line in a Prometheus text exposition, or None"""
+    for line in text.splitlines():
+        match = re.match(r'^(\w+)(?:\{(.*)\})? (\S+)$', line)
+        if not match or match.group(1) != name:
+            continue
+        found = dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', match.group(2) or ''))
+        if found == {key: str(value) for key, value in labels.items()}:
+            return float(match.group(3))
+    return None
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram('latency_seconds', 'Latency', ('stage',), buckets=(0.01, 0.1))
+    for value in (0.005, 0.05, 0.05, 3.0):
+        histogram.observe(value, 'rules')
+    text = registry.render()
+
+    assert '# TYPE latency_seconds histogram' in text
+    assert sample(text, 'latency_seconds_bucket', stage='rules', le='0.01') == 1
+    assert sample(text, 'latency_seconds_bucket', stage='rules', le='0.1') == 3
+    assert sample(text, 'latency_seconds_bucket', stage='rules', le='+Inf') == 4
+    assert sample(text, 'latency_seconds_count', stage='rules') == 4
+    assert sample(text, 'latency_seconds_sum', stage='rules') == pytest.approx(3.105)
+
+
+def test_counters_gauges_and_label_escaping():
+    registry = Registry()
+    counter = registry.counter('flags', 'Flags', ('rule',))
+    counter.inc('say "hi"')
+    counter.inc('say "hi"', amount=2)
+    registry.gauge('depth', 'Queue depth', callback=lambda: {(): 7})
+    registry.gauge('broken', 'Raises', callback=lambda: 1 / 0)
+    text = registry.render()
+
+    assert 'flags_total{rule="say \\"hi\\""} 3' in text
+    assert sample(text, 'depth') == 7
+    # A failing callback is skipped rather than failing the scrape
+    assert 'broken' not in text
+
+
+def test_metrics_endpoint_reports_scoring_stages(app, client, monkeypatch):
+    monkeypatch.setattr(fraud_detection, 'ML_MODEL_AVAILABLE', False)
+    monkeypatch.setattr('app.send_fraud_alert', lambda user, transaction: True)
+    db.session.add(User(username='metrics1', userid='metrics1', email='metrics1@example.com',
+                        phone='+15550009001'))
+    db.session.commit()
+
+    before = client.get('/metrics').get_data(as_text=True)
+    assert client.post('/', json={'userid': 'metrics1', 'amount': 25.0}).get_json()['success']
+    assert client.post('/', json={'userid': 'nobody', 'amount': 25.0}).status_code == 400
+    response = client.get('/metrics')
+    text = response.get_data(as_text=True)
+
+    assert response.mimetype == 'text/plain'
+    for stage in ('user_lookup', 'device', 'geolocation', 'history', 'rules', 'ml', 'commit'):
+        count = sample(text, 'fraudguard_stage_seconds_count', stage=stage)
+        assert count is not None and count >= 1, stage
+
+    def delta(name, **labels):
+        return (sample(text, name, **labels) or 0) - (sample(before, name, **labels) or 0)
+
+    assert delta('fraudguard_request_seconds_count', endpoint='index', status='200') == 1
+    assert delta('fraudguard_errors_total', endpoint='index', kind='bad_request') == 1
+    assert delta('fraudguard_transactions_total', outcome='approved') + \
+        delta('fraudguard_transactions_total', outcome='flagged') == 1
+    assert sample(text, 'fraudguard_rule_evaluations_total', rule='has_history') >= 1
+    assert sample(text, 'fraudguard_model_available') == 0
+    assert sample(text, 'fraudguard_notification_queue_depth') is not None
@@ -0,0 +1,113 @@
+import json
+import os
+
+import pytest
+
+import utils.fraud_detection as fraud_detection
+from ml.random_forest_model import FraudDetectionModel
+from ml.registry import ModelRegistry
+from test_feature_engineering import make_transactions
+
+
+def train_small_model(seed):
+    model = FraudDetectionModel()
+    model.model.set_params(n_estimators=5, random_state=seed)
+    transactions = make_transactions(200, seed=seed)
+    for i, t in enumerate(transactions):
+        t['is_fraudulent'] = t['amount'] > 5000 or i % 7 == 0
+    return model, model.train(transactions)
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    """An empty registry the scoring code reads from, with no model loaded yet"""
+    registry = ModelRegistry(str(tmp_path / 'models'))
+    monkeypatch.setattr(fraud_detection, '_registry', registry)
+    monkeypatch.setattr(fraud_detection, '_reload_interval', 0)
+    monkeypatch.setattr(fraud_detection, 'model', None)
+    monkeypatch.setattr(fraud_detection, 'model_version', None)
+    monkeypatch.setattr(fraud_detection, 'ML_MODEL_AVAILABLE', None)
+    monkeypatch.setattr(fraud_detection, '_failed_version', None)
+    return registry
+
+
+def test_publish_and_load(registry):
+    model, metrics = train_small_model(seed=1)
+    version = registry.publish(model, metrics)
+
+    assert version == 'v0001'
+    assert registry.current_version() == version
+    metadata = registry.metadata(version)
+    assert metadata['metrics'] == metrics
+    assert metadata['feature_names'][0] == 'amount'
+
+    loaded, _ = registry.load(version)
+    sample = make_transactions(1, seed=5)[0]
+    assert loaded.predict(sample)['confidence'] == model.predict(sample)['confidence']
+
+
+def test_publish_without_promote(registry):
+    first, _ = train_small_model(seed=1)
+    second, _ = train_small_model(seed=2)
+    registry.publish(first)
+    assert registry.publish(second, promote=False) == 'v0002'
+    assert registry.versions() == ['v0001', 'v0002']
+    assert registry.current_version() == 'v0001'
+
+    with pytest.raises(ValueError):
+        registry.set_current('v0099')
+
+
+def test_hot_reload_swaps_model(registry):
+    assert fraud_detection.get_model() is None
+
+    first, _ = train_small_model(seed=1)
+    registry.publish(first)
+    fraud_detection.load_current_model()
+    serving = fraud_detection.get_model()
+    assert fraud_detection.model_version == 'v0001'
+
+    second, _ = train_small_model(seed=2)
+    registry.publish(second)
+    fraud_detection.load_current_model()
+    assert fraud_detection.model_version == 'v0002'
+    assert fraud_detection.get_model() is not serving
+
+
+def test_corrupt_version_keeps_serving_previous(registry):
+    first, _ = train_small_model(seed=1)
+    registry.publish(first)
+    fraud_detection.load_current_model()
+
+    second, _ = train_small_model(seed=2)
+    version = registry.publish(second)
+    with open(os.path.join(registry.version_dir(version), 'model.pkl'), 'ab') as f:
+        f.write(b'garbage')
+    fraud_detection.load_current_model()
+
+    assert fraud_detection.model_version == 'v0001'
+    assert fraud_detection.get_model() is not None
+
+
+def test_feature_schema_mismatch_is_refused(registry):
+    model, _ = train_small_model(seed=1)
+    version = registry.publish(model)
+    metadata_path = os.path.join(registry.version_dir(version), 'metadata.json')
+    metadata = registry.metadata(version)
+    metadata['feature_names'] = metadata['feature_names'][:-1]
+    with open(metadata_path, 'w') as f:
+        json.dump(metadata, f)
+
+    with pytest.raises(ValueError):
+        registry.load(version)
+
+
+def test_health_reports_model_version(client, registry):
+    model, _ = train_small_model(seed=1)
+    registry.publish(model)
+    fraud_detection.load_current_model()
+
+    data = client.get('/health').get_json()
+    assert data['status'] == 'ok'
+    assert data['model']['version'] == 'v0001'
+    assert data['model']['registry_version'] == 'v0001'
@@ -0,0 +1,192 @@
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from flask import Flask
+
+from config import Config
+from models import db
+from models.notification import Notification
+from utils.notifications import NotificationDispatcher
+
+aiosmtpd_controller = pytest.importorskip('aiosmtpd.controller')
+
+
+class RecordingHandler:
+    """aiosmtpd handler that records messages and how many sessions delivered them"""
+
+    def __init__(self):
+        self.messages = []
+        self.sessions = set()
+        self.lock = threading.Lock()
+
+    async def handle_DATA(self, server, session, envelope):
+        with self.lock:
+            self.messages.append(envelope)
+            self.sessions.add(id(session))
+        return '250 OK'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server():
+    handler = RecordingHandler()
+    controller = aiosmtpd_controller.Controller(handler, hostname='127.0.0.1', port=free_port())
+    controller.start()
+    yield handler, controller.port
+    controller.stop()
+
+
+def make_app(port, **overrides):
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config.update(
+        MAIL_SERVER='127.0.0.1',
+        MAIL_PORT=port,
+        MAIL_USE_TLS=False,
+        MAIL_USERNAME=None,
+        MAIL_PASSWORD=None,
+        MAIL_SUPPRESS_SEND=False,
+        NOTIFICATION_WORKERS=1,
+        NOTIFICATION_RETRY_BACKOFF=0.05,
+        NOTIFICATION_MAX_ATTEMPTS=2,
+    )
+    app.config.update(overrides)
+    db.init_app(app)
+    return app
+
+
+@pytest.fixture
+def outbox():
+    yield
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    db.init_app(app)
+    with app.app_context():
+        Notification.query.delete()
+        db.session.commit()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def statuses(app):
+    with app.app_context():
+        result = [n.status for n in Notification.query.order_by(Notification.id)]
+        db.session.remove()
+    return result
+
+
+def test_messages_share_one_smtp_session(smtp_server, outbox):
+    handler, port = smtp_server
+    app = make_app(port)
+    dispatcher = NotificationDispatcher(app)
+    try:
+        with app.app_context():
+            for i in range(5):
+                dispatcher.enqueue(f'user{i}@example.com', 'Alert', f'body {i}')
+
+        assert wait_for(lambda: len(handler.messages) == 5)
+        assert len(handler.sessions) == 1
+        assert wait_for(lambda: statuses(app) == ['sent'] * 5)
+        assert sorted(m.rcpt_tos[0] for m in handler.messages) == [f'user{i}@example.com' for i in range(5)]
+    finally:
+        dispatcher.stop()
+
+
+def test_pending_outbox_is_recovered_on_start(smtp_server, outbox):
+    handler, port = smtp_server
+    app = make_app(port)
+    with app.app_context():
+        db.session.add(Notification(recipient='late@example.com', subject='Alert', body='from before restart'))
+        db.session.commit()
+
+    dispatcher = NotificationDispatcher(app)
+    try:
+        dispatcher.start()
+        assert wait_for(lambda: len(handler.messages) == 1)
+        assert wait_for(lambda: statuses(app) == ['sent'])
+    finally:
+        dispatcher.stop()
+
+
+def test_dispatchers_sharing_an_outbox_send_each_email_once(smtp_server, outbox):
+    """Two app processes (e.g. gunicorn workers) sweep the same outbox"""
+    handler, port = smtp_server
+    apps = [make_app(port, NOTIFICATION_WORKERS=2), make_app(port, NOTIFICATION_WORKERS=2)]
+    with apps[0].app_context():
+        db.session.add_all([
+            Notification(recipient=f'user{i}@example.com', subject='Alert', body=f'body {i}') for i in range(20)
+        ])
+        db.session.commit()
+
+    dispatchers = [NotificationDispatcher(app) for app in apps]
+    try:
+        for dispatcher in dispatchers:
+            dispatcher.start()
+        assert wait_for(lambda: statuses(apps[0]) == ['sent'] * 20)
+        time.sleep(0.2)
+        assert sorted(m.rcpt_tos[0] for m in handler.messages) == sorted(f'user{i}@example.com' for i in range(20))
+    finally:
+        for dispatcher in dispatchers:
+            dispatcher.stop()
+
+
+def test_stale_claims_are_sent_again(smtp_server, outbox):
+    handler, port = smtp_server
+    app = make_app(port, NOTIFICATION_CLAIM_TIMEOUT=60)
+    now = datetime.now(timezone.utc)
+    with app.app_context():
+        db.session.add_all([
+            # Its worker died an hour ago; the other is still being sent
+            Notification(recipient='stale@example.com', subject='Alert', body='body', status='sending',
+                         claimed_at=now - timedelta(hours=1)),
+            Notification(recipient='busy@example.com', subject='Alert', body='body', status='sending',
+                         claimed_at=now)
+        ])
+        db.session.commit()
+
+    dispatcher = NotificationDispatcher(app)
+    try:
+        dispatcher.start()
+        assert wait_for(lambda: statuses(app) == ['sent', 'sending'])
+        assert [m.rcpt_tos[0] for m in handler.messages] == ['stale@example.com']
+    finally:
+        dispatcher.stop()
+
+
+def test_failed_delivery_is_retried_then_marked_failed(outbox):
+    app = make_app(free_port())  # nothing listens here
+    dispatcher = NotificationDispatcher(app)
+    try:
+        with app.app_context():
+            dispatcher.enqueue('nobody@example.com', 'Alert', 'body')
+        assert wait_for(lambda: statuses(app) == ['failed'])
+        with app.app_context():
+            assert Notification.query.one().attempts == 2
+    finally:
+        dispatcher.stop()
+
+
+def test_suppressed_sending_keeps_outbox(outbox):
+    app = make_app(free_port(), MAIL_SUPPRESS_SEND=True)
+    dispatcher = NotificationDispatcher(app)
+    with app.app_context():
+        start = time.perf_counter()
+        dispatcher.enqueue('user@example.com', 'Alert', 'body')
+        assert time.perf_counter() - start < 1
+    assert statuses(app) == ['pending']
+    assert dispatcher.queue_depth() == 0
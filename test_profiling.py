@@ -0,0 +1,96 @@
+import cProfile
+import json
+import os
+import time
+
+import pytest
+
+from utils.profiling import collapsed_from_stats, top_frames
+
+
+@pytest.fixture
+def profiling(app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'PROFILING_DIR', str(tmp_path))
+    monkeypatch.setitem(app.config, 'PROFILING_TOKEN', 'let-me-profile')
+    profiler = app.extensions['request_profiler']
+    yield tmp_path
+    profiler.stop()
+
+
+def files(directory, extension):
+    return sorted(name for name in os.listdir(directory) if name.endswith(extension))
+
+
+def test_token_header_profiles_request_with_cprofile(app, client, profiling, monkeypatch):
+    monkeypatch.setitem(app.config, 'PROFILING_MODE', 'cprofile')
+
+    assert client.get('/health', headers={'X-Profile-Token': 'wrong'}).status_code == 200
+    assert files(profiling, '.json') == []
+
+    assert client.get('/health', headers={'X-Profile-Token': 'let-me-profile'}).status_code == 200
+    [summary_file] = files(profiling, '.json')
+    profile_id = summary_file[:-len('.json')]
+    assert files(profiling, '.prof') == [profile_id + '.prof']
+    assert files(profiling, '.collapsed') == [profile_id + '.collapsed']
+
+    summary = json.loads((profiling / summary_file).read_text())
+    assert summary['path'] == '/health' and summary['status'] == 200 and summary['mode'] == 'cprofile'
+    assert summary['top_frames']
+
+    listed = client.get('/admin/profiles').get_json()['profiles']
+    assert [profile['id'] for profile in listed] == [profile_id]
+
+
+def test_sampled_requests_record_stacks(app, client, profiling, monkeypatch):
+    monkeypatch.setitem(app.config, 'PROFILING_ENABLED', True)
+    monkeypatch.setitem(app.config, 'PROFILING_SAMPLE_RATE', 1.0)
+    monkeypatch.setitem(app.config, 'PROFILING_INTERVAL', 0.001)
+    writer = app.extensions['transaction_writer']
+    stats = writer.stats
+
+    def slow_stats():
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            pass
+        return stats()
+
+    monkeypatch.setattr(writer, 'stats', slow_stats)
+    assert client.get('/health').status_code == 200
+
+    [summary_file] = files(profiling, '.json')
+    summary = json.loads((profiling / summary_file).read_text())
+    assert summary['mode'] == 'sample' and summary['samples'] > 0
+    assert summary['duration_ms'] >= 50
+    assert 'slow_stats' in summary['top_frames'][0]['frame']
+    collapsed = (profiling / summary_file.replace('.json', '.collapsed')).read_text()
+    assert 'health (app.py' in collapsed
+
+
+def test_only_newest_profiles_are_kept(app, client, profiling, monkeypatch):
+    monkeypatch.setitem(app.config, 'PROFILING_MODE', 'cprofile')
+    monkeypatch.setitem(app.config, 'PROFILING_KEEP', 2)
+    for _ in range(4):
+        client.get('/health', headers={'X-Profile-Token': 'let-me-profile'})
+
+    assert len(files(profiling, '.json')) == 2
+    assert len(os.listdir(profiling)) == 6
+
+
+def test_collapsed_stacks_from_cprofile():
+    def inner():
+        return sum(i * i for i in range(20000))
+
+    def outer():
+        return inner() + inner()
+
+    profile = cProfile.Profile()
+    profile.enable()
+    outer()
+    profile.disable()
+    profile.create_stats()
+
+    collapsed = collapsed_from_stats(profile.stats)
+    stacks = [stack for stack in collapsed if 'outer (' in stack and 'inner (' in stack]
+    assert stacks
+    assert all(stack.index('outer (') < stack.index('inner (') for stack in stacks)
+    assert top_frames(collapsed, sum(collapsed.values()))[0]['share'] > 0
@@ -0,0 +1,173 @@
+import json
+import os
+import random
+import shutil
+from datetime import datetime, timezone
+
+import pytest
+
+from utils.rules import RuleContext, RuleEngine
+
+
+def reference_rules(amount, location, history, current_time, recent_declined):
+    """The hard-coded rules the engine replaced, kept to check flag compatibility"""
+    fraud_flags = []
+    if amount >= 100000.0:
+        fraud_flags.append(f"Amount ${amount:,.2f} exceeds high-risk threshold ${100000.0:,.2f}")
+    elif amount >= 10000.0:
+        fraud_flags.append(f"Amount ${amount:,.2f} exceeds suspicious threshold ${10000.0:,.2f}")
+
+    if history['count']:
+        avg_amount = history['amount_sum'] / history['count']
+        if amount > avg_amount * 5:
+            fraud_flags.append(f"Amount is 5x higher than user average (${avg_amount:.2f})")
+
+        now = current_time.timestamp()
+        recent_transactions = [event for event in history['recent_events'] if now - event[0] <= 300]
+        if recent_transactions:
+            unique_locations = {event[1] for event in recent_transactions}
+            if location not in unique_locations and len(unique_locations) >= 2:
+                fraud_flags.append("Multiple transactions from different locations within 5 minutes")
+
+        if recent_declined >= 3:
+            fraud_flags.append(f"Card declined {recent_declined} times in last 30 minutes")
+
+        if len(recent_transactions) >= 3:
+            fraud_flags.append(f"High transaction frequency: {len(recent_transactions)} transactions in 5 minutes")
+
+    if location in {'Unknown', 'Restricted', 'High Risk Region'}:
+        fraud_flags.append(f"Transaction from suspicious location: {location}")
+    return fraud_flags
+
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules.json')
+LOCATIONS = ['Chicago', 'Miami', 'Houston', 'Unknown', 'Restricted']
+
+
+def random_case(rng, now):
+    count = rng.choice([0, 0, 1, 5, 20])
+    events = [(now.timestamp() - rng.choice([10, 100, 250, 290, 400, 5000]), rng.choice(LOCATIONS))
+              for _ in range(min(count, rng.randint(0, 6)))]
+    history = {
+        'count': count,
+        'amount_sum': sum(rng.uniform(1, 5000) for _ in range(count)),
+        'location_counts': {},
+        'recent_events': events,
+    }
+    amount = rng.choice([5.0, 900.0, 9999.99, 10000.0, 25000.0, 100000.0, 250000.0])
+    return amount, rng.choice(LOCATIONS + ['High Risk Region']), history, rng.randint(0, 5)
+
+
+@pytest.fixture
+def rules_file(tmp_path):
+    path = tmp_path / 'rules.json'
+    shutil.copy(RULES_PATH, path)
+    return path
+
+
+def rewrite(path, update):
+    config = json.loads(path.read_text())
+    update(config)
+    path.write_text(json.dumps(config))
+    # Make sure the change is visible even on coarse mtime filesystems
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+def test_flags_match_hard_coded_rules():
+    engine = RuleEngine(RULES_PATH)
+    rng = random.Random(0)
+    now = datetime.now(timezone.utc)
+    for _ in range(2000):
+        amount, location, history, declined = random_case(rng, now)
+        ctx = RuleContext(amount, location, 'user', history, now, recent_declined=declined)
+        assert engine.evaluate(ctx) == reference_rules(amount, location, history, now, declined)
+
+
+def test_evaluation_order_is_cheapest_first_after_dependencies():
+    engine = RuleEngine(RULES_PATH)
+    order = [spec['id'] for spec in engine.plan.order]
+    assert order[0] == 'has_history'
+    assert order[-1] == 'declined_cards'
+    assert order.index('amount_anomaly') > order.index('has_history')
+
+
+def test_dependents_skipped_without_history():
+    engine = RuleEngine(RULES_PATH)
+    history = {'count': 0, 'amount_sum': 0.0, 'location_counts': {}, 'recent_events': []}
+
+    def fail(window_minutes):
+        raise AssertionError("declines must not be queried for a user without history")
+
+    ctx = RuleContext(50.0, 'Chicago', 'user', history, datetime.now(timezone.utc))
+    ctx.recent_declined = fail
+    assert engine.evaluate(ctx) == []
+
+    stats = {s['id']: s for s in engine.stats()}
+    assert stats['declined_cards']['skipped'] == 1
+    assert stats['declined_cards']['evaluations'] == 0
+    assert stats['amount_threshold']['evaluations'] == 1
+
+
+def test_short_circuit_skips_expensive_rules(rules_file):
+    rewrite(rules_file, lambda config: config.update(short_circuit_cost=50))
+    engine = RuleEngine(str(rules_file))
+    now = datetime.now(timezone.utc)
+    history = {'count': 1, 'amount_sum': 100.0, 'location_counts': {}, 'recent_events': []}
+
+    ctx = RuleContext(20000.0, 'Chicago', 'user', history, now, recent_declined=4)
+    assert engine.evaluate(ctx) == [
+        "Amount $20,000.00 exceeds suspicious threshold $10,000.00",
+        "Amount is 5x higher than user average ($100.00)",
+    ]
+
+    # Nothing flagged yet: the expensive rule still runs
+    ctx = RuleContext(20.0, 'Chicago', 'user', history, now, recent_declined=4)
+    assert engine.evaluate(ctx) == ["Card declined 4 times in last 30 minutes"]
+
+    stats = {s['id']: s for s in engine.stats()}
+    assert stats['declined_cards']['skipped'] == 1
+    assert stats['declined_cards']['evaluations'] == 1
+    assert stats['declined_cards']['hits'] == 1
+
+
+def test_config_reloaded_when_file_changes(rules_file):
+    engine = RuleEngine(str(rules_file))
+    now = datetime.now(timezone.utc)
+    history = {'count': 0, 'amount_sum': 0.0, 'location_counts': {}, 'recent_events': []}
+    ctx = RuleContext(5000.0, 'Chicago', 'user', history, now)
+    assert engine.evaluate(ctx) == []
+
+    def lower_threshold(config):
+        for spec in config['rules']:
+            if spec['id'] == 'amount_threshold':
+                spec['params']['suspicious_amount'] = 1000.0
+    rewrite(rules_file, lower_threshold)
+    assert engine.evaluate(ctx) == ["Amount $5,000.00 exceeds suspicious threshold $1,000.00"]
+
+    # A broken edit keeps the last good rules
+    rules_file.write_text('{"rules": [')
+    os.utime(rules_file, ns=(0, os.stat(rules_file).st_mtime_ns + 2_000_000))
+    assert engine.evaluate(ctx) == ["Amount $5,000.00 exceeds suspicious threshold $1,000.00"]
+
+
+def test_invalid_configs_rejected(tmp_path):
+    path = tmp_path / 'rules.json'
+    cases = [
+        {'rules': [{'id': 'no_such_rule'}]},
+        {'rules': [{'id': 'has_history'}, {'id': 'has_history'}]},
+        {'rules': [{'id': 'amount_anomaly', 'depends_on': ['missing']}]},
+        {'rules': [{'id': 'has_history', 'depends_on': ['amount_anomaly']},
+                   {'id': 'amount_anomaly', 'depends_on': ['has_history']}]},
+    ]
+    for config in cases:
+        path.write_text(json.dumps(config))
+        with pytest.raises(ValueError):
+            RuleEngine(str(path))
+
+
+def test_rule_stats_endpoint(client):
+    response = client.get('/admin/rules')
+    assert response.status_code == 200
+    ids = [s['id'] for s in response.get_json()['rules']]
+    assert 'declined_cards' in ids
@@ -0,0 +1,125 @@
+import json
+import logging
+from datetime import datetime, timezone
+
+import pytest
+
+from models import db
+from models.notification import Notification
+from models.transaction import Transaction
+from models.transaction_flag import TransactionFlag
+from models.user import User
+from models.user_profile import UserProfile
+import utils.fraud_detection as fraud_detection
+from utils.fraud_detection import detect_fraud, render_fraud_flags
+from utils.stream import micro_batches, parse_lines, score_stream
+from utils.user_profiles import update_user_profiles
+
+FEED = [
+    {'userid': 'stream0', 'amount': 100.0, 'location': 'Chicago'},
+    {'userid': 'stream1', 'amount': 20.0, 'location': 'Miami'},
+    {'userid': 'stream0', 'amount': 110.0, 'location': 'Houston'},
+    {'userid': 'stream2', 'amount': 15000.0, 'location': 'Denver'},
+    {'userid': 'stream0', 'amount': 90.0, 'location': 'Boston'},
+    {'userid': 'stream1', 'amount': 900.0, 'location': 'Unknown'},
+    {'userid': 'stream0', 'amount': 5000.0, 'location': 'Chicago'},
+    {'userid': 'stream2', 'amount': 30.0, 'location': 'Denver'},
+]
+
+
+@pytest.fixture
+def users(app, monkeypatch):
+    # ML confidence depends on the wall-clock hour, keep comparisons deterministic
+    monkeypatch.setattr(fraud_detection, 'ML_MODEL_AVAILABLE', False)
+    db.session.add_all([
+        User(username=f'stream{i}', userid=f'stream{i}', email=f'stream{i}@example.com', phone=f'+1555500{i:04d}')
+        for i in range(3)
+    ])
+    db.session.commit()
+
+
+def test_stream_matches_detect_fraud(app, users):
+    lines = [json.dumps(record) for record in FEED]
+    results = list(score_stream(app, lines, batch_size=3, workers=2, send_alerts=False))
+    assert [result['line'] for result in results] == list(range(1, len(FEED) + 1))
+    assert all(result['success'] for result in results)
+    assert Transaction.query.count() == len(FEED)
+
+    # Replay the feed one transaction at a time through detect_fraud
+    TransactionFlag.query.delete()
+    Transaction.query.delete()
+    UserProfile.query.delete()
+    db.session.commit()
+    expected = []
+    for record in FEED:
+        is_fraudulent, fraud_flags = detect_fraud(record['amount'], record['location'], record['userid'])
+        expected.append((is_fraudulent, render_fraud_flags(fraud_flags, record['amount'], record['location'])))
+        transaction = Transaction(userid=record['userid'], amount=record['amount'], device_id='Unknown',
+                                  location=record['location'], is_fraudulent=is_fraudulent,
+                                  timestamp=datetime.now(timezone.utc))
+        transaction.set_flags(fraud_flags)
+        db.session.add(transaction)
+        db.session.flush()
+        update_user_profiles([{'userid': transaction.userid, 'amount': transaction.amount,
+                               'location': transaction.location, 'timestamp': transaction.timestamp}])
+        db.session.commit()
+
+    assert [(r['fraud_detected'], r['fraud_flags'] or []) for r in results] == expected
+    assert any(r['fraud_detected'] for r in results)
+
+
+def test_invalid_lines_reported_in_place(app, users):
+    lines = [
+        json.dumps(FEED[0]),
+        '',
+        '{not json',
+        json.dumps({'userid': 'nobody', 'amount': 5}),
+        json.dumps([1, 2]),
+        json.dumps({'userid': 'stream1', 'amount': -3}),
+        json.dumps(FEED[1]),
+    ]
+    results = list(score_stream(app, lines, batch_size=10, send_alerts=False))
+
+    assert [r['line'] for r in results] == [1, 3, 4, 5, 6, 7]
+    assert [r['success'] for r in results] == [True, False, False, False, False, True]
+    assert results[2]['error'] == 'Invalid user ID'
+    assert results[4]['error'] == 'Amount must be greater than 0'
+
+
+def test_batches_close_when_a_user_repeats():
+    parsed = parse_lines(json.dumps(record) for record in FEED)
+    batches = [[number for number, _ in batch] for batch in micro_batches(parsed, batch_size=3)]
+    assert batches == [[1, 2], [3, 4], [5, 6], [7, 8]]
+
+
+def test_cli_writes_jsonl(app, users, tmp_path):
+    feed = tmp_path / 'feed.jsonl'
+    feed.write_text('\n'.join(json.dumps(record) for record in FEED[:4]) + '\n')
+    output = tmp_path / 'results.jsonl'
+
+    result = app.test_cli_runner().invoke(args=[
+        'score-stream', str(feed), '--output', str(output), '--no-alerts', '--report-interval', '0'])
+
+    assert result.exit_code == 0, result.output
+    results = [json.loads(line) for line in output.read_text().splitlines()]
+    assert len(results) == 4 and all(r['success'] for r in results)
+    assert 'lines/s' in result.output
+
+
+def test_cli_sends_alerts_with_approval_links(app, users, tmp_path, caplog):
+    feed = tmp_path / 'feed.jsonl'
+    feed.write_text(json.dumps({'userid': 'stream0', 'amount': 50000.0, 'location': 'Chicago'}) + '\n')
+    output = tmp_path / 'results.jsonl'
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=['score-stream', str(feed), '--output', str(output)])
+    assert result.exit_code != 0 and '--base-url' in result.output
+
+    caplog.set_level(logging.INFO, logger='utils.notifications')
+    result = runner.invoke(args=['score-stream', str(feed), '--output', str(output), '--report-interval', '0',
+                                 '--base-url', 'https://fraudguard.example.com'])
+    assert result.exit_code == 0, result.output
+    [line] = [json.loads(line) for line in output.read_text().splitlines()]
+    assert line['success'] and line['fraud_detected']
+    assert f"Approve: https://fraudguard.example.com/approve/{line['approval_token']}" in caplog.text
+    assert Notification.query.filter_by(recipient='stream0@example.com').count() == 1
@@ -0,0 +1,44 @@
+import os
+import re
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Cumulative `import app` time, in milliseconds, a cold start may take
+IMPORT_BUDGET_MS = float(os.environ.get('FRAUDGUARD_IMPORT_BUDGET_MS', 1500))
+
+HEAVY_MODULES = ('sklearn', 'scipy', 'pandas', 'joblib')
+
+
+def run_python(code, db_path):
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}', ML_WARM_UP='lazy')
+    return subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=PROJECT_ROOT, env=env, capture_output=True, text=True, check=True
+    )
+
+
+def test_import_does_not_load_heavy_modules(tmp_path):
+    code = (
+        "import sys, app\n"
+        f"print([m for m in {HEAVY_MODULES!r} if m in sys.modules])"
+    )
+    result = run_python(code, tmp_path / 'startup.db')
+    assert result.stdout.strip().splitlines()[-1] == '[]'
+
+
+def test_import_does_not_touch_database(tmp_path):
+    db_path = tmp_path / 'startup.db'
+    run_python("import app", db_path)
+    assert not db_path.exists() or db_path.stat().st_size == 0
+
+
+def test_import_time_within_budget(tmp_path):
+    result = run_python("import app", tmp_path / 'startup.db')
+    cumulative = [
+        int(m.group(1))
+        for m in re.finditer(r'import time:\s+\d+ \|\s+(\d+) \| app$', result.stderr, re.M)
+    ]
+    assert cumulative, result.stderr[-2000:]
+    assert cumulative[-1] / 1000 < IMPORT_BUDGET_MS
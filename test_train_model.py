@@ -0,0 +1,82 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from models import db
+from models.transaction import Transaction
+from models.user import User
+from ml.features import build_feature_matrix
+from ml.random_forest_model import FraudDetectionModel
+from ml.train_model import load_training_columns
+
+BASE_TIME = datetime(2024, 1, 1)
+
+
+def add_history(n_users=12, per_user=40):
+    rng = random.Random(0)
+    db.session.add_all([User(username=f'train{u}', userid=f'train{u}', email=f'train{u}@example.com',
+                             phone=f'+1555000{6000 + u}') for u in range(n_users)])
+    db.session.add_all([
+        Transaction(userid=f'train{u}', amount=round(rng.uniform(1, 5000), 2), device_id='device1',
+                    location=rng.choice(['Chicago', 'Miami', 'Houston', 'Unknown']),
+                    timestamp=BASE_TIME + timedelta(seconds=rng.randint(0, 40 * 86400), microseconds=rng.randint(0, 999999)),
+                    is_fraudulent=rng.random() < 0.2)
+        for u in range(n_users) for _ in range(per_user)
+    ])
+    db.session.commit()
+
+
+def reference_records(*criteria):
+    """Training dicts as train_model.py used to build them from ORM objects"""
+    return [{
+        'userid': t.userid,
+        'amount': float(t.amount),
+        'location': t.location,
+        'timestamp': t.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+        'is_fraudulent': t.is_fraudulent,
+        'device_id': t.device_id
+    } for t in Transaction.query.filter(*criteria).all()]
+
+
+def sorted_rows(features, labels):
+    rows = np.column_stack([features, labels])
+    return rows[np.lexsort(rows.T[::-1])]
+
+
+def test_columns_give_the_same_features_as_records(app):
+    add_history()
+    records = reference_records()
+    expected = sorted_rows(FraudDetectionModel().prepare_features(records),
+                           [r['is_fraudulent'] for r in records])
+
+    for chunk_size in (7, 50_000):
+        columns, labels = load_training_columns(chunk_size=chunk_size)
+        assert columns['timestamps'].dtype == np.int64 and columns['location_codes'].dtype == np.int64
+        np.testing.assert_array_equal(sorted_rows(build_feature_matrix(**columns), labels), expected)
+
+
+def test_time_range_and_user_sample(app):
+    add_history()
+    start, end = BASE_TIME + timedelta(days=10), BASE_TIME + timedelta(days=20)
+    columns, labels = load_training_columns(start=start, end=end)
+    in_range = Transaction.query.filter(Transaction.timestamp >= start, Transaction.timestamp < end).count()
+    assert len(labels) == in_range
+    assert all(start <= datetime.fromtimestamp(t, timezone.utc).replace(tzinfo=None) < end for t in columns['timestamps'].tolist())
+
+    columns, labels = load_training_columns(sample=0.5, chunk_size=13)
+    again, _ = load_training_columns(sample=0.5, chunk_size=1000)
+    np.testing.assert_array_equal(np.sort(columns['amounts']), np.sort(again['amounts']))
+    # Whole users are kept or dropped
+    kept_users = len(np.unique(columns['user_codes']))
+    assert 0 < kept_users < 12
+    assert len(labels) == kept_users * 40
+
+
+def test_train_columns(app):
+    add_history()
+    columns, labels = load_training_columns()
+    model = FraudDetectionModel()
+    metrics = model.train_columns(columns, labels)
+    assert 0 <= metrics['test_accuracy'] <= 1
+    assert model.compiled is not None
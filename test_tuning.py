@@ -0,0 +1,71 @@
+from ml.features import records_to_columns
+from ml.random_forest_model import DEFAULT_PARAMS, FraudDetectionModel
+import ml.tuning as tuning
+from ml.tuning import candidates, search, time_folds
+from test_feature_engineering import make_transactions
+
+
+def test_time_folds_train_only_on_the_past():
+    folds = time_folds(100, 4)
+    assert len(folds) == 4
+    for k, (train, test) in enumerate(folds):
+        assert train.start == 0 and train.stop == test.start
+        assert test.stop > test.start
+        if k:
+            assert train.stop > folds[k - 1][0].stop  # expanding window
+    assert folds[-1][1].stop == 100
+
+
+def test_candidates_cover_the_grid():
+    grid = {'n_estimators': [5, 10], 'max_depth': [3, 4, 5]}
+    params = candidates(grid)
+    assert len(params) == 6
+    assert {'n_estimators': 10, 'max_depth': 4} in params
+
+
+def test_search_reports_quality_and_latency():
+    transactions = make_transactions(1200, n_users=30)
+    for t in transactions:
+        t['is_fraudulent'] = t['amount'] > 4000
+    columns = records_to_columns(transactions)
+    labels = [t['is_fraudulent'] for t in transactions]
+
+    grid = {'n_estimators': [2, 20], 'max_depth': [4]}
+    results = search(columns, labels, grid=grid, n_folds=3, n_jobs=2)
+    assert sorted(r['params']['n_estimators'] for r in results) == [2, 20]
+    for result in results:
+        assert 0 <= result['precision'] <= 1 and 0 <= result['recall'] <= 1
+        assert result['latency_us'] > 0
+        assert result['precision_per_us'] == result['precision'] / result['latency_us']
+    assert results[0]['precision_per_us'] >= results[1]['precision_per_us']
+    # The easy amount threshold is learned on every fold
+    assert min(r['recall'] for r in results) > 0.8
+
+
+def test_model_takes_params():
+    model = FraudDetectionModel(n_estimators=7)
+    assert model.model.n_estimators == 7
+    assert model.params == {**DEFAULT_PARAMS, 'n_estimators': 7}
+
+
+def test_folds_train_the_model_that_gets_published(monkeypatch):
+    import sklearn.ensemble
+    fitted = []
+
+    class RecordingForest(sklearn.ensemble.RandomForestClassifier):
+        def fit(self, X, y):
+            fitted.append(self.get_params())
+            return super().fit(X, y)
+
+    monkeypatch.setattr(sklearn.ensemble, 'RandomForestClassifier', RecordingForest)
+    columns = records_to_columns(make_transactions(200))
+    # What open_shared() maps in a worker process
+    monkeypatch.setattr(tuning, '_shared', {
+        f'fold{fold}_{name}': values
+        for fold, arrays in enumerate(tuning.fold_matrices(columns, columns['amounts'] > 4000, 2))
+        for name, values in arrays.items()
+    })
+
+    tuning.fit_fold({'n_estimators': 3}, 0, 2)
+    published = FraudDetectionModel(n_estimators=3).params
+    assert {name: fitted[0][name] for name in published} == published
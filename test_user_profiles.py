@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from models import db
+from models.transaction import Transaction
+from models.user import User
+from models.user_profile import UserProfile
+import utils.fraud_detection as fraud_detection
+from utils.fraud_detection import apply_rule_based_detection, get_user_history_summary, get_user_transaction_history, render_fraud_flags
+from utils.user_profiles import check_profiles, rebuild_profiles
+
+
+@pytest.fixture
+def user(app, monkeypatch):
+    monkeypatch.setattr(fraud_detection, 'ML_MODEL_AVAILABLE', False)
+    monkeypatch.setattr('app.send_fraud_alert', lambda user, transaction: True)
+    db.session.add(User(username='profiled', userid='profiled', email='p@example.com', phone='+15550003001'))
+    now = datetime.now(timezone.utc)
+    # History that predates the profile table
+    db.session.add_all([
+        Transaction(userid='profiled', amount=100.0 + i, device_id='device1',
+                    location=['Chicago', 'Miami'][i % 2], timestamp=now - timedelta(days=i + 1))
+        for i in range(4)
+    ])
+    db.session.commit()
+    return 'profiled'
+
+
+def test_profile_created_and_maintained_on_each_transaction(client, user, app):
+    assert db.session.get(UserProfile, user) is None
+
+    for amount in (20.0, 30.0):
+        client.post('/', json={'userid': user, 'amount': amount}, environ_base={'REMOTE_ADDR': '10.0.0.1'})
+    client.post('/score/batch', json={'transactions': [
+        {'userid': user, 'amount': 40.0, 'location': 'Houston'},
+        {'userid': user, 'amount': 50.0, 'location': 'Chicago'},
+    ]})
+
+    profile = db.session.get(UserProfile, user)
+    assert profile.transaction_count == 8
+    assert profile.amount_sum == pytest.approx(100 + 101 + 102 + 103 + 20 + 30 + 40 + 50)
+    assert profile.location_counts == {'Chicago': 3, 'Miami': 2, 'Local network': 2, 'Houston': 1}
+    assert check_profiles() == []
+
+
+def test_rules_read_the_same_from_profile_and_raw_history(client, user, app):
+    now = datetime.now(timezone.utc)
+    db.session.add_all([
+        Transaction(userid=user, amount=10.0, device_id='device1', location=location,
+                    timestamp=now - timedelta(seconds=seconds))
+        for location, seconds in [('Chicago', 30), ('Miami', 60), ('Houston', 90)]
+    ])
+    db.session.commit()
+    rebuild_profiles()
+
+    for amount, location in [(5000.0, 'Denver'), (12.0, 'Chicago'), (150000.0, 'Unknown')]:
+        from_profile = apply_rule_based_detection(amount, location, user, get_user_history_summary(user), now)
+        from_history = apply_rule_based_detection(amount, location, user, get_user_transaction_history(user), now)
+        assert from_profile == from_history
+    assert any('within 5 minutes' in flag for flag in render_fraud_flags(from_profile, amount, location))
+
+
+def test_check_reports_drift_and_rebuild_fixes_it(app, user):
+    assert rebuild_profiles() == 1
+    assert check_profiles() == []
+
+    profile = db.session.get(UserProfile, user)
+    profile.transaction_count += 1
+    profile.location_counts = {'Nowhere': 1}
+    db.session.commit()
+
+    problems = dict(check_profiles())
+    assert set(problems) == {user}
+    rebuild_profiles()
+    assert check_profiles() == []
+
+
+def test_recent_events_are_bounded(app, user):
+    app.config['PROFILE_RECENT_EVENTS'] = 3
+    try:
+        rebuild_profiles()
+        events = db.session.get(UserProfile, user).recent_events
+        assert len(events) == 3
+        assert events == sorted(events)
+    finally:
+        app.config['PROFILE_RECENT_EVENTS'] = 100
@@ -0,0 +1,176 @@
+import multiprocessing
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from models import db
+from models.transaction import Transaction
+from models.user import User
+import utils.fraud_detection as fraud_detection
+import utils.velocity as velocity
+from utils.rules import RuleContext, RuleEngine
+from utils.velocity import VelocityStore
+from test_rules import RULES_PATH
+
+NOW = 1_750_000_000.0  # a fixed clock keeps bucket boundaries deterministic
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = VelocityStore(str(tmp_path / 'velocity.bin'), capacity=64)
+    yield store
+    store.close()
+
+
+def test_counts_within_windows(store):
+    for seconds_ago, location in [(5, 'Chicago'), (100, 'Miami'), (250, 'Chicago'), (900, 'Houston')]:
+        store.record('user1', NOW - seconds_ago, location, now=NOW)
+    store.record_decline('user1', NOW - 60, now=NOW)
+    store.record_decline('user1', NOW - 1200, now=NOW)
+    store.record_decline('user1', NOW - 7200, now=NOW)  # too old to matter
+
+    snapshot = store.read('user1')
+    assert snapshot.count(NOW, 300) == 3  # the 900 s old one is outside the ring
+    assert snapshot.count(NOW, 60) == 1
+    assert bin(snapshot.locations(NOW, 300)).count('1') == 2
+    assert snapshot.declined(NOW, 1800) == 2
+    assert snapshot.declined(NOW, 600) == 1
+
+    assert store.read('someone-else').count(NOW, 300) == 0
+
+
+def test_buckets_expire_and_are_reused(store):
+    store.record('user1', NOW, 'Chicago', now=NOW)
+    later = NOW + 320  # the same ring position, one lap later
+    store.record('user1', later, 'Miami', now=later)
+
+    snapshot = store.read('user1')
+    assert snapshot.count(later, 300) == 1
+    assert snapshot.locations(later, 300) == velocity.location_bit('Miami')
+
+
+def test_full_probe_window_evicts_least_recent(tmp_path):
+    store = VelocityStore(str(tmp_path / 'velocity.bin'), capacity=1)
+    for i in range(velocity.PROBE_LENGTH + 1):
+        store.record(f'user{i}', NOW + i, 'Chicago', now=NOW + i)
+    now = NOW + velocity.PROBE_LENGTH
+    assert store.read('user0').count(now, 300) == 0
+    assert all(store.read(f'user{i}').count(now, 300) == 1 for i in range(1, velocity.PROBE_LENGTH + 1))
+    store.close()
+
+
+def test_rules_agree_with_history(store):
+    engine = RuleEngine(RULES_PATH)
+    current_time = datetime.fromtimestamp(NOW, timezone.utc)
+    events = [(NOW - 30, 'Chicago'), (NOW - 60, 'Miami'), (NOW - 90, 'Houston'), (NOW - 1000, 'Denver')]
+    for timestamp, location in events:
+        store.record('user1', timestamp, location, now=NOW)
+    for _ in range(3):
+        store.record_decline('user1', NOW - 120, now=NOW)
+    history = {'count': 4, 'amount_sum': 400.0, 'location_counts': {}, 'recent_events': events}
+
+    for amount, location in [(50.0, 'Chicago'), (50.0, 'Boston'), (15000.0, 'Unknown')]:
+        from_store = engine.evaluate(RuleContext(amount, location, 'user1', history, current_time,
+                                                 velocity=store.read('user1')))
+        from_history = engine.evaluate(RuleContext(amount, location, 'user1', history, current_time,
+                                                   recent_declined=3))
+        assert from_store == from_history
+    assert "High transaction frequency: 3 transactions in 5 minutes" in from_store
+    assert "Card declined 3 times in last 30 minutes" in from_store
+
+
+def hammer(path, worker, threads, records):
+    store = VelocityStore(path, capacity=64)
+
+    def run(thread):
+        for i in range(records):
+            userid = f'user{(worker + thread + i) % 10}'
+            store.record(userid, NOW - (i % 30), f'city{i % 5}', declined=i % 4 == 0, now=NOW)
+
+    pool = [threading.Thread(target=run, args=(t,)) for t in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    store.close()
+
+
+def test_concurrent_updates_from_several_processes(tmp_path):
+    path = str(tmp_path / 'velocity.bin')
+    VelocityStore(path, capacity=64).close()
+    processes, threads, records = 4, 2, 300
+
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=hammer, args=(path, w, threads, records)) for w in range(processes)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join(timeout=120)
+        assert w.exitcode == 0
+
+    store = VelocityStore(path, capacity=64)
+    snapshots = [store.read(f'user{u}') for u in range(10)]
+    assert sum(s.count(NOW, 300) for s in snapshots) == processes * threads * records
+    assert sum(s.declined(NOW, 1800) for s in snapshots) == processes * threads * (records // 4)
+    store.close()
+
+
+@pytest.fixture
+def shared_store(app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'VELOCITY_STORE_PATH', str(tmp_path / 'velocity.bin'))
+    monkeypatch.setitem(app.config, 'VELOCITY_CAPACITY', 64)
+    monkeypatch.setattr(velocity, '_store', None)
+    monkeypatch.setattr(fraud_detection, 'ML_MODEL_AVAILABLE', False)
+    monkeypatch.setattr('app.send_fraud_alert', lambda user, transaction: True)
+    yield
+    if velocity._store is not None:
+        velocity._store.close()
+
+
+def test_rebuilt_from_transactions_on_first_use(app, shared_store):
+    now = datetime.now(timezone.utc)
+    db.session.add(User(username='fast', userid='fast', email='fast@example.com', phone='+15550004001'))
+    db.session.add_all([
+        Transaction(userid='fast', amount=10.0, device_id='device1', location=location,
+                    timestamp=now - timedelta(seconds=seconds), is_declined=seconds > 100)
+        for location, seconds in [('Chicago', 20), ('Miami', 40), ('Houston', 200), ('Denver', 7200)]
+    ])
+    db.session.commit()
+
+    store = velocity.get_velocity_store()
+    assert not store.needs_rebuild()
+    snapshot = store.read('fast')
+    assert snapshot.count(now.timestamp(), 300) == 3
+    assert snapshot.declined(now.timestamp(), 1800) == 1
+
+
+def test_scoring_updates_shared_counters(client, app, shared_store):
+    db.session.add(User(username='fast', userid='fast', email='fast@example.com', phone='+15550004001'))
+    db.session.commit()
+
+    client.post('/score/batch', json={'transactions': [
+        {'userid': 'fast', 'amount': 10.0, 'location': 'Chicago'},
+        {'userid': 'fast', 'amount': 10.0, 'location': 'Miami'},
+    ]})
+    response = client.post('/score/batch', json={'transactions': [
+        {'userid': 'fast', 'amount': 10.0, 'location': 'Houston'},
+    ]})
+    flags = response.get_json()['results'][0]['fraud_flags']
+    assert "Multiple transactions from different locations within 5 minutes" in flags
+
+    transaction = Transaction.query.filter_by(userid='fast', location='Houston').one()  # flagged, so pending
+    client.post(f'/admin/decline/{transaction.id}')
+    snapshot = velocity.get_velocity_store().read('fast')
+    now = datetime.now(timezone.utc).timestamp()
+    assert snapshot.count(now, 300) == 3
+    assert snapshot.declined(now, 1800) == 1
+
+
+def test_no_store_without_fcntl(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(velocity, '_store', None)
+    monkeypatch.setitem(app.config, 'VELOCITY_STORE_PATH', str(tmp_path / 'velocity.bin'))
+    monkeypatch.setattr(velocity, 'fcntl', None)
+    # As on Windows: the rules fall back to reading velocity from the database
+    assert velocity.get_velocity_store() is None
+    assert not (tmp_path / 'velocity.bin').exists()
@@ -0,0 +1,218 @@
+# Async scoring: the independent stages of scoring one transaction run concurrently
+import asyncio
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from models import db
+from models.location import location_code
+from models.transaction import Transaction
+from models.user import User
+import utils.fraud_detection as fraud_detection
+import utils.metrics as metrics
+from utils.device_info import resolve_device
+from utils.geoip import resolve_location
+from utils.group_commit import writer as transaction_writer
+from utils.notifications import send_fraud_alert
+from utils.user_profiles import update_user_profiles
+from utils.velocity import record_transactions
+from werkzeug.exceptions import BadRequest
+
+
+def parse_amount(amount):
+    """Validate a transaction amount and return it as a float"""
+    try:
+        amount = float(amount)
+    except (TypeError, ValueError):
+        raise BadRequest("Invalid amount format")
+    if amount <= 0:
+        raise BadRequest("Amount must be greater than 0")
+    return amount
+
+
+def find_user(userid):
+    return User.query.filter_by(userid=userid).first()
+
+
+def locate(remote_addr):
+    """The client's location and its location table code (interned here, where there is an app context)"""
+    location = resolve_location(remote_addr)
+    return location, location_code(location)
+
+
+def save_transaction(transaction):
+    """Insert a transaction with its profile update, as POST / does; returns its id"""
+    db.session.add(transaction)
+    update = {
+        "userid": transaction.userid,
+        "amount": transaction.amount,
+        "location": transaction.location,
+        "timestamp": transaction.timestamp,
+        "device_key": transaction.device_key
+    }
+    update_user_profiles([update])
+    db.session.commit()
+    record_transactions([update])
+    return transaction.id
+
+
+class AsyncScorer:
+    """
+    Score a transaction with the same rules, model and storage as POST /,
+    but as a coroutine: the user lookup, history fetch, geolocation and
+    device lookup run at the same time, then the rules and the model, each in an executor.
+
+    Database and other blocking work goes to a pool of SCORING_IO_WORKERS
+    threads, each call in its own app context and session. Model inference
+    is CPU-bound, so it gets its own SCORING_ML_WORKERS threads and can't
+    starve the I/O pool. With GROUP_COMMIT on, a request waiting for its
+    batch to commit holds no thread at all.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.io_executor = None
+        self.ml_executor = None
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['async_scorer'] = self
+
+    def start(self):
+        """Create the executors once"""
+        if self.io_executor is not None:
+            return
+        with self.lock:
+            if self.io_executor is None:
+                self.ml_executor = ThreadPoolExecutor(max_workers=self.app.config['SCORING_ML_WORKERS'],
+                                                      thread_name_prefix='score-ml')
+                self.io_executor = ThreadPoolExecutor(max_workers=self.app.config['SCORING_IO_WORKERS'],
+                                                      thread_name_prefix='score-io')
+
+    def stop(self):
+        with self.lock:
+            executors = (self.io_executor, self.ml_executor)
+            self.io_executor = self.ml_executor = None
+        for executor in executors:
+            if executor is not None:
+                executor.shutdown(wait=True)
+
+    def in_app_context(self, func, *args):
+        with self.app.app_context():
+            try:
+                return func(*args)
+            finally:
+                db.session.remove()
+
+    async def run_io(self, stage, func, *args):
+        """Run blocking work in the I/O pool; the stage's time includes waiting for a thread"""
+        with metrics.stage(stage):
+            return await asyncio.get_running_loop().run_in_executor(
+                self.io_executor, self.in_app_context, func, *args)
+
+    async def run_ml(self, *args):
+        with metrics.stage('ml'):
+            return await asyncio.get_running_loop().run_in_executor(
+                self.ml_executor, fraud_detection.predict_transaction, *args)
+
+    def send_alert(self, user, transaction, base_url):
+        # Building the approval link needs a request to take the host from
+        with self.app.test_request_context(base_url=base_url):
+            send_fraud_alert(user, transaction)
+
+    async def score(self, data, user_agent, remote_addr, base_url):
+        """
+        Score and store one transaction from a POST / style JSON body.
+        Returns (response dict, HTTP status).
+        """
+        try:
+            return await self.score_transaction(data, user_agent, remote_addr, base_url)
+        except BadRequest as e:
+            metrics.ERRORS.inc('score_async', 'bad_request')
+            return {"success": False, "error": str(e)}, 400
+        except Exception as e:
+            metrics.ERRORS.inc('score_async', 'unexpected')
+            print(f"Unexpected error: {str(e)}")
+            print(traceback.format_exc())
+            return {"success": False, "error": "An unexpected error occurred"}, 500
+
+    async def score_transaction(self, data, user_agent, remote_addr, base_url):
+        self.start()
+        if not isinstance(data, dict) or not data:
+            raise BadRequest("No JSON data received")
+        userid = data.get("userid")
+        amount = data.get("amount")
+        if not userid or amount is None:
+            raise BadRequest("Missing required fields: userid and amount")
+
+        user, history, (location, code), device = await asyncio.gather(
+            self.run_io('user_lookup', find_user, userid),
+            self.run_io('history', fraud_detection.get_user_history_summary, userid),
+            self.run_io('geolocation', locate, remote_addr),
+            self.run_io('device', resolve_device, user_agent)
+        )
+        if not user:
+            raise BadRequest("Invalid user ID")
+        amount = parse_amount(amount)
+
+        current_time = datetime.now(timezone.utc)
+        rule_based_flags, prediction = await asyncio.gather(
+            self.run_io('rules', fraud_detection.apply_rule_based_detection,
+                        amount, location, userid, history, current_time, None, device['key']),
+            self.run_ml(userid, amount, location, current_time)
+        )
+        is_fraudulent, fraud_flags = fraud_detection.combine_fraud_flags(rule_based_flags, prediction)
+
+        transaction = Transaction(
+            userid=userid,
+            amount=amount,
+            device_id=device['label'],
+            device_key=device['key'],
+            location_code=code,
+            is_fraudulent=is_fraudulent,
+            timestamp=datetime.now(timezone.utc)
+        )
+        transaction.set_flags(fraud_flags)
+        if is_fraudulent:
+            with metrics.stage('token'):
+                transaction.generate_approval_token()
+            await self.run_io('alert', self.send_alert, user, transaction, base_url)
+        else:
+            transaction.is_approved = True
+            transaction.approval_timestamp = datetime.now(timezone.utc)
+        # Read before the commit expires the object in another thread's session
+        is_approved = bool(transaction.is_approved)
+        approval_token = transaction.approval_token
+
+        try:
+            if transaction_writer.enabled:
+                with metrics.stage('commit'):
+                    transaction_id = await transaction_writer.write_async(transaction)
+            else:
+                transaction_id = await self.run_io('commit', save_transaction, transaction)
+        except Exception as e:
+            metrics.ERRORS.inc('score_async', 'database')
+            print(f"Database error: {str(e)}")
+            return {"success": False, "error": "Failed to save transaction"}, 500
+
+        metrics.TRANSACTIONS.inc('flagged' if is_fraudulent else 'approved')
+        # The messages come from the app's rule config; the event loop has no app context
+        with self.app.app_context():
+            rendered_flags = fraud_detection.render_fraud_flags(fraud_flags, amount, location)
+        response_data = {
+            "success": True,
+            "fraud_detected": is_fraudulent,
+            "is_approved": is_approved,
+            "fraud_flags": rendered_flags,
+            "transaction_id": transaction_id
+        }
+        if is_fraudulent:
+            response_data["approval_token"] = approval_token
+        return response_data, 200
+
+
+scorer = AsyncScorer()
@@ -1,5 +1,122 @@
-# Simple fraud detection logic
+# Device fingerprints: user agents parsed once and interned as small integer ids
+import hashlib
+import threading
+from functools import lru_cache
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from models import db
+from models.device import Device
+
+UNKNOWN_USER_AGENT = "Unknown"
+
+
+def major(family, version):
+    return f"{family} {version[0]}" if version and family != 'Other' else family
+
+
+def parse_user_agent(user_agent):
+    """The device a User-Agent string describes (browser and OS with major versions, hardware, kind)"""
+    # user_agents takes a quarter of a second to import; only pay for it when a request needs it
+    from user_agents import parse
+
+    parsed = parse(user_agent)
+    if parsed.is_bot:
+        kind = 'bot'
+    elif parsed.is_tablet:
+        kind = 'tablet'
+    elif parsed.is_mobile:
+        kind = 'mobile'
+    elif parsed.is_pc:
+        kind = 'pc'
+    else:
+        kind = 'other'
+    device = {
+        'browser': major(parsed.browser.family, parsed.browser.version)[:100],
+        'os': major(parsed.os.family, parsed.os.version)[:100],
+        'hardware': parsed.device.family[:100],
+        'kind': kind
+    }
+    device['fingerprint'] = hashlib.sha1(
+        '\x1f'.join((device['browser'], device['os'], device['hardware'], kind)).encode('utf-8')
+    ).hexdigest()
+    return device
+
+
+def device_label(device):
+    """Short readable name for a parsed device, e.g. 'Chrome 120 / Windows 10 / Other'"""
+    return f"{device['browser']} / {device['os']} / {device['hardware']}"[:50]
+
+
+def intern_device(device):
+    """The id of a parsed device's row, inserting it if it is new"""
+    table = Device.__table__
+    query = db.select(table.c.id).where(table.c.fingerprint == device['fingerprint'])
+    # Its own short transaction, so the row exists before any transaction referencing it commits
+    with db.engine.begin() as connection:
+        key = connection.execute(query).scalar()
+        if key is not None:
+            return key
+    try:
+        with db.engine.begin() as connection:
+            return connection.execute(table.insert().values(
+                fingerprint=device['fingerprint'], browser=device['browser'], os=device['os'],
+                hardware=device['hardware'], kind=device['kind']
+            )).inserted_primary_key[0]
+    except IntegrityError:
+        # Another worker interned it first
+        with db.engine.begin() as connection:
+            return connection.execute(query).scalar_one()
+
+
+class DeviceResolver:
+    """Map User-Agent strings to interned devices"""
+
+    def __init__(self, cache_size=4096):
+        # Bounded LRU in front of the regex-based parser; user agents repeat heavily
+        self.parse = lru_cache(maxsize=cache_size)(parse_user_agent)
+        self.keys = {}  # fingerprint -> Device.id; distinct parsed devices are few
+        self.lock = threading.Lock()
+
+    def resolve(self, user_agent):
+        """{'key': Device.id, 'label': ..., 'browser', 'os', 'hardware', 'kind', 'fingerprint'}"""
+        device = self.parse(user_agent or UNKNOWN_USER_AGENT)
+        key = self.keys.get(device['fingerprint'])
+        if key is None:
+            key = intern_device(device)
+            with self.lock:
+                self.keys[device['fingerprint']] = key
+        return dict(device, key=key, label=device_label(device))
+
+    def clear(self):
+        """Forget interned ids, e.g. after the device table was emptied"""
+        with self.lock:
+            self.keys.clear()
+
+    def cache_info(self):
+        return self.parse.cache_info()
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_resolver():
+    """Return the process-wide device resolver"""
+    global _resolver
+    if _resolver is None:
+        with _resolver_lock:
+            if _resolver is None:
+                _resolver = DeviceResolver(current_app.config['DEVICE_CACHE_SIZE'])
+    return _resolver
+
+
+def resolve_device(user_agent):
+    """The interned device for a User-Agent string (see DeviceResolver.resolve)"""
+    return get_resolver().resolve(user_agent)
+
+
 def get_device_info(request):
-    """Extracts device information from request headers"""
-    user_agent = request.headers.get("User-Agent", "Unknown")
-    return user_agent
+    """The interned device the request's User-Agent header describes"""
+    return resolve_device(request.headers.get("User-Agent", UNKNOWN_USER_AGENT))
@@ -0,0 +1,89 @@
+# Stable fraud flag codes, and rendering flags as human-readable messages
+#
+# A flag is a (code, params) pair: the code says which rule (and which of its
+# messages) or which ML finding raised it, params hold the values its message
+# is rendered from. Codes are stored in Transaction.flag_mask (bit 1 << code)
+# and TransactionFlag.code, so never renumber or reuse one.
+
+FLAG_CODES = {
+    # Flag text from before flags were stored as codes that didn't match any
+    # known message; params {'messages': [...]} keeps it verbatim
+    ('legacy', 'text'): 0,
+    ('amount_threshold', 'high_risk'): 1,
+    ('amount_threshold', 'suspicious'): 2,
+    ('amount_anomaly', 'anomaly'): 3,
+    ('rapid_location_change', 'location_change'): 4,
+    ('declined_cards', 'declined'): 5,
+    ('transaction_frequency', 'frequency'): 6,
+    ('suspicious_location', 'location'): 7,
+    ('new_device', 'new_device'): 8,
+    ('ml', 'pattern'): 32,
+    ('ml', 'risk_factor'): 33,
+}
+FLAG_NAMES = {code: name for name, code in FLAG_CODES.items()}
+MAX_CODE = 62  # flag_mask is a signed 64-bit integer
+
+LEGACY_TEXT = FLAG_CODES[('legacy', 'text')]
+ML_PATTERN = FLAG_CODES[('ml', 'pattern')]
+ML_RISK_FACTOR = FLAG_CODES[('ml', 'risk_factor')]
+ML_MESSAGES = {
+    ML_PATTERN: "ML Model detected suspicious pattern (confidence: {confidence:.1%})",
+    ML_RISK_FACTOR: "High risk factor: {feature} (contribution: +{contribution:.1%})",
+}
+
+
+def flag_name(code):
+    """'rule_id.message_key' for a code, e.g. 'amount_threshold.suspicious'"""
+    rule_id, key = FLAG_NAMES[code]
+    return f"{rule_id}.{key}"
+
+
+def flag_mask(flags):
+    """The bitmask of a list of (code, params) flags"""
+    mask = 0
+    for code, _ in flags:
+        mask |= 1 << code
+    return mask
+
+
+def mask_codes(mask):
+    """The flag codes set in a bitmask, ascending"""
+    return [code for code in range(MAX_CODE + 1) if mask >> code & 1]
+
+
+def is_rule_flag(code):
+    return code != LEGACY_TEXT and FLAG_NAMES[code][0] != 'ml'
+
+
+def render_flag(code, params, amount, location, rule_message):
+    rule_id, key = FLAG_NAMES[code]
+    template = ML_MESSAGES.get(code) or rule_message(rule_id, key)
+    if template is not None:
+        try:
+            return template.format(amount=amount, location=location, **(params or {}))
+        except (KeyError, IndexError, ValueError):
+            pass  # the configured message now needs values this flag didn't record
+    return f"{flag_name(code)} {params}" if params else flag_name(code)
+
+
+def render_flags(flags, amount, location, rule_message):
+    """
+    The messages for a transaction's (code, params) flags, in the order they
+    were raised, after a 'Detection method(s)' line; [] without flags.
+    rule_message(rule_id, key) returns the configured message template for
+    a rule flag, or None when the rule is no longer configured.
+    """
+    if not flags:
+        return []
+    for code, params in flags:
+        if code == LEGACY_TEXT:
+            return list(params['messages'])
+
+    methods = []
+    if any(is_rule_flag(code) for code, _ in flags):
+        methods.append("Rule-based")
+    if any(code == ML_PATTERN for code, _ in flags):
+        methods.append("ML-based")
+    messages = [f"Detection method(s): {' & '.join(methods)}"]
+    messages.extend(render_flag(code, params, amount, location, rule_message) for code, params in flags)
+    return messages
@@ -1,137 +1,332 @@
 # Enhanced fraud detection logic
 from models.transaction import Transaction
-import json
+from models.user_profile import UserProfile
+from utils.user_profiles import summarize_history
+from ml.registry import ModelRegistry
+from utils.flags import ML_PATTERN, ML_RISK_FACTOR, render_flags
+from utils.rules import RuleContext, get_rule_engine
+from utils.velocity import get_velocity_store
+import utils.metrics as metrics
+from flask import current_app
+import threading
+import time
 from datetime import datetime, timedelta, timezone
-from ml.random_forest_model import FraudDetectionModel
 from models import db
 
-# Initialize the model
-model = FraudDetectionModel()
-ML_MODEL_AVAILABLE = False
-try:
-    model.load_model()
-    ML_MODEL_AVAILABLE = True
-    print("ML model loaded successfully!")
-except:
-    print("No trained model found. Using rule-based detection only.")
+# The model is loaded on first use (or by warm_up), not at import time:
+# loading it pulls in numpy, joblib and sklearn, which dominate startup.
+# Once loaded, a watcher thread polls the registry's 'current' pointer and
+# swaps in newly promoted versions. The swap is a single reference
+# assignment, so in-flight requests keep scoring with the model they fetched.
+model = None
+model_version = None
+ML_MODEL_AVAILABLE = None  # None until a load has been attempted
+_model_lock = threading.Lock()
+_failed_version = None
+_watcher = None
+_registry = None
+_reload_interval = None
+
+def init_model(app):
+    """Read the registry location and reload interval from the app config"""
+    global _registry, _reload_interval
+    _registry = ModelRegistry(app.config['ML_MODEL_REGISTRY'])
+    _reload_interval = app.config['ML_RELOAD_INTERVAL']
+
+def get_model_registry():
+    global _registry, _reload_interval
+    if _registry is None:
+        # Scripts that don't create the app use the default configuration
+        from config import Config
+        _registry = ModelRegistry(Config.ML_MODEL_REGISTRY)
+        _reload_interval = Config.ML_RELOAD_INTERVAL
+    return _registry
+
+def load_current_model():
+    """
+    Load the registry's current version if it isn't the active one.
+    On failure the previously active model (if any) keeps serving.
+    """
+    global model, model_version, ML_MODEL_AVAILABLE, _failed_version
+    registry = get_model_registry()
+    with _model_lock:
+        version = registry.current_version()
+        if version is None or version in (model_version, _failed_version):
+            if ML_MODEL_AVAILABLE is None:
+                ML_MODEL_AVAILABLE = False
+                print("No trained model found. Using rule-based detection only.")
+            return
+        try:
+            loaded, _ = registry.load(version)
+        except Exception as e:
+            _failed_version = version
+            if ML_MODEL_AVAILABLE is None:
+                ML_MODEL_AVAILABLE = False
+            print(f"Could not load model {version}: {str(e)}")
+            return
+        model, model_version = loaded, version
+        ML_MODEL_AVAILABLE = True
+        print(f"ML model {version} loaded successfully!")
+
+def watch_model_registry():
+    while True:
+        time.sleep(_reload_interval)
+        try:
+            load_current_model()
+        except Exception as e:
+            print(f"Model reload failed: {str(e)}")
+
+def start_model_watcher():
+    """Start the background reload thread once per process (disabled when the interval is 0)"""
+    global _watcher
+    get_model_registry()
+    if _watcher is None and _reload_interval:
+        with _model_lock:
+            if _watcher is None:
+                _watcher = threading.Thread(target=watch_model_registry, name='model-watcher', daemon=True)
+                _watcher.start()
+
+def get_model():
+    """Return the active ML model, loading it on first call; None if unavailable"""
+    if ML_MODEL_AVAILABLE is None:
+        load_current_model()
+        start_model_watcher()
+    return model if ML_MODEL_AVAILABLE else None
+
+def warm_up(background=False):
+    """
+    Load the ML model ahead of the first scoring request.
+    With background=True the load runs in a daemon thread so startup isn't blocked.
+    """
+    if background:
+        thread = threading.Thread(target=get_model, name='model-warm-up', daemon=True)
+        thread.start()
+        return thread
+    return get_model()
+
+def transaction_to_record(t):
+    """Convert a Transaction row into the dict format used by the rules and the model"""
+    return {
+        'userid': t.userid,
+        'amount': float(t.amount),
+        'location': t.location,
+        'timestamp': t.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+        'is_fraudulent': t.is_fraudulent,
+        'device_id': t.device_id,
+        'device_key': t.device_key
+    }
 
 def get_user_transaction_history(userid):
     """Get user's transaction history"""
     transactions = Transaction.query.filter_by(userid=userid).all()
-    transaction_data = []
+    return [transaction_to_record(t) for t in transactions]
+
+def get_transaction_histories(userids):
+    """Get transaction histories for several users with a single query"""
+    histories = {userid: [] for userid in userids}
+    if not histories:
+        return histories
     
+    transactions = Transaction.query.filter(Transaction.userid.in_(list(histories))).all()
     for t in transactions:
-        transaction_data.append({
-            'userid': t.userid,
-            'amount': float(t.amount),
-            'location': t.location,
-            'timestamp': t.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-            'is_fraudulent': t.is_fraudulent,
-            'device_id': t.device_id
-        })
+        histories[t.userid].append(transaction_to_record(t))
     
-    return transaction_data
+    return histories
 
-def apply_rule_based_detection(amount, location, userid, transaction_history, current_time):
-    """Apply rule-based fraud detection"""
-    fraud_flags = []
-    
-    # Rule 1: Basic amount thresholds
-    SUSPICIOUS_AMOUNT = 10000.0
-    HIGH_RISK_AMOUNT = 100000.0
+def get_user_history_summary(userid):
+    """
+    Get the summary of a user's history the rules need, from their profile
+    (one row) or, if the profile was not built yet, from the raw history
+    """
+    profile = db.session.get(UserProfile, userid)
+    if profile is not None:
+        return profile.to_summary()
+    return summarize_history(get_user_transaction_history(userid))
+
+def get_history_summaries(userids):
+    """History summaries for several users: one profile query, plus one raw
+    history query for users without a profile"""
+    userids = set(userids)
+    summaries = {}
+    if userids:
+        for profile in UserProfile.query.filter(UserProfile.userid.in_(userids)).all():
+            summaries[profile.userid] = profile.to_summary()
+
+    missing = userids - set(summaries)
+    if missing:
+        for userid, history in get_transaction_histories(missing).items():
+            summaries[userid] = summarize_history(history)
+    return summaries
+
+def get_recent_declined_counts(userids, current_time, minutes=30):
+    """Count each user's declined transactions in the last X minutes with a single query"""
+    counts = {userid: 0 for userid in userids}
+    if not counts:
+        return counts
     
-    if amount >= HIGH_RISK_AMOUNT:
-        fraud_flags.append(f"Amount ${amount:,.2f} exceeds high-risk threshold ${HIGH_RISK_AMOUNT:,.2f}")
-    elif amount >= SUSPICIOUS_AMOUNT:
-        fraud_flags.append(f"Amount ${amount:,.2f} exceeds suspicious threshold ${SUSPICIOUS_AMOUNT:,.2f}")
+    rows = db.session.query(Transaction.userid, db.func.count(Transaction.id)).filter(
+        Transaction.userid.in_(list(counts)),
+        Transaction.is_declined == True,
+        Transaction.timestamp >= current_time - timedelta(minutes=minutes)
+    ).group_by(Transaction.userid).all()
+    counts.update(dict(rows))
     
-    if transaction_history:
-        # Rule 2: Check for amount anomalies
-        avg_amount = sum(t['amount'] for t in transaction_history) / len(transaction_history)
-        if amount > avg_amount * 5:
-            fraud_flags.append(f"Amount is 5x higher than user average (${avg_amount:.2f})")
-        
-        # Rule 3: Check for rapid location changes
-        recent_transactions = [t for t in transaction_history 
-                             if (current_time - datetime.strptime(t['timestamp'], '%Y-%m-%d %H:%M:%S')
-                                 .replace(tzinfo=timezone.utc)).total_seconds() <= 300]
-        
-        if recent_transactions:
-            unique_locations = {t['location'] for t in recent_transactions}
-            if location not in unique_locations and len(unique_locations) >= 2:
-                fraud_flags.append("Multiple transactions from different locations within 5 minutes")
-        
-        # Rule 4: Check for declined transactions
-        recent_declined = Transaction.query.filter(
-            Transaction.userid == userid,
-            Transaction.is_declined == True,
-            Transaction.timestamp >= current_time - timedelta(minutes=30)
-        ).count()
-        
-        if recent_declined >= 3:
-            fraud_flags.append(f"Card declined {recent_declined} times in last 30 minutes")
+    return counts
+
+def get_rules():
+    return get_rule_engine(current_app.config['RULES_PATH'])
+
+def apply_rule_based_detection(amount, location, userid, transaction_history, current_time,
+                               recent_declined=None, device_key=None):
+    """
+    Apply rule-based fraud detection (rules and thresholds are configured in RULES_PATH).
+    Returns the (code, params) flags raised.
+    transaction_history is a history summary (see UserProfile.to_summary) or
+    a list of history records.
+    recent_declined may be passed in when the caller already counted the
+    user's recent declines (batch scoring); otherwise it is queried if a rule needs it.
+    device_key is the transaction's interned device (utils/device_info.py), if known.
+    """
+    if isinstance(transaction_history, list):
+        transaction_history = summarize_history(transaction_history)
+    store = get_velocity_store()
+    ctx = RuleContext(amount, location, userid, transaction_history, current_time, recent_declined,
+                      velocity=store.read(userid) if store is not None else None, device_key=device_key)
+    return get_rules().evaluate_flags(ctx)
+
+def build_ml_flags(prediction):
+    """Turn an ML prediction into (code, params) fraud flags"""
+    fraud_flags = []
+    if prediction and prediction['is_fraudulent']:
+        fraud_flags.append((ML_PATTERN, {'confidence': float(prediction['confidence'])}))
         
-        # Rule 5: Check transaction frequency
-        if len(recent_transactions) >= 3:
-            fraud_flags.append(f"High transaction frequency: {len(recent_transactions)} transactions in 5 minutes")
+        # Add the features that pushed this transaction's fraud probability up most
+        sorted_features = sorted(prediction['feature_contributions'].items(), 
+                              key=lambda x: x[1], reverse=True)[:2]
+        for feature, contribution in sorted_features:
+            if contribution > 0:
+                fraud_flags.append((ML_RISK_FACTOR, {'feature': feature, 'contribution': float(contribution)}))
+    return fraud_flags
+
+def combine_fraud_flags(rule_based_flags, prediction):
+    """
+    Merge rule-based and ML results into the final (is_fraudulent, fraud_flags)
+    pair; fraud_flags is a list of (code, params), see utils/flags.py
+    """
+    fraud_flags = list(rule_based_flags)
+    fraud_flags.extend(build_ml_flags(prediction))
     
-    # Rule 6: Check for suspicious locations
-    suspicious_locations = {'Unknown', 'Restricted', 'High Risk Region'}
-    if location in suspicious_locations:
-        fraud_flags.append(f"Transaction from suspicious location: {location}")
+    # Determine final fraud status
+    is_fraudulent = len(fraud_flags) > 0
     
-    return fraud_flags
+    return is_fraudulent, fraud_flags
+
+def render_fraud_flags(fraud_flags, amount, location):
+    """The human-readable messages for (code, params) flags, using the configured rule messages"""
+    return render_flags(fraud_flags, amount, location, get_rules().message)
 
-def detect_fraud(amount, location, userid):
+def build_model_input(userid, amount, location, current_time):
+    """Shape a transaction the way the ML model expects it"""
+    return {
+        'userid': userid,
+        'amount': float(amount),
+        'location': location,
+        'timestamp': current_time.strftime('%Y-%m-%d %H:%M:%S'),
+        'is_fraudulent': False,
+        'device_id': None
+    }
+
+def record_prediction(prediction):
+    """Count an ML prediction by result; None means the model was unavailable or failed"""
+    if prediction is not None:
+        metrics.ML_PREDICTIONS.inc('fraud' if prediction['is_fraudulent'] else 'legit')
+
+def predict_transaction(userid, amount, location, current_time):
+    """The ML prediction for one transaction; None if the model is unavailable or fails"""
+    ml_model = get_model()
+    if ml_model is None:
+        return None
+    try:
+        prediction = ml_model.predict(build_model_input(userid, amount, location, current_time))
+    except Exception as e:
+        metrics.ML_ERRORS.inc()
+        print(f"ML prediction failed: {str(e)}")
+        # Continue with rule-based results
+        return None
+    record_prediction(prediction)
+    return prediction
+
+def detect_fraud(amount, location, userid, device_key=None):
     """
     Hybrid fraud detection using both ML and rule-based approaches
     Returns: (is_fraudulent, fraud_flags)
     """
-    fraud_flags = []
     current_time = datetime.now(timezone.utc)
     
-    # Get user's transaction history
-    transaction_history = get_user_transaction_history(userid)
+    # Get a summary of the user's transaction history
+    with metrics.stage('history'):
+        transaction_history = get_user_history_summary(userid)
     
     # Apply rule-based detection
-    rule_based_flags = apply_rule_based_detection(amount, location, userid, transaction_history, current_time)
-    fraud_flags.extend(rule_based_flags)
+    with metrics.stage('rules'):
+        rule_based_flags = apply_rule_based_detection(amount, location, userid, transaction_history, current_time,
+                                                      device_key=device_key)
     
     # Apply ML-based detection if available
-    if ML_MODEL_AVAILABLE:
-        try:
-            current_transaction = {
-                'userid': userid,
-                'amount': float(amount),
-                'location': location,
-                'timestamp': current_time.strftime('%Y-%m-%d %H:%M:%S'),
-                'is_fraudulent': False,
-                'device_id': None
-            }
-            
-            prediction = model.predict(current_transaction)
-            if prediction['is_fraudulent']:
-                fraud_flags.append(f"ML Model detected suspicious pattern (confidence: {prediction['confidence']:.1%})")
-                
-                # Add top contributing factors
-                sorted_features = sorted(prediction['feature_importance'].items(), 
-                                      key=lambda x: x[1], reverse=True)[:2]
-                for feature, importance in sorted_features:
-                    fraud_flags.append(f"High risk factor: {feature} (importance: {importance:.1%})")
-        except Exception as e:
-            print(f"ML prediction failed: {str(e)}")
-            # Continue with rule-based results
+    with metrics.stage('ml'):
+        prediction = predict_transaction(userid, amount, location, current_time)
     
-    # Determine final fraud status
-    is_fraudulent = len(fraud_flags) > 0
+    return combine_fraud_flags(rule_based_flags, prediction)
+
+def detect_fraud_batch(transactions):
+    """
+    Score several transactions at once.
+    transactions: list of dicts with 'amount', 'location', 'userid' and
+    optionally 'device_key'.
+    History and recent declines for every involved user are fetched with one
+    query each, and the ML model scores all rows in one vectorized call.
+    Every transaction is scored against the history as it was before the
+    batch, as if they had all arrived concurrently.
+    Returns: list of (is_fraudulent, fraud_flags), in input order
+    """
+    if not transactions:
+        return []
+    
+    current_time = datetime.now(timezone.utc)
+    userids = {t['userid'] for t in transactions}
+    with metrics.stage('batch_history'):
+        histories = get_history_summaries(userids)
+        declined_params = get_rules().params('declined_cards')
+        if declined_params is not None and get_velocity_store() is None:
+            declined_counts = get_recent_declined_counts(userids, current_time, declined_params['window_minutes'])
+        else:
+            declined_counts = dict.fromkeys(userids)
+    
+    with metrics.stage('batch_rules'):
+        rule_based_flags = [
+            apply_rule_based_detection(
+                t['amount'], t['location'], t['userid'], histories[t['userid']], current_time,
+                recent_declined=declined_counts[t['userid']], device_key=t.get('device_key')
+            )
+            for t in transactions
+        ]
     
-    # Add detection method to flags
-    if fraud_flags:
-        detection_methods = []
-        if rule_based_flags:
-            detection_methods.append("Rule-based")
-        if ML_MODEL_AVAILABLE and prediction.get('is_fraudulent'):
-            detection_methods.append("ML-based")
-        fraud_flags.insert(0, f"Detection method(s): {' & '.join(detection_methods)}")
+    predictions = [None] * len(transactions)
+    with metrics.stage('batch_ml'):
+        ml_model = get_model()
+        if ml_model is not None:
+            try:
+                predictions = ml_model.predict_batch([
+                    build_model_input(t['userid'], t['amount'], t['location'], current_time)
+                    for t in transactions
+                ])
+            except Exception as e:
+                metrics.ML_ERRORS.inc()
+                print(f"ML batch prediction failed: {str(e)}")
+    for prediction in predictions:
+        record_prediction(prediction)
     
-    return is_fraudulent, json.dumps(fraud_flags)
+    return [
+        combine_fraud_flags(flags, prediction)
+        for flags, prediction in zip(rule_based_flags, predictions)
+    ]
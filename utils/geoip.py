@@ -0,0 +1,260 @@
+# Offline IP-to-location lookup
+import bisect
+import csv
+import ipaddress
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+from functools import lru_cache
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN_LOCATION = "Unknown"
+# Neither is a suspicious location: one is a client on our own network, the
+# other means no table is installed to look the address up in
+LOCAL_LOCATION = "Local network"
+UNRESOLVED_LOCATION = "Unresolved"
+
+LOCAL_NETWORKS = [ipaddress.ip_network(network) for network in (
+    '10.0.0.0/8', '172.16.0.0/12', '192.168.0.0/16', '127.0.0.0/8', '169.254.0.0/16',
+    '::1/128', 'fc00::/7', 'fe80::/10'
+)]
+
+# File layout: header, then three uint32 arrays (range starts, range ends,
+# city index) of n_ranges IPv4 entries, then the n_ranges6 IPv6 ranges as
+# 16-byte big-endian starts and ends plus a uint32 city index, then
+# n_cities + 1 uint32 string offsets and the UTF-8 city names they point
+# into. uint32 arrays are in native byte order.
+MAGIC = b'FGI6'
+OLD_MAGIC = b'FGIP'  # IPv4-only tables
+HEADER = struct.Struct('<4s1sxxxIII')
+BYTE_ORDERS = {'little': b'L', 'big': b'B'}
+
+
+def parse_address(ip):
+    """An ipaddress object for ip (IPv4-mapped IPv6 as IPv4), or None"""
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return None
+    if address.version == 6 and address.ipv4_mapped is not None:
+        return address.ipv4_mapped
+    return address
+
+
+def is_local(address):
+    return any(address in network for network in LOCAL_NETWORKS)
+
+
+class Int128Array:
+    """Read-only sequence view of 16-byte big-endian unsigned integers, for bisect"""
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    def __len__(self):
+        return len(self.buffer) // 16
+
+    def __getitem__(self, index):
+        return int.from_bytes(self.buffer[16 * index:16 * index + 16], 'big')
+
+
+def find_range(starts, ends, value):
+    """Position of the sorted, non-overlapping range holding value, or None"""
+    position = bisect.bisect_right(starts, value) - 1
+    if position >= 0 and value <= ends[position]:
+        return position
+    return None
+
+
+class GeoIPResolver:
+    """Resolve IPv4 and IPv6 addresses to a city using a memory-mapped, sorted range table"""
+
+    def __init__(self, filepath, cache_size=65536):
+        self.filepath = filepath
+        with open(filepath, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, byte_order, n_ranges, n_ranges6, n_cities = HEADER.unpack_from(self._mmap, 0)
+        if magic == OLD_MAGIC:
+            raise ValueError(f"{filepath} is an IPv4-only GeoIP table; re-run flask geoip-import")
+        if magic != MAGIC:
+            raise ValueError(f"{filepath} is not a FraudGuard GeoIP table")
+        if byte_order != BYTE_ORDERS[sys.byteorder]:
+            raise ValueError(f"{filepath} was built on a machine with a different byte order")
+
+        view = memoryview(self._mmap)
+        position = HEADER.size
+        words = view[position:position + 3 * n_ranges * 4].cast('I')
+        self.starts = words[:n_ranges]
+        self.ends = words[n_ranges:2 * n_ranges]
+        self.city_index = words[2 * n_ranges:]
+        position += 3 * n_ranges * 4
+
+        self.starts6 = Int128Array(view[position:position + 16 * n_ranges6])
+        self.ends6 = Int128Array(view[position + 16 * n_ranges6:position + 32 * n_ranges6])
+        position += 32 * n_ranges6
+        self.city_index6 = view[position:position + 4 * n_ranges6].cast('I')
+        position += 4 * n_ranges6
+
+        self.names_start = position + (n_cities + 1) * 4
+        self.name_offsets = view[position:self.names_start].cast('I')
+
+        # Bounded LRU in front of the binary search; client IPs repeat heavily
+        self.lookup = lru_cache(maxsize=cache_size)(self._lookup)
+
+    def _city(self, index):
+        start = self.names_start + self.name_offsets[index]
+        end = self.names_start + self.name_offsets[index + 1]
+        return self._mmap[start:end].decode('utf-8')
+
+    def _lookup(self, ip):
+        address = parse_address(ip)
+        if address is None:
+            return UNKNOWN_LOCATION
+
+        if address.version == 4:
+            position = find_range(self.starts, self.ends, int(address))
+            if position is not None:
+                return self._city(self.city_index[position])
+        elif len(self.starts6):
+            position = find_range(self.starts6, self.ends6, int(address))
+            if position is not None:
+                return self._city(self.city_index6[position])
+        elif not is_local(address):
+            # An IPv4-only table can't say where an IPv6 client is
+            return UNRESOLVED_LOCATION
+        # Addresses the table has no range for
+        return LOCAL_LOCATION if is_local(address) else UNKNOWN_LOCATION
+
+    def cache_info(self):
+        return self.lookup.cache_info()
+
+
+def parse_ip(value):
+    """
+    Parse a range boundary given either as an integer or as an IPv4/IPv6
+    address. IPv4-mapped IPv6 boundaries (as in IP2Location's IPv6 files)
+    are returned as IPv4.
+    """
+    value = value.strip()
+    address = parse_address(int(value) if value.isdigit() else value)
+    if address is None:
+        raise ValueError(f"Not an IP address: {value}")
+    return address
+
+
+def import_csv(csv_path, output_path, city_column=5):
+    """
+    Build a binary range table from a CSV range dump.
+    Rows are (start, end, ..., city, ...) with start/end as integers
+    (IP2Location style) or IPv4/IPv6 addresses (DB-IP style). Header rows
+    and malformed rows are skipped.
+    Returns the number of ranges written.
+    """
+    ranges = {4: [], 6: []}
+    cities = {}
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            if len(row) < 3:
+                continue
+            try:
+                start, end = parse_ip(row[0]), parse_ip(row[1])
+            except ValueError:
+                continue
+            if start.version != end.version or start > end:
+                continue
+
+            city = row[city_column] if city_column < len(row) else row[-1]
+            city = city.strip()
+            if not city or city == '-':
+                city = UNKNOWN_LOCATION
+            ranges[start.version].append((int(start), int(end), cities.setdefault(city, len(cities))))
+
+    ranges4, ranges6 = sorted(ranges[4]), sorted(ranges[6])
+
+    names = [name.encode('utf-8') for name in cities]
+    offsets = array('I', [0])
+    for name in names:
+        offsets.append(offsets[-1] + len(name))
+
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, BYTE_ORDERS[sys.byteorder], len(ranges4), len(ranges6), len(names)))
+        f.write(array('I', (r[0] for r in ranges4)).tobytes())
+        f.write(array('I', (r[1] for r in ranges4)).tobytes())
+        f.write(array('I', (r[2] for r in ranges4)).tobytes())
+        f.write(b''.join(r[0].to_bytes(16, 'big') for r in ranges6))
+        f.write(b''.join(r[1].to_bytes(16, 'big') for r in ranges6))
+        f.write(array('I', (r[2] for r in ranges6)).tobytes())
+        f.write(offsets.tobytes())
+        f.write(b''.join(names))
+    os.replace(tmp_path, output_path)
+
+    return len(ranges4) + len(ranges6)
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_resolver():
+    """Return the process-wide resolver, or None when no table is installed"""
+    global _resolver
+    if _resolver is None:
+        with _resolver_lock:
+            if _resolver is None:
+                filepath = current_app.config['GEOIP_DATABASE_PATH']
+                if not os.path.exists(filepath):
+                    return None
+                _resolver = GeoIPResolver(filepath, current_app.config['GEOIP_CACHE_SIZE'])
+    return _resolver
+
+
+def init_geoip(app):
+    """Warn at startup when no GeoIP table is installed"""
+    filepath = app.config['GEOIP_DATABASE_PATH']
+    if not os.path.exists(filepath):
+        logger.warning(f"No GeoIP table at {filepath}: client IPs will not be geolocated and their "
+                       f"transactions are located as 'Unresolved'. Import one with flask geoip-import.")
+
+
+def resolve_location(ip):
+    """
+    Resolve a client IP to a city name. Addresses the table has no range for
+    are 'Unknown', or 'Local network' for private and loopback ones; without
+    a table (or, for IPv6 clients, without IPv6 ranges in it) every other
+    address is 'Unresolved'.
+    """
+    if not ip:
+        return UNRESOLVED_LOCATION
+    resolver = get_resolver()
+    if resolver is None:
+        address = parse_address(ip)
+        return LOCAL_LOCATION if address is not None and is_local(address) else UNRESOLVED_LOCATION
+    return resolver.lookup(ip)
+
+
+@click.command('geoip-import')
+@click.argument('csv_path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--output', type=click.Path(dir_okay=False), default=None,
+              help='Table to write (defaults to GEOIP_DATABASE_PATH)')
+@click.option('--city-column', type=int, default=5, show_default=True,
+              help='Zero-based CSV column holding the city name')
+@with_appcontext
+def geoip_import_command(csv_path, output, city_column):
+    """Import a CSV IP range dump into the GeoIP lookup table"""
+    global _resolver
+    output = output or current_app.config['GEOIP_DATABASE_PATH']
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    count = import_csv(csv_path, output, city_column)
+    _resolver = None
+    click.echo(f"Imported {count} IP ranges into {output}")
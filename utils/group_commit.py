@@ -0,0 +1,241 @@
+# Write-behind group commit for scored transactions
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from sqlalchemy import event
+
+from models import db
+from models.transaction import Transaction
+from utils.user_profiles import update_user_profiles
+from utils.velocity import record_transactions
+
+logger = logging.getLogger(__name__)
+
+SQLITE_JOURNAL_MODES = {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'}
+SQLITE_SYNCHRONOUS = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
+
+
+def sqlite_pragmas(config):
+    """Validated (journal mode, synchronous) settings from the config; '' when unset"""
+    journal_mode = (config.get('SQLITE_JOURNAL_MODE') or '').upper()
+    synchronous = (config.get('SQLITE_SYNCHRONOUS') or '').upper()
+    if journal_mode and journal_mode not in SQLITE_JOURNAL_MODES:
+        raise ValueError(f"Invalid SQLITE_JOURNAL_MODE: {journal_mode}")
+    if synchronous and synchronous not in SQLITE_SYNCHRONOUS:
+        raise ValueError(f"Invalid SQLITE_SYNCHRONOUS: {synchronous}")
+    return journal_mode, synchronous
+
+
+def apply_sqlite_pragmas(app):
+    """Set SQLITE_JOURNAL_MODE / SQLITE_SYNCHRONOUS on every new SQLite connection"""
+    sqlite_pragmas(app.config)  # reject bad values at startup
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        journal_mode, synchronous = sqlite_pragmas(app.config)
+        cursor = dbapi_connection.cursor()
+        if journal_mode:
+            cursor.execute(f'PRAGMA journal_mode = {journal_mode}')
+        if synchronous:
+            cursor.execute(f'PRAGMA synchronous = {synchronous}')
+        cursor.close()
+
+
+def transaction_values(transaction):
+    """
+    Column values of a new, unsaved Transaction (unset columns keep their
+    defaults), plus its fraud flags as (code, params) pairs under 'flags'
+    """
+    values = {}
+    for column in Transaction.__table__.columns:
+        value = getattr(transaction, column.key)
+        if value is not None:
+            values[column.key] = value
+    values['flags'] = transaction.flag_pairs()
+    return values
+
+
+class TransactionWriter:
+    """
+    Persist scored transactions from one background writer thread.
+
+    With GROUP_COMMIT on, requests hand their transaction to the writer and
+    wait for its id. The writer collects everything queued within
+    GROUP_COMMIT_MAX_DELAY seconds of the first row (up to
+    GROUP_COMMIT_MAX_ROWS) and inserts it with the profile updates in a
+    single commit, so concurrent requests share one fsync instead of
+    queueing for the database lock one by one. A request is only answered
+    once its batch has committed.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.queue = None
+        self.thread = None
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.rows = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['transaction_writer'] = self
+        apply_sqlite_pragmas(app)
+
+    @property
+    def enabled(self):
+        return self.app is not None and self.app.config['GROUP_COMMIT']
+
+    def start(self):
+        """Start the writer thread once"""
+        if self.thread is not None:
+            return
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.queue = queue.Queue(maxsize=self.app.config['GROUP_COMMIT_QUEUE_SIZE'])
+            self.thread = threading.Thread(target=self.run, args=(self.queue,),
+                                           name='transaction-writer', daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout=10):
+        """Commit whatever is queued, then stop the writer thread"""
+        with self.lock:
+            thread, work_queue = self.thread, self.queue
+            if thread is None:
+                return
+            self.thread = self.queue = None
+        work_queue.put(None)
+        thread.join(timeout)
+
+    def submit(self, transaction):
+        """Queue a new Transaction; returns a Future resolving to its id once committed"""
+        self.start()
+        future = Future()
+        # Blocks while the queue is full, so a backlog slows requests down instead of growing
+        self.queue.put((transaction_values(transaction), future),
+                       timeout=self.app.config['GROUP_COMMIT_TIMEOUT'])
+        return future
+
+    def write(self, transaction):
+        """Queue a new Transaction and wait until it is committed; returns its id"""
+        future = self.submit(transaction)
+        try:
+            return future.result(timeout=self.app.config['GROUP_COMMIT_TIMEOUT'])
+        except FutureTimeoutError:
+            if future.cancel():
+                # Dropped before the writer picked it up: it will never be written
+                raise
+            # Already part of a batch being committed; the outcome is moments away
+            return future.result()
+
+    async def write_async(self, transaction):
+        """
+        write() for coroutines: waiting for the batch to commit doesn't hold
+        a thread. Queueing still blocks briefly when the queue is full.
+        """
+        future = self.submit(transaction)
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)),
+                                          self.app.config['GROUP_COMMIT_TIMEOUT'])
+        except asyncio.TimeoutError:
+            if future.cancel():
+                raise
+            return await asyncio.wrap_future(future)
+
+    def run(self, work_queue):
+        max_rows = self.app.config['GROUP_COMMIT_MAX_ROWS']
+        max_delay = self.app.config['GROUP_COMMIT_MAX_DELAY']
+        stopping = False
+        while not stopping:
+            item = work_queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + max_delay
+            while len(batch) < max_rows:
+                try:
+                    # Take whatever is already waiting, and wait out the delay for more
+                    if max_delay:
+                        item = work_queue.get(timeout=max(deadline - time.monotonic(), 0))
+                    else:
+                        item = work_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            batch = [(values, future) for values, future in batch if future.set_running_or_notify_cancel()]
+            if batch:
+                self.flush(batch)
+
+    def flush(self, batch):
+        """Insert a batch in one commit; if it fails, retry its rows one by one"""
+        error = None
+        with self.app.app_context():
+            try:
+                ids, updates = self.commit([values for values, _ in batch])
+            except Exception as e:
+                db.session.rollback()
+                error = e
+            else:
+                record_transactions(updates)
+            finally:
+                db.session.remove()
+
+        if error is not None:
+            if len(batch) == 1:
+                logger.error(f"Failed to save transaction: {str(error)}")
+                batch[0][1].set_exception(error)
+                return
+            # One bad row shouldn't fail everyone else's request
+            logger.warning(f"Batch of {len(batch)} transactions failed, retrying individually: {str(error)}")
+            for item in batch:
+                self.flush([item])
+            return
+
+        with self.lock:
+            self.batches += 1
+            self.rows += len(batch)
+        for (_, future), transaction_id in zip(batch, ids):
+            future.set_result(transaction_id)
+
+    def commit(self, rows):
+        transactions = []
+        for values in rows:
+            values = dict(values)
+            flags = values.pop('flags', [])
+            transaction = Transaction(**values)
+            transaction.set_flags(flags)
+            transactions.append(transaction)
+        db.session.add_all(transactions)
+        updates = [{
+            "userid": t.userid, "amount": t.amount, "location": t.location, "timestamp": t.timestamp,
+            "device_key": t.device_key
+        } for t in transactions]
+        update_user_profiles(updates)
+        ids = [t.id for t in transactions]
+        db.session.commit()
+        return ids, updates
+
+    def stats(self):
+        with self.lock:
+            return {
+                'enabled': bool(self.enabled),
+                'batches': self.batches,
+                'rows': self.rows,
+                'queue_depth': self.queue.qsize() if self.queue is not None else 0
+            }
+
+
+writer = TransactionWriter()
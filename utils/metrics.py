@@ -0,0 +1,177 @@
+# In-process metrics (histograms, counters, gauges) exported in the Prometheus text format
+import bisect
+import threading
+import time
+
+# Seconds; fine-grained at the low end where most scoring stages land
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0)
+
+
+def format_labels(labelnames, values):
+    if not labelnames:
+        return ''
+    pairs = []
+    for name, value in zip(labelnames, values):
+        value = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    A monotonically increasing count per label combination. Either inc()
+    it, or pass a callback that returns {label values tuple: value} and is
+    called at scrape time (for counts another component already keeps).
+    """
+    kind = 'counter'
+    suffix = '_total'
+
+    def __init__(self, name, help, labelnames=(), callback=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        if self.callback is not None:
+            values = self.callback()
+        else:
+            with self.lock:
+                values = dict(self.values)
+        for labels, value in sorted(values.items()):
+            yield self.name + self.suffix, self.labelnames, labels, value
+
+
+class Gauge(Counter):
+    """A value that goes up and down; set() it or pass a scrape-time callback"""
+    kind = 'gauge'
+    suffix = ''
+
+    def set(self, value, *labels):
+        with self.lock:
+            self.values[labels] = value
+
+
+class Histogram:
+    """Observation counts in fixed buckets plus their sum, per label combination"""
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.series = {}  # labels -> [per-bucket counts (last is +Inf), sum]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def time(self, *labels):
+        return Timer(self, labels)
+
+    def samples(self):
+        with self.lock:
+            series = {labels: ([*counts], total) for labels, (counts, total) in self.series.items()}
+        bucket_labelnames = self.labelnames + ('le',)
+        for labels, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield self.name + '_bucket', bucket_labelnames, labels + (format_value(bound),), cumulative
+            yield self.name + '_sum', self.labelnames, labels, total
+            yield self.name + '_count', self.labelnames, labels, cumulative
+
+
+class Timer:
+    """Context manager observing the elapsed wall time into a histogram"""
+    __slots__ = ('histogram', 'labels', 'started')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        return False
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=(), callback=None):
+        return self.register(Counter(name, help, labelnames, callback))
+
+    def gauge(self, name, help, labelnames=(), callback=None):
+        return self.register(Gauge(name, help, labelnames, callback))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def render(self):
+        """Every metric in the Prometheus text exposition format (0.0.4)"""
+        lines = []
+        with self.lock:
+            metrics = list(self.metrics)
+        for metric in metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                # A failing gauge callback shouldn't take the whole endpoint down
+                print(f"Error collecting metric {metric.name}: {str(e)}")
+                continue
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labelnames, labels, value in samples:
+                lines.append(f'{name}{format_labels(labelnames, labels)} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+# Metrics are per process: with several workers, scrape each or sum them
+registry = Registry()
+
+REQUEST_SECONDS = registry.histogram(
+    'fraudguard_request_seconds', 'Request latency by endpoint and status', ('endpoint', 'status'))
+STAGE_SECONDS = registry.histogram(
+    'fraudguard_stage_seconds', 'Latency of each stage of scoring a transaction', ('stage',))
+TRANSACTIONS = registry.counter(
+    'fraudguard_transactions', 'Scored and saved transactions by outcome', ('outcome',))
+ML_PREDICTIONS = registry.counter(
+    'fraudguard_ml_predictions', 'ML model predictions by result', ('result',))
+ML_ERRORS = registry.counter('fraudguard_ml_errors', 'ML predictions that raised')
+ERRORS = registry.counter('fraudguard_errors', 'Failed requests by endpoint and kind', ('endpoint', 'kind'))
+
+
+def stage(name):
+    """Time a scoring stage: `with stage('rules'): ...`"""
+    return Timer(STAGE_SECONDS, (name,))
@@ -1,10 +1,14 @@
 import os
 from flask import url_for
 import logging
-from datetime import datetime, timezone
+import queue
+import threading
+from datetime import datetime, timedelta, timezone
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from models import db
+from models.notification import Notification
 
 # Configure logging
 logging.basicConfig(
@@ -19,15 +23,292 @@ SMTP_PORT = 587
 SMTP_USERNAME = "tushartripathi2002@gmail.com"  # Replace with your email
 SMTP_PASSWORD = "pera mhae iwwx cmis"      # Replace with your app password
 
+class NotificationDispatcher:
+    """
+    Deliver outbox emails from a pool of background workers.
+
+    Alerts are written to the Notification outbox before they are queued, so
+    they survive restarts: pending rows are picked up again when the
+    dispatcher starts and by a periodic sweep. A worker claims a row (pending
+    to sending) before sending it, so with several app processes sweeping the
+    same outbox each email still goes out once. Each worker keeps one SMTP
+    session open and reuses it for every message it sends.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.queue = None
+        self.workers = []
+        self.in_flight = set()
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.started = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['notification_dispatcher'] = self
+        app.before_request(self.start)
+
+    def smtp_settings(self):
+        """SMTP settings from the app config, falling back to the module defaults"""
+        config = self.app.config
+        if config.get('MAIL_SERVER'):
+            return {
+                'server': config['MAIL_SERVER'],
+                'port': config['MAIL_PORT'],
+                'use_tls': config['MAIL_USE_TLS'],
+                'username': config.get('MAIL_USERNAME'),
+                'password': config.get('MAIL_PASSWORD'),
+                'sender': config.get('MAIL_USERNAME') or SMTP_USERNAME
+            }
+        return {
+            'server': SMTP_SERVER,
+            'port': SMTP_PORT,
+            'use_tls': True,
+            'username': SMTP_USERNAME,
+            'password': SMTP_PASSWORD,
+            'sender': SMTP_USERNAME
+        }
+
+    def start(self):
+        """Start the worker pool once; pending outbox rows are recovered on start"""
+        if self.started:
+            return
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+            if self.app.config['MAIL_SUPPRESS_SEND']:
+                logger.info("Email sending suppressed; alerts stay in the outbox")
+                return
+
+            self.stopping.clear()
+            self.queue = queue.Queue(maxsize=self.app.config['NOTIFICATION_QUEUE_SIZE'])
+            self.workers = [
+                threading.Thread(target=self.run_worker, args=(self.queue,), name=f'notification-worker-{i}', daemon=True)
+                for i in range(self.app.config['NOTIFICATION_WORKERS'])
+            ]
+            self.workers.append(threading.Thread(target=self.run_sweeper, name='notification-sweeper', daemon=True))
+            for worker in self.workers:
+                worker.start()
+
+    def stop(self, timeout=10):
+        """Stop the workers after they finish the message in hand"""
+        with self.lock:
+            if not self.started:
+                return
+            self.started = False
+            if self.queue is None:
+                return
+            self.stopping.set()
+            for _ in range(self.app.config['NOTIFICATION_WORKERS']):
+                try:
+                    self.queue.put_nowait(None)
+                except queue.Full:
+                    pass
+            workers, self.workers = self.workers, []
+        for worker in workers:
+            worker.join(timeout)
+        self.in_flight.clear()
+        self.queue = None
+
+    def queue_depth(self):
+        return self.queue.qsize() if self.queue is not None else 0
+
+    def enqueue(self, recipient, subject, body):
+        """Persist an email to the outbox and hand it to the workers; returns immediately"""
+        with db.engine.begin() as connection:
+            result = connection.execute(Notification.__table__.insert().values(
+                recipient=recipient,
+                subject=subject,
+                body=body,
+                status='pending',
+                attempts=0,
+                created_at=datetime.now(timezone.utc)
+            ))
+            notification_id = result.inserted_primary_key[0]
+
+        self.start()
+        self.submit(notification_id)
+        return notification_id
+
+    def submit(self, notification_id):
+        """Queue an outbox row for delivery unless it is already queued"""
+        if self.queue is None or self.stopping.is_set():
+            return False
+        with self.lock:
+            if notification_id in self.in_flight:
+                return False
+            self.in_flight.add(notification_id)
+        try:
+            self.queue.put_nowait(notification_id)
+            return True
+        except queue.Full:
+            # Backpressure: the row stays pending and the sweep retries it later
+            with self.lock:
+                self.in_flight.discard(notification_id)
+            logger.warning(f"Notification queue full; notification {notification_id} deferred")
+            return False
+
+    def recover_pending(self):
+        """
+        Queue every pending outbox row that is not already in flight. Rows
+        claimed longer than NOTIFICATION_CLAIM_TIMEOUT ago, by a worker that
+        died before finishing, are made pending again first.
+        """
+        with self.app.app_context():
+            cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.app.config['NOTIFICATION_CLAIM_TIMEOUT'])
+            Notification.query.filter(
+                Notification.status == 'sending',
+                Notification.claimed_at < cutoff
+            ).update({'status': 'pending', 'claimed_at': None}, synchronize_session=False)
+            db.session.commit()
+            pending = db.session.query(Notification.id).filter(
+                Notification.status == 'pending'
+            ).order_by(Notification.id).all()
+            db.session.remove()
+        for (notification_id,) in pending:
+            if not self.submit(notification_id) and self.queue is not None and self.queue.full():
+                break
+
+    def run_sweeper(self):
+        while not self.stopping.is_set():
+            try:
+                self.recover_pending()
+            except Exception as e:
+                logger.error(f"Outbox sweep failed: {str(e)}")
+            self.stopping.wait(self.app.config['NOTIFICATION_SWEEP_INTERVAL'])
+
+    def connect(self, settings):
+        server = smtplib.SMTP(settings['server'], settings['port'],
+                              timeout=self.app.config['NOTIFICATION_SMTP_TIMEOUT'])
+        if settings['use_tls']:
+            server.starttls()
+        if settings['username'] and settings['password']:
+            server.login(settings['username'], settings['password'])
+        return server
+
+    @staticmethod
+    def close(server):
+        if server is None:
+            return
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def run_worker(self, work_queue):
+        settings = self.smtp_settings()
+        server = None
+        while True:
+            try:
+                notification_id = work_queue.get(timeout=self.app.config['NOTIFICATION_SMTP_IDLE_TIMEOUT'])
+            except queue.Empty:
+                # Don't hold an idle session open indefinitely
+                self.close(server)
+                server = None
+                continue
+            if notification_id is None:
+                break
+            server = self.deliver(notification_id, server, settings)
+        self.close(server)
+
+    @staticmethod
+    def claim(notification_id):
+        """Take a pending row for sending; False when another worker, in any process, has it"""
+        table = Notification.__table__
+        with db.engine.begin() as connection:
+            result = connection.execute(table.update().where(
+                table.c.id == notification_id,
+                table.c.status == 'pending'
+            ).values(status='sending', claimed_at=datetime.now(timezone.utc)))
+        return result.rowcount == 1
+
+    def deliver(self, notification_id, server, settings):
+        """Send one outbox row over the worker's session; returns the session to reuse"""
+        with self.app.app_context():
+            try:
+                if not self.claim(notification_id):
+                    self.release(notification_id)
+                    return server
+                notification = db.session.get(Notification, notification_id)
+
+                msg = MIMEMultipart()
+                msg['From'] = settings['sender']
+                msg['To'] = notification.recipient
+                msg['Subject'] = notification.subject
+                msg.attach(MIMEText(notification.body, 'plain'))
+
+                try:
+                    if server is None:
+                        server = self.connect(settings)
+                    try:
+                        server.send_message(msg)
+                    except smtplib.SMTPServerDisconnected:
+                        # The pooled session timed out; reconnect once
+                        server = self.connect(settings)
+                        server.send_message(msg)
+                except Exception as e:
+                    self.close(server)
+                    server = None
+                    self.record_failure(notification, e)
+                    return server
+
+                notification.status = 'sent'
+                notification.attempts += 1
+                notification.sent_at = datetime.now(timezone.utc)
+                db.session.commit()
+                self.release(notification_id)
+                logger.info(f"Transaction alert email sent to {notification.recipient}")
+            except Exception as e:
+                db.session.rollback()
+                self.release(notification_id)
+                logger.error(f"Failed to process notification {notification_id}: {str(e)}")
+            finally:
+                db.session.remove()
+        return server
+
+    def record_failure(self, notification, error):
+        notification.attempts += 1
+        notification.last_error = str(error)
+        max_attempts = self.app.config['NOTIFICATION_MAX_ATTEMPTS']
+        if notification.attempts >= max_attempts:
+            notification.status = 'failed'
+            db.session.commit()
+            self.release(notification.id)
+            logger.error(f"Failed to send email to {notification.recipient} after {max_attempts} attempts: {str(error)}")
+            return
+
+        # Back to pending, so the retry (or another process's sweep) can claim it again
+        notification.status = 'pending'
+        db.session.commit()
+        delay = self.app.config['NOTIFICATION_RETRY_BACKOFF'] * 2 ** (notification.attempts - 1)
+        logger.warning(f"Failed to send email to {notification.recipient}, retrying in {delay:.1f}s: {str(error)}")
+        timer = threading.Timer(delay, self.retry, [notification.id])
+        timer.daemon = True
+        timer.start()
+
+    def retry(self, notification_id):
+        """Re-queue a message after its backoff; it stays in flight meanwhile"""
+        if self.queue is None or self.stopping.is_set():
+            self.release(notification_id)
+            return
+        try:
+            self.queue.put_nowait(notification_id)
+        except queue.Full:
+            self.release(notification_id)
+
+    def release(self, notification_id):
+        with self.lock:
+            self.in_flight.discard(notification_id)
+
+dispatcher = NotificationDispatcher()
+
 def send_transaction_email(user, transaction):
-    """Send transaction details via email"""
+    """Queue an email with the transaction details; delivery happens in the background"""
     try:
-        # Create message
-        msg = MIMEMultipart()
-        msg['From'] = SMTP_USERNAME
-        msg['To'] = user.email
-        msg['Subject'] = "🚨 FraudGuard: Suspicious Transaction Alert"
-
         # Get current time if timestamp is None
         transaction_time = transaction.timestamp or datetime.now(timezone.utc)
 
@@ -53,23 +334,16 @@ def send_transaction_email(user, transaction):
         FraudGuard Security Team
         """
 
-        msg.attach(MIMEText(body, 'plain'))
-
-        # Connect to SMTP server
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SMTP_USERNAME, SMTP_PASSWORD)
-            server.send_message(msg)
-
-        logger.info(f"Transaction alert email sent to {user.email}")
+        dispatcher.enqueue(user.email, "🚨 FraudGuard: Suspicious Transaction Alert", body)
+        logger.info(f"Transaction alert email queued for {user.email}")
         return True
 
     except Exception as e:
-        logger.error(f"Failed to send email: {str(e)}")
+        logger.error(f"Failed to queue email: {str(e)}")
         return False
 
 def send_fraud_alert(user, transaction):
-    """Send fraud alerts via SMS and email"""
+    """Send fraud alerts via SMS and email (the email is queued, not sent inline)"""
     
     # Generate approval token if not exists
     if not transaction.approval_token:
@@ -0,0 +1,298 @@
+# Sampled per-request profiling: collapsed stacks, cProfile dumps and a slowest-requests index
+import cProfile
+import hmac
+import itertools
+import json
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+from flask import g, request
+
+PROFILING_MODES = ['sample', 'cprofile']
+PROFILE_HEADER = 'X-Profile-Token'
+TOP_FRAMES = 10
+MAX_STACK_DEPTH = 128
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def short_path(filename):
+    """Paths relative to the repo or site-packages, to keep frame names readable"""
+    if filename.startswith(ROOT + os.sep):
+        return os.path.relpath(filename, ROOT)
+    marker = 'site-packages' + os.sep
+    if marker in filename:
+        return filename.split(marker, 1)[1]
+    return os.path.basename(filename)
+
+
+def frame_name(filename, lineno, function):
+    if filename == '~':  # builtins in cProfile output
+        return function
+    return f"{function} ({short_path(filename)}:{lineno})"
+
+
+def collapse_frame(frame):
+    """A frame's stack, outermost first, as a flamegraph 'a;b;c' line"""
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(frame_name(code.co_filename, code.co_firstlineno, code.co_name))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def collapsed_from_stats(stats, min_seconds=1e-5):
+    """
+    Approximate collapsed stacks (microseconds of self time per stack) from
+    cProfile's caller/callee edges: a function's time is split between the
+    paths that reach it in proportion to the time each caller spent in it.
+    Recursion is cut at the first repeat, and paths under min_seconds are dropped.
+    """
+    children = defaultdict(dict)
+    roots = []
+    for func, (_, _, _, _, callers) in stats.items():
+        if not any(caller in stats for caller in callers):
+            roots.append(func)
+        for caller, (_, _, _, edge_seconds) in callers.items():
+            children[caller][func] = edge_seconds
+
+    collapsed = Counter()
+
+    def walk(func, path, on_path, share):
+        _, _, self_seconds, total_seconds, _ = stats[func]
+        if self_seconds * share >= min_seconds:
+            collapsed[';'.join(path)] += int(self_seconds * share * 1e6)
+        if len(path) >= MAX_STACK_DEPTH:
+            return
+        for child, edge_seconds in children[func].items():
+            child_total = stats[child][3]
+            if child in on_path or not child_total or edge_seconds * share < min_seconds:
+                continue
+            on_path.add(child)
+            walk(child, path + [frame_name(*child)], on_path, edge_seconds * share / child_total)
+            on_path.discard(child)
+
+    for root in roots:
+        walk(root, [frame_name(*root)], {root}, 1.0)
+    return collapsed
+
+
+def top_frames(collapsed, total, limit=TOP_FRAMES):
+    """The frames with the most self time (the last frame of each stack)"""
+    self_time = Counter()
+    for stack, value in collapsed.items():
+        self_time[stack.rsplit(';', 1)[-1]] += value
+    return [{"frame": frame, "share": round(value / total, 4) if total else 0.0}
+            for frame, value in self_time.most_common(limit)]
+
+
+class StackSampler:
+    """
+    One background thread that snapshots the stacks of the threads serving
+    profiled requests every `interval` seconds. Its cost is paid only while
+    a profiled request is in flight, and never inside the request itself.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.active = {}  # thread id -> Counter of collapsed stacks
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='stack-sampler', daemon=True)
+        self.thread.start()
+
+    def add(self, ident):
+        with self.lock:
+            self.active[ident] = Counter()
+        self.wake.set()
+
+    def remove(self, ident):
+        with self.lock:
+            return self.active.pop(ident, Counter())
+
+    def run(self):
+        while not self.stopping.is_set():
+            if not self.active:
+                self.wake.wait(0.5)
+                self.wake.clear()
+                continue
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self.lock:
+                for ident, stacks in self.active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        stacks[collapse_frame(frame)] += 1
+            del frames
+
+    def stop(self):
+        self.stopping.set()
+        self.wake.set()
+        self.thread.join()
+
+
+class RequestProfiler:
+    """
+    Profile a sampled fraction of requests (PROFILING_SAMPLE_RATE, when
+    PROFILING_ENABLED), plus any request carrying PROFILING_TOKEN in the
+    X-Profile-Token header.
+
+    Each profiled request leaves <id>.json (method, path, status, duration,
+    top frames) and <id>.collapsed (flamegraph.pl / speedscope input) in
+    PROFILING_DIR, plus <id>.prof (pstats) in cprofile mode. Only the newest
+    PROFILING_KEEP requests are kept, and every worker writes to the same
+    directory, so slowest() covers the whole deployment.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.sampler = None
+        self.lock = threading.Lock()
+        self.ids = itertools.count()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if app.config['PROFILING_MODE'] not in PROFILING_MODES:
+            raise ValueError(f"PROFILING_MODE must be one of: {', '.join(PROFILING_MODES)}")
+        self.app = app
+        app.extensions['request_profiler'] = self
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        app.teardown_request(self.abandon_request)
+
+    def should_profile(self):
+        config = self.app.config
+        token = config.get('PROFILING_TOKEN')
+        header = request.headers.get(PROFILE_HEADER)
+        if token and header and hmac.compare_digest(header.encode(), token.encode()):
+            return True
+        return config['PROFILING_ENABLED'] and random.random() < config['PROFILING_SAMPLE_RATE']
+
+    def start_request(self):
+        if not self.should_profile():
+            return
+        mode = self.app.config['PROFILING_MODE']
+        if mode == 'cprofile':
+            profiler = cProfile.Profile()
+            g.profiling = (mode, profiler, time.perf_counter())
+            profiler.enable()
+        else:
+            self.get_sampler().add(threading.get_ident())
+            g.profiling = (mode, None, time.perf_counter())
+
+    def finish_request(self, response):
+        profiling = g.pop('profiling', None)
+        if profiling is None:
+            return response
+        mode, profiler, started = profiling
+        if profiler is not None:
+            profiler.disable()
+        duration = time.perf_counter() - started
+
+        if profiler is not None:
+            stats = pstats.Stats(profiler)
+            collapsed = collapsed_from_stats(stats.stats)
+            total = sum(collapsed.values())
+        else:
+            collapsed = self.sampler.remove(threading.get_ident())
+            total = sum(collapsed.values())
+        try:
+            self.save({
+                "method": request.method,
+                "path": request.path,
+                "endpoint": request.endpoint,
+                "status": response.status_code,
+                "duration_ms": round(duration * 1000, 3),
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "mode": mode,
+                "samples": total if profiler is None else None,
+                "top_frames": top_frames(collapsed, total)
+            }, collapsed, stats if profiler is not None else None)
+        except OSError as e:
+            # Profiling must never fail the request it observes
+            print(f"Error saving request profile: {str(e)}")
+        return response
+
+    def abandon_request(self, exc):
+        """Stop profiling a request that never reached finish_request"""
+        profiling = g.pop('profiling', None)
+        if profiling is None:
+            return
+        mode, profiler, _ = profiling
+        if profiler is not None:
+            profiler.disable()
+        elif self.sampler is not None:
+            self.sampler.remove(threading.get_ident())
+
+    def get_sampler(self):
+        if self.sampler is None:
+            with self.lock:
+                if self.sampler is None:
+                    self.sampler = StackSampler(self.app.config['PROFILING_INTERVAL'])
+        return self.sampler
+
+    def stop(self):
+        with self.lock:
+            sampler, self.sampler = self.sampler, None
+        if sampler is not None:
+            sampler.stop()
+
+    def save(self, summary, collapsed, stats=None):
+        directory = self.app.config['PROFILING_DIR']
+        os.makedirs(directory, exist_ok=True)
+        # Sortable by time, unique across workers
+        profile_id = (f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}"
+                      f"-{os.getpid()}-{next(self.ids)}")
+        summary["id"] = profile_id
+        path = os.path.join(directory, profile_id)
+
+        with open(path + '.collapsed', 'w', encoding='utf-8') as f:
+            for stack, value in collapsed.most_common():
+                f.write(f"{stack} {value}\n")
+        if stats is not None:
+            stats.dump_stats(path + '.prof')
+        # The summary is written last: slowest() only lists complete profiles
+        with open(path + '.json.tmp', 'w', encoding='utf-8') as f:
+            json.dump(summary, f)
+        os.replace(path + '.json.tmp', path + '.json')
+        self.prune(directory)
+
+    def prune(self, directory):
+        """Delete all but the newest PROFILING_KEEP profiles"""
+        keep = self.app.config['PROFILING_KEEP']
+        ids = sorted({name.split('.', 1)[0] for name in os.listdir(directory)})
+        for profile_id in ids[:max(len(ids) - keep, 0)]:
+            for extension in ('.json', '.collapsed', '.prof', '.json.tmp'):
+                try:
+                    os.remove(os.path.join(directory, profile_id + extension))
+                except FileNotFoundError:
+                    pass
+
+    def slowest(self, limit=20):
+        """Summaries of the slowest profiled requests on disk, slowest first"""
+        directory = self.app.config['PROFILING_DIR']
+        if not os.path.isdir(directory):
+            return []
+        summaries = []
+        for name in os.listdir(directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(directory, name), encoding='utf-8') as f:
+                    summaries.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # pruned or half-written by another worker
+        summaries.sort(key=lambda summary: summary['duration_ms'], reverse=True)
+        return summaries[:limit]
+
+
+profiler = RequestProfiler()
@@ -0,0 +1,343 @@
+# Declarative rule engine for rule-based fraud detection
+import heapq
+import json
+import os
+import string
+import threading
+import time
+from datetime import timedelta
+
+from models.transaction import Transaction
+from utils.flags import FLAG_CODES, render_flag
+from utils.velocity import LONG_COVERAGE, SHORT_COVERAGE, location_bit
+
+# Rule implementations by id. A rule gets the transaction context and its
+# params from the config and returns a list of (message key, values) hits,
+# or None when it doesn't apply (rules depending on it are then skipped).
+RULES = {}
+
+
+def rule(rule_id):
+    def register(func):
+        RULES[rule_id] = func
+        return func
+    return register
+
+
+class RuleContext:
+    """The transaction being scored, plus lazily computed facts rules share"""
+
+    def __init__(self, amount, location, userid, history, current_time, recent_declined=None,
+                 velocity=None, device_key=None):
+        self.amount = amount
+        self.location = location
+        self.userid = userid
+        self.history = history
+        self.current_time = current_time
+        self._recent_declined = recent_declined
+        self._recent_events = {}
+        # VelocitySnapshot of the shared counters, used for windows they cover
+        self.velocity = velocity
+        self.device_key = device_key
+
+    def recent_events(self, window_seconds):
+        """The user's (epoch, location) events within window_seconds of now"""
+        if window_seconds not in self._recent_events:
+            now = self.current_time.timestamp()
+            self._recent_events[window_seconds] = [
+                event for event in self.history['recent_events'] if now - event[0] <= window_seconds
+            ]
+        return self._recent_events[window_seconds]
+
+    def recent_count(self, window_seconds):
+        """Number of the user's transactions within window_seconds"""
+        if self.velocity is not None and window_seconds <= SHORT_COVERAGE:
+            return self.velocity.count(self.current_time.timestamp(), window_seconds)
+        return len(self.recent_events(window_seconds))
+
+    def recent_locations(self, window_seconds):
+        """(distinct locations within window_seconds, whether this transaction's location is one of them)"""
+        if self.velocity is not None and window_seconds <= SHORT_COVERAGE:
+            bitmap = self.velocity.locations(self.current_time.timestamp(), window_seconds)
+            return bin(bitmap).count('1'), bool(bitmap & location_bit(self.location))
+        locations = {event[1] for event in self.recent_events(window_seconds)}
+        return len(locations), self.location in locations
+
+    def device_features(self):
+        """
+        {'new_device': the transaction's device was never used by this user,
+        'device_count': distinct devices the user used, 'device_transactions':
+        the user's transactions with a known device}
+        """
+        device_counts = self.history.get('device_counts') or {}
+        return {
+            'new_device': self.device_key is not None and str(self.device_key) not in device_counts,
+            'device_count': len(device_counts),
+            'device_transactions': sum(device_counts.values())
+        }
+
+    def recent_declined(self, window_minutes):
+        """
+        Declined transactions in the last window_minutes: passed in by the
+        caller, read from the velocity counters, or queried
+        """
+        if self._recent_declined is None and self.velocity is not None and window_minutes * 60 <= LONG_COVERAGE:
+            self._recent_declined = self.velocity.declined(self.current_time.timestamp(), window_minutes * 60)
+        if self._recent_declined is None:
+            self._recent_declined = Transaction.query.filter(
+                Transaction.userid == self.userid,
+                Transaction.is_declined == True,
+                Transaction.timestamp >= self.current_time - timedelta(minutes=window_minutes)
+            ).count()
+        return self._recent_declined
+
+
+@rule('has_history')
+def has_history(ctx, params):
+    return [] if ctx.history['count'] else None
+
+
+@rule('amount_threshold')
+def amount_threshold(ctx, params):
+    if ctx.amount >= params['high_risk_amount']:
+        return [('high_risk', {})]
+    if ctx.amount >= params['suspicious_amount']:
+        return [('suspicious', {})]
+    return []
+
+
+@rule('amount_anomaly')
+def amount_anomaly(ctx, params):
+    avg_amount = ctx.history['amount_sum'] / ctx.history['count']
+    if ctx.amount > avg_amount * params['multiplier']:
+        return [('anomaly', {'avg_amount': avg_amount})]
+    return []
+
+
+@rule('rapid_location_change')
+def rapid_location_change(ctx, params):
+    distinct, seen = ctx.recent_locations(params['window_seconds'])
+    if not seen and distinct >= params['min_locations']:
+        return [('location_change', {'window_minutes': params['window_seconds'] / 60})]
+    return []
+
+
+@rule('declined_cards')
+def declined_cards(ctx, params):
+    declined = ctx.recent_declined(params['window_minutes'])
+    if declined >= params['min_declines']:
+        return [('declined', {'declined': declined})]
+    return []
+
+
+@rule('transaction_frequency')
+def transaction_frequency(ctx, params):
+    count = ctx.recent_count(params['window_seconds'])
+    if count >= params['min_transactions']:
+        return [('frequency', {'count': count, 'window_minutes': params['window_seconds'] / 60})]
+    return []
+
+
+@rule('new_device')
+def new_device(ctx, params):
+    features = ctx.device_features()
+    if features['new_device'] and features['device_transactions'] >= params['min_transactions']:
+        return [('new_device', {'device_count': features['device_count']})]
+    return []
+
+
+@rule('suspicious_location')
+def suspicious_location(ctx, params):
+    if ctx.location in params['locations']:
+        return [('location', {})]
+    return []
+
+
+def message_fields(template):
+    """The values a message template uses besides the transaction's amount and location"""
+    fields = set()
+    for _, name, _, _ in string.Formatter().parse(template):
+        if name:
+            fields.add(name.split('.')[0].split('[')[0])
+    return fields - {'amount', 'location'}
+
+
+class RulePlan:
+    """
+    A validated rule config in evaluation order: dependencies first, then
+    cheapest first. Flags are reported in declaration order regardless.
+    """
+
+    def __init__(self, config):
+        self.short_circuit_cost = config.get('short_circuit_cost')
+        self.rules = {}
+        for position, spec in enumerate(config['rules']):
+            rule_id = spec['id']
+            if rule_id in self.rules:
+                raise ValueError(f"Duplicate rule id: {rule_id}")
+            if rule_id not in RULES:
+                raise ValueError(f"No implementation for rule: {rule_id}")
+            messages = spec.get('messages', {})
+            for key in messages:
+                if (rule_id, key) not in FLAG_CODES:
+                    raise ValueError(f"No flag code for message {key} of rule {rule_id}")
+            self.rules[rule_id] = {
+                'id': rule_id,
+                'position': position,
+                'cost': spec.get('cost', 0),
+                'depends_on': spec.get('depends_on', []),
+                'params': spec.get('params', {}),
+                'messages': messages,
+                # Only the values its message uses are stored with a flag
+                'fields': {key: message_fields(template) for key, template in messages.items()},
+                'func': RULES[rule_id],
+            }
+        for spec in self.rules.values():
+            for dependency in spec['depends_on']:
+                if dependency not in self.rules:
+                    raise ValueError(f"Rule {spec['id']} depends on unknown rule {dependency}")
+        self.order = self.evaluation_order()
+
+    def evaluation_order(self):
+        waiting = {rule_id: set(spec['depends_on']) for rule_id, spec in self.rules.items()}
+        ready = [(spec['cost'], spec['position'], rule_id)
+                 for rule_id, spec in self.rules.items() if not waiting[rule_id]]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            _, _, rule_id = heapq.heappop(ready)
+            order.append(self.rules[rule_id])
+            for other, dependencies in waiting.items():
+                if rule_id in dependencies:
+                    dependencies.discard(rule_id)
+                    if not dependencies:
+                        spec = self.rules[other]
+                        heapq.heappush(ready, (spec['cost'], spec['position'], other))
+        if len(order) != len(self.rules):
+            cyclic = sorted(set(self.rules) - {spec['id'] for spec in order})
+            raise ValueError(f"Rule dependency cycle among: {', '.join(cyclic)}")
+        return order
+
+    def params(self, rule_id):
+        return self.rules[rule_id]['params'] if rule_id in self.rules else None
+
+
+class RuleEngine:
+    """
+    Evaluates the rules in a JSON config file, reloading the file when it
+    changes and keeping per-rule latency and hit counters.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.mtime = None
+        self.plan = None
+        self._stats = {}
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        """Load the config if it changed; an invalid file keeps the current plan"""
+        mtime = os.stat(self.filepath).st_mtime_ns
+        if mtime == self.mtime:
+            return
+        try:
+            with open(self.filepath, encoding='utf-8') as f:
+                plan = RulePlan(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            if self.plan is None:
+                raise
+            print(f"Error reloading rules from {self.filepath}: {str(e)}")
+        else:
+            self.plan = plan
+        self.mtime = mtime
+
+    def evaluate(self, ctx):
+        """Return the flag messages the transaction triggers, in declaration order"""
+        return [render_flag(code, params, ctx.amount, ctx.location, self.message)
+                for code, params in self.evaluate_flags(ctx)]
+
+    def evaluate_flags(self, ctx):
+        """Return the (code, params) flags the transaction triggers, in declaration order"""
+        self.reload()
+        plan = self.plan
+        hits = []
+        inapplicable = set()
+        timings = []
+        for spec in plan.order:
+            rule_id = spec['id']
+            if inapplicable.intersection(spec['depends_on']):
+                inapplicable.add(rule_id)
+                timings.append((rule_id, None, False))
+                continue
+            if (plan.short_circuit_cost is not None and hits
+                    and spec['cost'] >= plan.short_circuit_cost):
+                timings.append((rule_id, None, False))
+                continue
+
+            start = time.perf_counter()
+            result = spec['func'](ctx, spec['params'])
+            elapsed = time.perf_counter() - start
+
+            if result is None:
+                inapplicable.add(rule_id)
+            else:
+                for key, values in result:
+                    values = {**spec['params'], **values}
+                    params = {name: values[name] for name in spec['fields'][key] if name in values}
+                    hits.append((spec['position'], (FLAG_CODES[(rule_id, key)], params)))
+            timings.append((rule_id, elapsed, bool(result)))
+
+        self.record(timings)
+        hits.sort(key=lambda hit: hit[0])
+        return [flag for _, flag in hits]
+
+    def message(self, rule_id, key):
+        """A rule flag's configured message template, or None"""
+        spec = self.plan.rules.get(rule_id)
+        return spec['messages'].get(key) if spec is not None else None
+
+    def record(self, timings):
+        with self._lock:
+            for rule_id, elapsed, hit in timings:
+                stats = self._stats.setdefault(
+                    rule_id, {'evaluations': 0, 'skipped': 0, 'hits': 0, 'total_seconds': 0.0})
+                if elapsed is None:
+                    stats['skipped'] += 1
+                    continue
+                stats['evaluations'] += 1
+                stats['hits'] += hit
+                stats['total_seconds'] += elapsed
+
+    def stats(self):
+        """Per-rule counters in evaluation order, with mean latency in microseconds"""
+        with self._lock:
+            result = []
+            for spec in self.plan.order:
+                stats = dict(self._stats.get(
+                    spec['id'], {'evaluations': 0, 'skipped': 0, 'hits': 0, 'total_seconds': 0.0}))
+                stats['id'] = spec['id']
+                stats['cost'] = spec['cost']
+                stats['mean_us'] = (stats['total_seconds'] / stats['evaluations'] * 1e6
+                                    if stats['evaluations'] else 0.0)
+                result.append(stats)
+            return result
+
+    def params(self, rule_id):
+        """A rule's params, or None when it isn't configured"""
+        self.reload()
+        return self.plan.params(rule_id)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_rule_engine(filepath):
+    """The process-wide engine for the given config file"""
+    global _engine
+    if _engine is None or _engine.filepath != filepath:
+        with _engine_lock:
+            if _engine is None or _engine.filepath != filepath:
+                _engine = RuleEngine(filepath)
+    return _engine
@@ -0,0 +1,269 @@
+# Streaming JSONL scoring pipeline: parse -> micro-batch -> score -> store -> emit
+import json
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from models import db
+from models.transaction import Transaction
+from models.user import User
+from utils.device_info import resolve_device
+from utils.fraud_detection import detect_fraud_batch, render_fraud_flags
+from utils.geoip import UNRESOLVED_LOCATION, resolve_location
+from utils.notifications import send_fraud_alert
+from utils.user_profiles import update_user_profiles
+from utils.velocity import record_transactions
+
+
+def parse_lines(lines):
+    """Yield (line number, record dict) or (line number, error message) per non-blank line"""
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield number, f"Invalid JSON: {e.msg}"
+            continue
+        if not isinstance(record, dict):
+            yield number, "Transaction must be a JSON object"
+            continue
+        yield number, record
+
+
+def micro_batches(parsed, batch_size):
+    """
+    Group parsed lines into batches of up to batch_size.
+    A batch is closed early when a user repeats, so every transaction is
+    scored against a history that includes the user's earlier lines, just
+    as scoring them one by one with detect_fraud would.
+    """
+    batch, userids = [], set()
+    for number, record in parsed:
+        userid = record.get('userid') if isinstance(record, dict) else None
+        if len(batch) >= batch_size or (userid is not None and userid in userids):
+            yield batch
+            batch, userids = [], set()
+        batch.append((number, record))
+        if userid is not None:
+            userids.add(userid)
+    if batch:
+        yield batch
+
+
+def batch_userids(batch):
+    return {record.get('userid') for _, record in batch if isinstance(record, dict)}
+
+
+def validate(record, users):
+    """Return (userid, amount) or raise ValueError with the reason"""
+    userid = record.get('userid')
+    if not userid or record.get('amount') is None:
+        raise ValueError("Missing required fields: userid and amount")
+    if userid not in users:
+        raise ValueError("Invalid user ID")
+    try:
+        amount = float(record['amount'])
+    except (TypeError, ValueError):
+        raise ValueError("Invalid amount format")
+    if amount <= 0:
+        raise ValueError("Amount must be greater than 0")
+    return userid, amount
+
+
+def score_and_store(batch, send_alerts=True, base_url=None):
+    """
+    Score one micro-batch and insert it in a single transaction, as the
+    /score/batch endpoint does. Alert approval links are built against
+    base_url (or SERVER_NAME). Returns one result dict per line, in order.
+    """
+    results = {}
+    users = {user.userid: user for user in User.query.filter(User.userid.in_(batch_userids(batch))).all()}
+
+    valid = []
+    for number, record in batch:
+        if isinstance(record, str):
+            results[number] = {"line": number, "success": False, "error": record}
+            continue
+        try:
+            userid, amount = validate(record, users)
+        except ValueError as e:
+            results[number] = {"line": number, "success": False, "error": str(e)}
+            continue
+        location = record.get('location')
+        if not location and record.get('ip'):
+            location = resolve_location(record['ip'])
+        device = resolve_device(str(record['user_agent'])) if record.get('user_agent') else None
+        valid.append((number, {
+            "userid": userid,
+            "amount": amount,
+            "location": location or UNRESOLVED_LOCATION,
+            "device_id": device['label'] if device else str(record.get('device_id') or 'Unknown')[:50],
+            "device_key": device['key'] if device else None
+        }))
+
+    scores = detect_fraud_batch([item for _, item in valid])
+    transactions = []
+    for (number, item), (is_fraudulent, fraud_flags) in zip(valid, scores):
+        transaction = Transaction(
+            userid=item["userid"],
+            amount=item["amount"],
+            device_id=item["device_id"],
+            device_key=item["device_key"],
+            location=item["location"],
+            is_fraudulent=is_fraudulent,
+            timestamp=datetime.now(timezone.utc)
+        )
+        transaction.set_flags(fraud_flags)
+        if is_fraudulent:
+            transaction.generate_approval_token()
+            if send_alerts:
+                # Building the approval link needs a request to take the host from
+                with current_app.test_request_context(base_url=base_url):
+                    send_fraud_alert(users[item["userid"]], transaction)
+        else:
+            transaction.is_approved = True
+            transaction.approval_timestamp = datetime.now(timezone.utc)
+        transactions.append((number, transaction))
+
+    try:
+        db.session.add_all([transaction for _, transaction in transactions])
+        updates = [{
+            "userid": t.userid, "amount": t.amount, "location": t.location, "timestamp": t.timestamp,
+            "device_key": t.device_key
+        } for _, t in transactions]
+        update_user_profiles(updates)
+
+        for (number, transaction), (is_fraudulent, fraud_flags) in zip(transactions, scores):
+            result = {
+                "line": number,
+                "success": True,
+                "fraud_detected": is_fraudulent,
+                "is_approved": transaction.is_approved,
+                "fraud_flags": render_fraud_flags(fraud_flags, transaction.amount, transaction.location),
+                "transaction_id": transaction.id
+            }
+            if is_fraudulent:
+                result["approval_token"] = transaction.approval_token
+            results[number] = result
+
+        db.session.commit()
+        record_transactions(updates)
+    except Exception as e:
+        db.session.rollback()
+        print(f"Database error: {str(e)}", file=sys.stderr)
+        for number, _ in transactions:
+            results[number] = {"line": number, "success": False, "error": "Failed to save transaction"}
+
+    return [results[number] for number, _ in batch]
+
+
+class ThroughputReport:
+    """Running counts and batch latencies, printed every interval seconds"""
+
+    def __init__(self, interval, out=sys.stderr):
+        self.interval = interval
+        self.out = out
+        self.started = self.last_report = time.perf_counter()
+        self.lines = 0
+        self.errors = 0
+        self.latencies = []
+
+    def add(self, results, latency):
+        self.lines += len(results)
+        self.errors += sum(1 for result in results if not result["success"])
+        self.latencies.append(latency)
+        now = time.perf_counter()
+        if self.interval and now - self.last_report >= self.interval:
+            self.last_report = now
+            self.print()
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            return latencies[min(int(p * len(latencies)), len(latencies) - 1)] * 1000 if latencies else 0.0
+
+        return {
+            "lines": self.lines,
+            "errors": self.errors,
+            "batches": len(latencies),
+            "lines_per_second": self.lines / elapsed if elapsed else 0.0,
+            "batch_p50_ms": percentile(0.50),
+            "batch_p99_ms": percentile(0.99),
+        }
+
+    def print(self):
+        s = self.summary()
+        click.echo(
+            f"{s['lines']} lines ({s['errors']} errors) in {s['batches']} batches, "
+            f"{s['lines_per_second']:.0f} lines/s, batch p50 {s['batch_p50_ms']:.1f} ms, "
+            f"p99 {s['batch_p99_ms']:.1f} ms",
+            err=True
+        )
+
+
+def score_stream(app, lines, batch_size=100, workers=1, send_alerts=True, report=None, base_url=None):
+    """
+    Score JSONL lines, yielding one result per line in input order.
+    At most `workers` batches are in flight; a batch waits for any in-flight
+    batch that involves the same users, so per-user ordering is kept.
+    """
+    def run(batch):
+        started = time.perf_counter()
+        with app.app_context():
+            try:
+                return score_and_store(batch, send_alerts, base_url), time.perf_counter() - started
+            finally:
+                db.session.remove()
+
+    in_flight = deque()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='score-stream') as executor:
+        def drain_oldest():
+            future, _ = in_flight.popleft()
+            results, latency = future.result()
+            if report is not None:
+                report.add(results, latency)
+            return results
+
+        for batch in micro_batches(parse_lines(lines), batch_size):
+            userids = batch_userids(batch)
+            while in_flight and (len(in_flight) >= workers
+                                 or any(userids & busy for _, busy in in_flight)):
+                yield from drain_oldest()
+            in_flight.append((executor.submit(run, batch), userids))
+        while in_flight:
+            yield from drain_oldest()
+
+
+@click.command('score-stream')
+@click.argument('input_file', type=click.File('r', encoding='utf-8'), default='-')
+@click.option('--output', '-o', type=click.File('w', encoding='utf-8'), default='-',
+              help='Where to write JSONL results (default stdout)')
+@click.option('--batch-size', type=click.IntRange(min=1), default=100, show_default=True)
+@click.option('--workers', type=click.IntRange(min=1), default=2, show_default=True)
+@click.option('--no-alerts', is_flag=True, help='Do not send alerts for flagged transactions')
+@click.option('--base-url', default=None,
+              help='Public URL of the app, for the approval links in alerts (default: from SERVER_NAME)')
+@click.option('--report-interval', type=float, default=5.0, show_default=True,
+              help='Seconds between throughput reports on stderr (0 for a final report only)')
+@with_appcontext
+def score_stream_command(input_file, output, batch_size, workers, no_alerts, base_url, report_interval):
+    """Score a JSON Lines transaction feed (file or stdin) and write JSONL results"""
+    app = current_app._get_current_object()
+    if not no_alerts and not base_url and not app.config.get('SERVER_NAME'):
+        raise click.UsageError("Alerts need the app's public URL for their approval links: "
+                               "pass --base-url, set SERVER_NAME, or use --no-alerts")
+    report = ThroughputReport(report_interval)
+    for result in score_stream(app, input_file, batch_size, workers, not no_alerts, report, base_url):
+        output.write(json.dumps(result) + '\n')
+    output.flush()
+    report.print()
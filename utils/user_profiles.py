@@ -0,0 +1,241 @@
+# Maintenance of the per-user behavioral profiles used for scoring
+import itertools
+from datetime import datetime, timezone
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from models import db
+from models.location import location_name
+from models.transaction import Transaction
+from models.user_profile import UserProfile
+
+profiles_cli = AppGroup('profiles', help='Maintain per-user behavioral profiles.')
+
+
+def to_epoch(timestamp):
+    """Whole epoch seconds of a naive-UTC or aware datetime, like the '%Y-%m-%d %H:%M:%S' history format"""
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return int(timestamp.timestamp())
+
+
+def count_device(device_counts, device_key):
+    """Count a transaction's device; keys are strings, as JSON stores them"""
+    if device_key is not None:
+        device_counts[str(device_key)] = device_counts.get(str(device_key), 0) + 1
+
+
+def recent_events_limit():
+    return current_app.config['PROFILE_RECENT_EVENTS']
+
+
+def summarize_rows(rows, limit):
+    """
+    Build profile values from one user's transactions.
+    rows: iterable of (amount, location code, timestamp, device_key), oldest first
+    """
+    count = 0
+    amount_sum = 0.0
+    location_counts = {}
+    device_counts = {}
+    recent_events = []
+    for amount, location, timestamp, device_key in rows:
+        count += 1
+        amount_sum += float(amount)
+        location_counts[location] = location_counts.get(location, 0) + 1
+        count_device(device_counts, device_key)
+        recent_events.append([to_epoch(timestamp), location])
+        if len(recent_events) > 2 * limit:
+            del recent_events[:-limit]
+    recent_events.sort(key=lambda event: event[0])
+    # Counted by code; profiles and rules use the names
+    return {
+        'transaction_count': count,
+        'amount_sum': amount_sum,
+        'location_counts': {location_name(code): n for code, n in location_counts.items()},
+        'recent_events': [[epoch, location_name(code)] for epoch, code in recent_events[-limit:]],
+        'device_counts': device_counts
+    }
+
+
+def summarize_history(transaction_history):
+    """History summary (as UserProfile.to_summary) from a list of history records"""
+    summary = {'count': 0, 'amount_sum': 0.0, 'location_counts': {}, 'recent_events': [], 'device_counts': {}}
+    for t in transaction_history:
+        summary['count'] += 1
+        summary['amount_sum'] += t['amount']
+        summary['location_counts'][t['location']] = summary['location_counts'].get(t['location'], 0) + 1
+        count_device(summary['device_counts'], t.get('device_key'))
+        summary['recent_events'].append((
+            to_epoch(datetime.strptime(t['timestamp'], '%Y-%m-%d %H:%M:%S')), t['location']
+        ))
+    return summary
+
+
+def user_rows_query(userid=None):
+    query = db.session.query(
+        Transaction.userid, Transaction.amount, Transaction.location_code, Transaction.timestamp,
+        Transaction.device_key
+    )
+    if userid is not None:
+        query = query.filter(Transaction.userid == userid)
+    return query.order_by(Transaction.userid, Transaction.timestamp, Transaction.id)
+
+
+def build_profile_values(userid):
+    """Compute a user's profile from the raw transaction table"""
+    rows = user_rows_query(userid).yield_per(1000)
+    return summarize_rows(((r.amount, r.location_code, r.timestamp, r.device_key) for r in rows), recent_events_limit())
+
+
+def update_user_profiles(transactions):
+    """
+    Fold newly inserted transactions into their users' profiles.
+    transactions: dicts with 'userid', 'amount', 'location', 'timestamp'
+    and optionally 'device_key'.
+    Runs inside the caller's DB transaction so profiles commit together with
+    the transactions; call it after the transactions were added to the session.
+    """
+    if not transactions:
+        return
+
+    db.session.flush()
+    table = UserProfile.__table__
+    now = datetime.now(timezone.utc)
+    limit = recent_events_limit()
+
+    by_user = {}
+    for t in transactions:
+        by_user.setdefault(t['userid'], []).append(t)
+
+    for userid, rows in by_user.items():
+        # The counter update comes first so it takes the write lock before
+        # the JSON columns are read back and merged
+        result = db.session.execute(
+            table.update().where(table.c.userid == userid).values(
+                transaction_count=table.c.transaction_count + len(rows),
+                amount_sum=table.c.amount_sum + sum(float(r['amount']) for r in rows),
+                updated_at=now
+            )
+        )
+
+        if result.rowcount == 0:
+            # No profile yet: build it from the table, which already holds the new rows
+            values = build_profile_values(userid)
+            db.session.execute(table.insert().values(userid=userid, updated_at=now, **values))
+            continue
+
+        location_counts, recent_events, device_counts = db.session.execute(
+            db.select(table.c.location_counts, table.c.recent_events, table.c.device_counts)
+            .where(table.c.userid == userid)
+        ).one()
+        location_counts = dict(location_counts or {})
+        recent_events = list(recent_events or [])
+        device_counts = dict(device_counts or {})
+        for r in rows:
+            location_counts[r['location']] = location_counts.get(r['location'], 0) + 1
+            count_device(device_counts, r.get('device_key'))
+            recent_events.append([to_epoch(r['timestamp']), r['location']])
+        recent_events.sort(key=lambda event: event[0])
+
+        db.session.execute(
+            table.update().where(table.c.userid == userid).values(
+                location_counts=location_counts,
+                recent_events=recent_events[-limit:],
+                device_counts=device_counts
+            )
+        )
+
+
+def iter_user_profiles(chunk_size=10000):
+    """Stream (userid, profile values) for every user, computed from the raw table"""
+    rows = user_rows_query().yield_per(chunk_size)
+    limit = recent_events_limit()
+    for userid, user_rows in itertools.groupby(rows, key=lambda r: r.userid):
+        yield userid, summarize_rows(((r.amount, r.location_code, r.timestamp, r.device_key) for r in user_rows), limit)
+
+
+def rebuild_profiles(chunk_size=1000):
+    """Recompute every profile from the transaction table; returns the number of profiles"""
+    table = UserProfile.__table__
+    now = datetime.now(timezone.utc)
+    db.session.execute(table.delete())
+
+    count = 0
+    batch = []
+    for userid, values in iter_user_profiles():
+        batch.append(dict(values, userid=userid, updated_at=now))
+        if len(batch) >= chunk_size:
+            db.session.execute(table.insert(), batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(table.insert(), batch)
+        count += len(batch)
+    db.session.commit()
+    return count
+
+
+def check_profiles(tolerance=1e-6, chunk_size=1000):
+    """Compare stored profiles with the raw table; returns a list of (userid, problem)"""
+    problems = []
+    checked = 0
+
+    def compare(chunk):
+        stored = {
+            profile.userid: profile
+            for profile in UserProfile.query.filter(UserProfile.userid.in_([u for u, _ in chunk]))
+        }
+        for userid, expected in chunk:
+            profile = stored.get(userid)
+            if profile is None:
+                problems.append((userid, 'missing profile'))
+                continue
+            if profile.transaction_count != expected['transaction_count']:
+                problems.append((userid, f"transaction_count {profile.transaction_count} != {expected['transaction_count']}"))
+            if abs(profile.amount_sum - expected['amount_sum']) > tolerance * max(1.0, abs(expected['amount_sum'])):
+                problems.append((userid, f"amount_sum {profile.amount_sum} != {expected['amount_sum']}"))
+            if (profile.location_counts or {}) != expected['location_counts']:
+                problems.append((userid, 'location_counts differ'))
+            if [list(e) for e in (profile.recent_events or [])] != expected['recent_events']:
+                problems.append((userid, 'recent_events differ'))
+            if (profile.device_counts or {}) != expected['device_counts']:
+                problems.append((userid, 'device_counts differ'))
+
+    chunk = []
+    for item in iter_user_profiles():
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            compare(chunk)
+            checked += len(chunk)
+            chunk = []
+    if chunk:
+        compare(chunk)
+        checked += len(chunk)
+
+    # Profiles for users that have no transactions at all
+    if UserProfile.query.count() != checked:
+        with_transactions = db.session.query(Transaction.userid).distinct()
+        for (userid,) in db.session.query(UserProfile.userid).filter(~UserProfile.userid.in_(with_transactions)):
+            problems.append((userid, 'profile without transactions'))
+    return problems
+
+
+@profiles_cli.command('rebuild')
+def rebuild_command():
+    """Rebuild all profiles from the transaction table."""
+    count = rebuild_profiles()
+    click.echo(f"Rebuilt {count} user profiles")
+
+
+@profiles_cli.command('check')
+def check_command():
+    """Check stored profiles against the transaction table."""
+    problems = check_profiles()
+    for userid, problem in problems:
+        click.echo(f"{userid}: {problem}")
+    if problems:
+        raise click.ClickException(f"{len(problems)} profile inconsistencies found")
+    click.echo("All user profiles are consistent")
@@ -0,0 +1,378 @@
+# Per-user sliding-window velocity counters shared by all worker processes
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows: no byte-range locks, velocity is read from the database
+    fcntl = None
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from models import db
+from models.location import location_name
+from models.transaction import Transaction
+from utils.user_profiles import to_epoch
+
+# Each user gets a fixed-size slot in a memory-mapped file: two rings of
+# time buckets, indexed by (epoch // width) % size and tagged with the bucket
+# number so stale entries are recognized and overwritten.
+#   short ring: transaction count + 64-bit location bitmap per 10 s bucket
+#   long ring:  declined-transaction count per 60 s bucket
+# Windows are rounded out to whole buckets, so a window may count up to one
+# bucket width of older events. Distinct locations are estimated from the
+# bitmap (CRC32 of the name mod 64); collisions can only under-count them.
+SHORT_WIDTH = 10
+SHORT_BUCKETS = 32   # covers 320 s
+LONG_WIDTH = 60
+LONG_BUCKETS = 32    # covers 32 min
+
+MAGIC = b'FGVS'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sIIIq')  # magic, version, capacity, ready, last write
+HEADER_SIZE = 64
+SLOT = struct.Struct(
+    f'<Qq{SHORT_BUCKETS}I{SHORT_BUCKETS}I{SHORT_BUCKETS}Q{LONG_BUCKETS}I{LONG_BUCKETS}I')
+# Field offsets within a slot
+SHORT_EPOCH = 16
+SHORT_COUNT = SHORT_EPOCH + 4 * SHORT_BUCKETS
+SHORT_LOCATIONS = SHORT_COUNT + 4 * SHORT_BUCKETS
+LONG_EPOCH = SHORT_LOCATIONS + 8 * SHORT_BUCKETS
+LONG_DECLINES = LONG_EPOCH + 4 * LONG_BUCKETS
+
+# A user may live in any of the PROBE_LENGTH slots from its home slot
+PROBE_LENGTH = 8
+
+SHORT_COVERAGE = SHORT_WIDTH * (SHORT_BUCKETS - 1)
+LONG_COVERAGE = LONG_WIDTH * (LONG_BUCKETS - 1)
+
+U32 = struct.Struct('<I')
+U64 = struct.Struct('<Q')
+I64 = struct.Struct('<q')
+
+
+def user_key(userid):
+    """Stable non-zero 64-bit key for a user id (the same in every process)"""
+    key = int.from_bytes(hashlib.blake2b(str(userid).encode('utf-8'), digest_size=8).digest(), 'little')
+    return key or 1
+
+
+def location_bit(location):
+    return 1 << (zlib.crc32(str(location).encode('utf-8')) % 64)
+
+
+class VelocitySnapshot:
+    """One user's buckets, read under the slot lock"""
+
+    def __init__(self, fields):
+        self.short_epoch = fields[2:2 + SHORT_BUCKETS]
+        offset = 2 + SHORT_BUCKETS
+        self.short_count = fields[offset:offset + SHORT_BUCKETS]
+        offset += SHORT_BUCKETS
+        self.short_locations = fields[offset:offset + SHORT_BUCKETS]
+        offset += SHORT_BUCKETS
+        self.long_epoch = fields[offset:offset + LONG_BUCKETS]
+        offset += LONG_BUCKETS
+        self.long_declines = fields[offset:offset + LONG_BUCKETS]
+
+    @staticmethod
+    def live_buckets(epochs, now, window, width):
+        first, last = int(now - window) // width, int(now) // width
+        return [i for i, epoch in enumerate(epochs) if first <= epoch <= last]
+
+    def count(self, now, window_seconds):
+        return sum(self.short_count[i]
+                   for i in self.live_buckets(self.short_epoch, now, window_seconds, SHORT_WIDTH))
+
+    def locations(self, now, window_seconds):
+        bitmap = 0
+        for i in self.live_buckets(self.short_epoch, now, window_seconds, SHORT_WIDTH):
+            bitmap |= self.short_locations[i]
+        return bitmap
+
+    def declined(self, now, window_seconds):
+        return sum(self.long_declines[i]
+                   for i in self.live_buckets(self.long_epoch, now, window_seconds, LONG_WIDTH))
+
+
+EMPTY_SNAPSHOT = VelocitySnapshot((0, 0) + (0,) * (3 * SHORT_BUCKETS + 2 * LONG_BUCKETS))
+
+
+class VelocityStore:
+    """
+    Open-addressed table of per-user slots in a shared file. Updates and reads
+    touch one user's probe window under an fcntl byte-range lock (plus a
+    thread lock, since fcntl locks are per process), so they are O(1) and
+    safe across gunicorn workers.
+    """
+
+    def __init__(self, filepath, capacity=65536):
+        self.filepath = filepath
+        self.capacity = capacity
+        self.size = HEADER_SIZE + (capacity + PROBE_LENGTH) * SLOT.size
+        self._thread_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(filepath)), exist_ok=True)
+        self._fd = os.open(filepath, os.O_RDWR | os.O_CREAT, 0o644)
+        with self.locked(0, 0):
+            if not self.header_valid():
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, self.size)
+                os.pwrite(self._fd, HEADER.pack(MAGIC, FORMAT_VERSION, capacity, 0, 0), 0)
+        self._mmap = mmap.mmap(self._fd, self.size)
+
+    def header_valid(self):
+        if os.fstat(self._fd).st_size != self.size:
+            return False
+        magic, version, capacity, _, _ = HEADER.unpack(os.pread(self._fd, HEADER.size, 0))
+        return (magic, version, capacity) == (MAGIC, FORMAT_VERSION, self.capacity)
+
+    def locked(self, start, length, exclusive=True):
+        return _RangeLock(self, start, length, exclusive)
+
+    def close(self):
+        self._mmap.close()
+        os.close(self._fd)
+
+    # Header
+
+    @property
+    def ready(self):
+        return HEADER.unpack_from(self._mmap, 0)[3] == 1
+
+    @property
+    def last_write(self):
+        return HEADER.unpack_from(self._mmap, 0)[4]
+
+    def needs_rebuild(self, now=None):
+        """True before the first rebuild, or when nothing was written for longer than any window"""
+        now = time.time() if now is None else now
+        return not self.ready or now - self.last_write > LONG_COVERAGE
+
+    def touch(self, now):
+        I64.pack_into(self._mmap, 16, int(now))
+
+    # Slots
+
+    def home(self, key):
+        return key % self.capacity
+
+    def slot_offset(self, index):
+        return HEADER_SIZE + index * SLOT.size
+
+    def probe_range(self, key):
+        """Byte range covering every slot the user can occupy"""
+        return self.slot_offset(self.home(key)), PROBE_LENGTH * SLOT.size
+
+    def find(self, key):
+        home = self.home(key)
+        for index in range(home, home + PROBE_LENGTH):
+            if U64.unpack_from(self._mmap, self.slot_offset(index))[0] == key:
+                return index
+        return None
+
+    def claim(self, key):
+        """The user's slot, taking an empty or the least recently written one if needed"""
+        index = self.find(key)
+        if index is not None:
+            return index
+        home = self.home(key)
+        oldest = min(range(home, home + PROBE_LENGTH),
+                     key=lambda i: (U64.unpack_from(self._mmap, self.slot_offset(i))[0] != 0,
+                                    I64.unpack_from(self._mmap, self.slot_offset(i) + 8)[0]))
+        offset = self.slot_offset(oldest)
+        self._mmap[offset:offset + SLOT.size] = bytes(SLOT.size)
+        U64.pack_into(self._mmap, offset, key)
+        return oldest
+
+    def bump(self, epoch_at, bucket):
+        """Retag a ring position for a new bucket; True if it was reset"""
+        if U32.unpack_from(self._mmap, epoch_at)[0] == bucket:
+            return False
+        U32.pack_into(self._mmap, epoch_at, bucket)
+        return True
+
+    def _record(self, key, timestamp, location, declined, count, now):
+        """Apply one event to a user's slot; the caller holds the lock"""
+        offset = self.slot_offset(self.claim(key))
+        if count:
+            bucket = int(timestamp) // SHORT_WIDTH
+            position = bucket % SHORT_BUCKETS
+            count_at = offset + SHORT_COUNT + 4 * position
+            locations_at = offset + SHORT_LOCATIONS + 8 * position
+            if self.bump(offset + SHORT_EPOCH + 4 * position, bucket):
+                U32.pack_into(self._mmap, count_at, 0)
+                U64.pack_into(self._mmap, locations_at, 0)
+            U32.pack_into(self._mmap, count_at, U32.unpack_from(self._mmap, count_at)[0] + 1)
+            U64.pack_into(self._mmap, locations_at,
+                          U64.unpack_from(self._mmap, locations_at)[0] | location_bit(location))
+        if declined:
+            bucket = int(timestamp) // LONG_WIDTH
+            position = bucket % LONG_BUCKETS
+            declines_at = offset + LONG_DECLINES + 4 * position
+            if self.bump(offset + LONG_EPOCH + 4 * position, bucket):
+                U32.pack_into(self._mmap, declines_at, 0)
+            U32.pack_into(self._mmap, declines_at, U32.unpack_from(self._mmap, declines_at)[0] + 1)
+        I64.pack_into(self._mmap, offset + 8, int(now))
+
+    def record(self, userid, timestamp, location, declined=False, count=True, now=None):
+        """
+        Count a transaction (epoch seconds) for a user, and/or a decline of one.
+        Events older than the windows the store covers are ignored.
+        """
+        now = time.time() if now is None else now
+        count = count and now - timestamp <= SHORT_COVERAGE
+        declined = declined and now - timestamp <= LONG_COVERAGE
+        if not count and not declined:
+            return
+        key = user_key(userid)
+        with self.locked(*self.probe_range(key)):
+            self._record(key, timestamp, location, declined, count, now)
+        self.touch(now)
+
+    def record_decline(self, userid, timestamp, now=None):
+        """Count a transaction made at timestamp as declined"""
+        self.record(userid, timestamp, None, declined=True, count=False, now=now)
+
+    def read(self, userid):
+        """A snapshot of the user's buckets"""
+        key = user_key(userid)
+        with self.locked(*self.probe_range(key), exclusive=False):
+            index = self.find(key)
+            if index is None:
+                return EMPTY_SNAPSHOT
+            return VelocitySnapshot(SLOT.unpack_from(self._mmap, self.slot_offset(index)))
+
+    def rebuild(self, rows, now=None):
+        """
+        Replace every counter with the given events.
+        rows: iterable of (userid, epoch seconds, location, is_declined)
+        """
+        now = time.time() if now is None else now
+        count = 0
+        with self.locked(0, 0):
+            chunk = bytes(1 << 20)
+            for start in range(HEADER_SIZE, self.size, len(chunk)):
+                end = min(start + len(chunk), self.size)
+                self._mmap[start:end] = chunk[:end - start]
+            for userid, timestamp, location, declined in rows:
+                counted = now - timestamp <= SHORT_COVERAGE
+                declined = declined and now - timestamp <= LONG_COVERAGE
+                if counted or declined:
+                    self._record(user_key(userid), timestamp, location, declined, counted, now)
+                    count += 1
+            HEADER.pack_into(self._mmap, 0, MAGIC, FORMAT_VERSION, self.capacity, 1, int(now))
+        return count
+
+
+class _RangeLock:
+    """fcntl byte-range lock (length 0: to the end of the file) plus the store's thread lock"""
+
+    def __init__(self, store, start, length, exclusive):
+        self.store = store
+        self.start = start
+        self.length = length
+        self.exclusive = exclusive
+
+    def __enter__(self):
+        self.store._thread_lock.acquire()
+        try:
+            fcntl.lockf(self.store._fd, fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH,
+                        self.length, self.start)
+        except BaseException:
+            self.store._thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.lockf(self.store._fd, fcntl.LOCK_UN, self.length, self.start)
+        self.store._thread_lock.release()
+        return False
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def velocity_rows(now):
+    """(userid, epoch, location, is_declined) of the transactions recent enough to count"""
+    since = datetime.fromtimestamp(now - LONG_COVERAGE, timezone.utc)
+    query = db.session.query(
+        Transaction.userid, Transaction.timestamp, Transaction.location_code, Transaction.is_declined
+    ).filter(Transaction.timestamp >= since)
+    for userid, timestamp, code, is_declined in query.yield_per(1000):
+        yield userid, to_epoch(timestamp), location_name(code), bool(is_declined)
+
+
+def rebuild_velocity(store, now=None):
+    """Reload the store's counters from the Transaction table"""
+    now = time.time() if now is None else now
+    return store.rebuild(velocity_rows(now), now)
+
+
+def get_velocity_store():
+    """
+    The process-wide store, or None when VELOCITY_STORE_PATH is empty or the
+    platform has no fcntl locks (Windows).
+    The first process to open a store that was never filled, or that no
+    worker wrote to for longer than the longest window, rebuilds it.
+    """
+    global _store
+    filepath = current_app.config['VELOCITY_STORE_PATH']
+    if not filepath or fcntl is None:
+        return None
+    if _store is None or _store.filepath != filepath:
+        with _store_lock:
+            if _store is None or _store.filepath != filepath:
+                store = VelocityStore(filepath, current_app.config['VELOCITY_CAPACITY'])
+                if store.needs_rebuild():
+                    rebuild_velocity(store)
+                _store = store
+    return _store
+
+
+def record_transactions(transactions):
+    """
+    Count newly committed transactions.
+    transactions: dicts with userid, location and timestamp
+    """
+    try:
+        store = get_velocity_store()
+        if store is None:
+            return
+        for t in transactions:
+            store.record(t['userid'], to_epoch(t['timestamp']), t['location'])
+    except OSError as e:
+        # The transactions are committed; a rebuild brings the counters back in line
+        print(f"Error updating velocity counters: {str(e)}")
+
+
+def record_decline(userid, timestamp):
+    """Count a transaction as declined once the decline is committed"""
+    try:
+        store = get_velocity_store()
+        if store is not None:
+            store.record_decline(userid, to_epoch(timestamp))
+    except OSError as e:
+        print(f"Error updating velocity counters: {str(e)}")
+
+
+velocity_cli = AppGroup('velocity', help='Maintain the shared velocity counters.')
+
+
+@velocity_cli.command('rebuild')
+def rebuild_command():
+    """Reload the velocity counters from the transactions table"""
+    store = get_velocity_store()
+    if store is None:
+        raise click.ClickException("VELOCITY_STORE_PATH is not set, or this platform has no fcntl locks")
+    count = rebuild_velocity(store)
+    click.echo(f"Loaded {count} recent transactions into {store.filepath}")